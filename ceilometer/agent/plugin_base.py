@@ -17,6 +17,7 @@
 
 import abc
 import collections
+import itertools
 
 from oslo_log import log
 import oslo_messaging
@@ -111,23 +112,53 @@ class NotificationBase(PluginBase):
         self._process_notifications('sample', notifications)
 
     def _process_notifications(self, priority, notifications):
+        # NOTE: the whole batch is converted first and published through a
+        # single context, so that pipelines are flushed once per batch
+        # rather than once per notification.
+        batches = []
         for notification in notifications:
             try:
                 notification = messaging.convert_to_old_notification_format(
                     priority, notification)
-                self.to_samples_and_publish(notification)
+                batches.append(self.to_samples(notification))
             except Exception:
                 LOG.error(_LE('Fail to process notification'), exc_info=True)
+        if len(batches) > 1:
+            try:
+                with self.manager.publisher() as p:
+                    p(list(itertools.chain.from_iterable(batches)))
+                return
+            except Exception:
+                # publish the samples of each notification on their own,
+                # so that a bad one only drops its own samples
+                LOG.error(_LE('Fail to publish the samples of %d '
+                              'notifications, publishing them one '
+                              'notification at a time'), len(batches),
+                          exc_info=True)
+        for samples in batches:
+            try:
+                with self.manager.publisher() as p:
+                    p(samples)
+            except Exception:
+                LOG.error(_LE('Fail to publish samples, dropping %d '
+                              'samples'), len(samples), exc_info=True)
+
+    def to_samples(self, notification):
+        """Return the list of samples produced by *process_notification*.
+
+        :param notification: The notification to process.
+        """
+        return list(self.process_notification(notification))
 
     def to_samples_and_publish(self, notification):
-        """Return samples produced by *process_notification*.
+        """Publish samples produced by *process_notification*.
 
         Samples produced for the given notification.
         :param context: Execution context from the service or RPC call
         :param notification: The notification to process.
         """
         with self.manager.publisher() as p:
-            p(list(self.process_notification(notification)))
+            p(self.to_samples(notification))
 
 
 class NonMetricNotificationBase(object):
@@ -13,9 +13,13 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import errno
 from itertools import chain
+import logging
 import select
 import socket
+import struct
+import time
 
 import cotyledon
 import msgpack
@@ -27,6 +31,7 @@ from oslo_utils import units
 
 from ceilometer import dispatcher
 from ceilometer.i18n import _, _LE, _LW
+from ceilometer import instrumentation
 from ceilometer import messaging
 from ceilometer.publisher import utils as publisher_utils
 from ceilometer import utils
@@ -42,10 +47,13 @@ OPTS = [
     cfg.IntOpt('batch_size',
                default=1,
                help='Number of notification messages to wait before '
-               'dispatching them'),
+               'dispatching them, also the maximum number of samples '
+               'received over UDP dispatched at once'),
     cfg.IntOpt('batch_timeout',
                help='Number of seconds to wait before dispatching samples'
-               'when batch_size is not reached (None means indefinitely)'),
+               'when batch_size is not reached (None means indefinitely, '
+               'or for the samples received over UDP until no datagram '
+               'is pending)'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="collector")
@@ -57,6 +65,12 @@ cfg.CONF.import_opt('event_topic', 'ceilometer.publisher.messaging',
 
 LOG = log.getLogger(__name__)
 
+# Not exposed by the socket module
+SO_RXQ_OVFL = 40
+OVERFLOW_SIZE = struct.calcsize('I')
+
+UDP_STATS = 'collector.udp'
+
 
 class CollectorService(cotyledon.Service):
     """Listener for the collector service."""
@@ -69,8 +83,11 @@ class CollectorService(cotyledon.Service):
         self.sample_listener = None
         self.event_listener = None
         self.udp_thread = None
+        self.stats_periodic = None
 
     def run(self):
+        self.stats_periodic = instrumentation.start_dumps(self.conf,
+                                                          self.worker_id)
         if self.conf.collector.udp_address:
             self.udp_thread = utils.spawn_thread(self.start_udp)
 
@@ -102,7 +119,7 @@ class CollectorService(cotyledon.Service):
                         batch_timeout=self.conf.collector.batch_timeout))
                 self.event_listener.start()
 
-    def start_udp(self):
+    def _create_udp_socket(self):
         address_family = socket.AF_INET
         if netutils.is_valid_ipv6(self.conf.collector.udp_address):
             address_family = socket.AF_INET6
@@ -117,32 +134,121 @@ class CollectorService(cotyledon.Service):
                             "incoming data."))
         udp.bind((cfg.CONF.collector.udp_address,
                   cfg.CONF.collector.udp_port))
+        udp.setblocking(False)
 
-        self.udp_run = True
-        while self.udp_run:
-            # NOTE(sileht): return every 10 seconds to allow
-            # clear shutdown
-            if not select.select([udp], [], [], 10.0)[0]:
-                continue
+        self.udp_overflow = None
+        if hasattr(udp, 'recvmsg'):
+            try:
+                # NOTE: linux only, the number of datagrams dropped since
+                # the socket was created, because its receive buffer was
+                # full, is then passed along each datagram.
+                udp.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self.udp_overflow = 0
+            except Exception:
+                pass
+        return udp
+
+    def _udp_recv(self, udp):
+        """Read a datagram, counting the ones dropped before it if known."""
+        if self.udp_overflow is None:
             # NOTE(jd) Arbitrary limit of 64K because that ought to be
             # enough for anybody.
-            data, source = udp.recvfrom(64 * units.Ki)
+            return udp.recvfrom(64 * units.Ki)
+        data, ancdata, flags, source = udp.recvmsg(
+            64 * units.Ki, socket.CMSG_SPACE(OVERFLOW_SIZE))
+        for level, type_, value in ancdata:
+            if level == socket.SOL_SOCKET and type_ == SO_RXQ_OVFL:
+                overflow = struct.unpack('I', value[:OVERFLOW_SIZE])[0]
+                instrumentation.STATS.incr(
+                    UDP_STATS, 'overflow_drops',
+                    (overflow - self.udp_overflow) % 2 ** 32)
+                self.udp_overflow = overflow
+        return data, source
+
+    def _udp_receive(self, udp, samples, limit):
+        """Read the pending datagrams, at most one per missing sample.
+
+        A datagram can carry several samples, so more than limit samples
+        can end up buffered.
+
+        :return: True if no datagram is pending anymore.
+        """
+        stats = instrumentation.STATS
+        for i in range(limit - len(samples)):
+            try:
+                data, source = self._udp_recv(udp)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return True
+                raise
+            stats.incr(UDP_STATS, 'datagrams')
             try:
-                sample = msgpack.loads(data, encoding='utf-8')
+                payload = msgpack.loads(data, encoding='utf-8')
             except Exception:
+                stats.incr(UDP_STATS, 'decode_errors')
                 LOG.warning(_("UDP: Cannot decode data sent by %s"), source)
-            else:
+                continue
+            try:
+                messages = publisher_utils.unpack_udp_payload(payload)
+            except ValueError as e:
+                stats.incr(UDP_STATS, 'decode_errors')
+                LOG.warning(_LW("UDP: Cannot unpack data sent by %(source)s: "
+                                "%(err)s"), {'source': source, 'err': e})
+                continue
+            for sample in messages:
                 if publisher_utils.verify_signature(
                         sample, self.conf.publisher.telemetry_secret):
-                    try:
-                        LOG.debug("UDP: Storing %s", sample)
-                        self.meter_manager.map_method(
-                            'record_metering_data', sample)
-                    except Exception:
-                        LOG.exception(_("UDP: Unable to store meter"))
+                    samples.append(sample)
                 else:
+                    stats.incr(UDP_STATS, 'invalid_signatures')
                     LOG.warning(_LW('sample signature invalid, '
                                     'discarding: %s'), sample)
+        return False
+
+    def _udp_dispatch(self, samples):
+        stats = instrumentation.STATS
+        stats.incr(UDP_STATS, 'samples', len(samples))
+        try:
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug("UDP: Storing %s", samples)
+            with stats.timed(UDP_STATS, 'dispatch'):
+                self.meter_manager.map_method('record_metering_data', samples)
+        except Exception:
+            stats.incr(UDP_STATS, 'dispatch_errors')
+            LOG.exception(_("UDP: Unable to store meter"))
+
+    def start_udp(self):
+        udp = self._create_udp_socket()
+        batch_size = max(self.conf.collector.batch_size, 1)
+        batch_timeout = self.conf.collector.batch_timeout
+
+        samples = []
+        deadline = None
+        self.udp_run = True
+        while self.udp_run:
+            # NOTE(sileht): return every 10 seconds to allow
+            # clear shutdown
+            timeout = 10.0
+            if deadline is not None:
+                timeout = max(0, min(timeout, deadline - time.time()))
+            drained = True
+            if select.select([udp], [], [], timeout)[0]:
+                drained = self._udp_receive(udp, samples, batch_size)
+            if not samples:
+                continue
+            # NOTE: without batch_timeout, the samples are stored as soon
+            # as no datagram is pending, so batches only grow under load.
+            if batch_timeout and deadline is None:
+                deadline = time.time() + batch_timeout
+            if (len(samples) >= batch_size or
+                    (deadline is None and drained) or
+                    (deadline is not None and time.time() >= deadline)):
+                self._udp_dispatch(samples)
+                samples = []
+                deadline = None
+        if samples:
+            self._udp_dispatch(samples)
+        udp.close()
 
     def terminate(self):
         if self.sample_listener:
@@ -152,6 +258,9 @@ class CollectorService(cotyledon.Service):
         if self.udp_thread:
             self.udp_run = False
             self.udp_thread.join()
+        if self.stats_periodic:
+            self.stats_periodic.stop()
+            self.stats_periodic.wait()
         super(CollectorService, self).terminate()
 
 
@@ -13,6 +13,7 @@
 
 import os
 
+from jsonpath_rw import jsonpath
 from jsonpath_rw_ext import parser
 from oslo_log import log
 import six
@@ -42,6 +43,66 @@ class ResourceDefinitionException(DefinitionException):
     pass
 
 
+class _Match(object):
+    """Result of a compiled path, a light jsonpath-rw DatumInContext."""
+
+    __slots__ = ('value', 'full_path')
+
+    def __init__(self, value, full_path):
+        self.value = value
+        self.full_path = full_path
+
+
+def _compile_fields(path):
+    """Return the field names of a plain dotted path, None otherwise."""
+    if isinstance(path, jsonpath.Child):
+        left = _compile_fields(path.left)
+        right = _compile_fields(path.right)
+        if left is not None and right is not None:
+            return left + right
+    elif isinstance(path, jsonpath.Root):
+        return []
+    elif (isinstance(path, jsonpath.Fields) and len(path.fields) == 1 and
+          path.fields[0] != '*'):
+        return [path.fields[0]]
+
+
+def compile_path(path):
+    """Compile a parsed JSONPath into a getter, when it is simple enough.
+
+    Plain dotted paths, optionally rooted, and unions of them are turned
+    into direct lookups returning the same values as the jsonpath-rw find.
+    The getter keeps the parsed path as its path attribute and the field
+    names of each alternative as its fields attribute. Other expressions
+    return None.
+    """
+    if isinstance(path, jsonpath.Union):
+        left = compile_path(path.left)
+        right = compile_path(path.right)
+        if left is None or right is None:
+            return
+
+        def getter(obj):
+            return left(obj) + right(obj)
+        getter.fields = left.fields + right.fields
+    else:
+        fields = _compile_fields(path)
+        if not fields:
+            return
+        full_path = '.'.join(fields)
+
+        def getter(obj):
+            for field in fields:
+                try:
+                    obj = obj[field]
+                except (TypeError, KeyError, AttributeError):
+                    return []
+            return [_Match(obj, full_path)]
+        getter.fields = [tuple(fields)]
+    getter.path = path
+    return getter
+
+
 class Definition(object):
     JSONPATH_RW_PARSER = parser.ExtentedJsonPathParser()
     GETTERS_CACHE = {}
@@ -125,8 +186,9 @@ class Definition(object):
                 raise DefinitionException("Plugin %s don't allows to "
                                           "return multiple values" %
                                           self.cfg["plugin"]["name"], self.cfg)
-            values_map = [('.'.join(self._get_path(match)), match.value) for
-                          match in values]
+            values_map = [(match.full_path if isinstance(match, _Match)
+                           else '.'.join(self._get_path(match)), match.value)
+                          for match in values]
             values = [v for v in self.plugin.trait_values(values_map)
                       if v is not None]
         else:
@@ -140,7 +202,8 @@ class Definition(object):
         if fields in self.GETTERS_CACHE:
             return self.GETTERS_CACHE[fields]
         else:
-            getter = self.JSONPATH_RW_PARSER.parse(fields).find
+            path = self.JSONPATH_RW_PARSER.parse(fields)
+            getter = compile_path(path) or path.find
             self.GETTERS_CACHE[fields] = getter
             return getter
 
@@ -13,6 +13,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import logging
+
 from debtcollector import removals
 from oslo_log import log
 from oslo_utils import timeutils
@@ -58,14 +60,16 @@ class MeterDatabaseDispatcher(dispatcher.MeterDispatcherBase,
         if not isinstance(data, list):
             data = [data]
 
+        debug = LOG.isEnabledFor(logging.DEBUG)
         for meter in data:
-            LOG.debug(
-                'metering data %(counter_name)s '
-                'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s',
-                {'counter_name': meter['counter_name'],
-                 'resource_id': meter['resource_id'],
-                 'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
-                 'counter_volume': meter['counter_volume']})
+            if debug:
+                LOG.debug(
+                    'metering data %(counter_name)s '
+                    'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s',
+                    {'counter_name': meter['counter_name'],
+                     'resource_id': meter['resource_id'],
+                     'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
+                     'counter_volume': meter['counter_volume']})
             # Convert the timestamp to a datetime instance.
             # Storage engines are responsible for converting
             # that value to something they can store.
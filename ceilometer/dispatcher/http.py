@@ -18,9 +18,11 @@ from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import strutils
 import requests
+from requests import adapters
 
 from ceilometer import dispatcher
 from ceilometer.i18n import _LE
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
@@ -45,6 +47,14 @@ http_dispatcher_opts = [
     cfg.BoolOpt('batch_mode',
                 default=False,
                 help='Indicates whether samples are published in a batch.'),
+    cfg.IntOpt('pool_size',
+               default=adapters.DEFAULT_POOLSIZE,
+               min=1,
+               help='Maximum number of connections kept alive to each '
+                    'target.'),
+    cfg.BoolOpt('compress',
+                default=False,
+                help='Indicates whether the requests are gzip compressed.'),
 ]
 
 cfg.CONF.register_opts(http_dispatcher_opts, group="dispatcher_http")
@@ -79,6 +89,13 @@ class HttpDispatcher(dispatcher.MeterDispatcherBase,
 
         [dispatcher_http]
         batch_mode = True
+
+    The connections to the targets are kept alive and reused, up to
+    pool_size of them, and the requests can be gzip compressed::
+
+        [dispatcher_http]
+        pool_size = 10
+        compress = True
     """
 
     def __init__(self, conf):
@@ -102,6 +119,24 @@ class HttpDispatcher(dispatcher.MeterDispatcherBase,
         except ValueError:
             self.verify_ssl = self.conf.dispatcher_http.verify_ssl or True
 
+        self.compress = self.conf.dispatcher_http.compress
+        if self.compress:
+            self.headers['Content-Encoding'] = 'gzip'
+        self.session = requests.Session()
+        adapter = adapters.HTTPAdapter(
+            pool_maxsize=self.conf.dispatcher_http.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _post(self, target, data):
+        if self.compress:
+            data = utils.gzip_compress(data.encode('utf-8'))
+        return self.session.post(target,
+                                 data=data,
+                                 headers=self.headers,
+                                 verify=self.verify_ssl,
+                                 timeout=self.timeout)
+
     def record_metering_data(self, data):
         if self.target == '':
             # if the target was not set, do not do anything
@@ -125,11 +160,7 @@ class HttpDispatcher(dispatcher.MeterDispatcherBase,
         res = None
         try:
             LOG.trace('Meter Message: %s', meter_json)
-            res = requests.post(self.target,
-                                data=meter_json,
-                                headers=self.headers,
-                                verify=self.verify_ssl,
-                                timeout=self.timeout)
+            res = self._post(self.target, meter_json)
             LOG.debug('Meter message posting finished with status code '
                       '%d.', res.status_code)
             res.raise_for_status()
@@ -161,11 +192,7 @@ class HttpDispatcher(dispatcher.MeterDispatcherBase,
         try:
             event_json = json.dumps(event)
             LOG.trace('Event Message: %s', event_json)
-            res = requests.post(self.event_target,
-                                data=event_json,
-                                headers=self.headers,
-                                verify=self.verify_ssl,
-                                timeout=self.timeout)
+            res = self._post(self.event_target, event_json)
             LOG.debug('Event Message posting to %s: status code %d.',
                       self.event_target, res.status_code)
             res.raise_for_status()
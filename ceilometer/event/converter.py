@@ -13,15 +13,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import fnmatch
+import re
+
 from oslo_config import cfg
 from oslo_log import log
-from oslo_utils import fnmatch
 from oslo_utils import timeutils
 import six
 
 from ceilometer import declarative
 from ceilometer.event.storage import models
-from ceilometer.i18n import _
+from ceilometer.i18n import _, _LE
 
 OPTS = [
     cfg.StrOpt('definitions_cfg_file',
@@ -56,7 +58,10 @@ class TraitDefinition(declarative.Definition):
                 % dict(type=type_name, trait=name), self.cfg)
 
     def to_trait(self, notification_body):
-        value = self.parse(notification_body)
+        return self.make_trait(self.parse(notification_body))
+
+    def make_trait(self, value):
+        """Return the trait of a value extracted from a notification."""
         if value is None:
             return None
 
@@ -69,6 +74,56 @@ class TraitDefinition(declarative.Definition):
         return models.Trait(self.name, self.trait_type, value)
 
 
+class TraitsExtractor(object):
+    """Extracts the traits of an event definition.
+
+    The plain field paths of the traits, without plugin, are merged in a
+    tree which is walked once per notification, so that shared parents
+    like the payload are looked up once and traits defined by the same
+    fields are only extracted once. Other traits are parsed on their own.
+    """
+
+    def __init__(self, traits):
+        self.tree = {}
+        self.traits = []
+        for trait in traits:
+            fields = (getattr(trait.getter, 'fields', None)
+                      if trait.plugin is None else None)
+            if fields:
+                for path in fields:
+                    node = [None, self.tree]
+                    for name in path:
+                        node = node[1].setdefault(name, [None, {}])
+                    node[0] = path
+            self.traits.append((trait, fields))
+
+    @classmethod
+    def _walk(cls, obj, tree, values):
+        for name, (path, children) in six.iteritems(tree):
+            try:
+                value = obj[name]
+            except (TypeError, KeyError, AttributeError):
+                continue
+            if path is not None:
+                values[path] = value
+            if children:
+                cls._walk(value, children, values)
+
+    def extract(self, notification_body):
+        values = {}
+        self._walk(notification_body, self.tree, values)
+        for trait, fields in self.traits:
+            if fields is None:
+                yield trait.to_trait(notification_body)
+                continue
+            value = None
+            for path in fields:
+                value = values.get(path)
+                if value is not None:
+                    break
+            yield trait.make_trait(value)
+
+
 class EventDefinition(object):
 
     DEFAULT_TRAITS = dict(
@@ -109,6 +164,8 @@ class EventDefinition(object):
 
         if self._excluded_types and not self._included_types:
             self._included_types.append('*')
+        self._included = self._compile(self._included_types)
+        self._excluded = self._compile(self._excluded_types)
 
         for trait_name in self.DEFAULT_TRAITS:
             self.traits[trait_name] = TraitDefinition(
@@ -120,18 +177,19 @@ class EventDefinition(object):
                 trait_name,
                 traits[trait_name],
                 trait_plugin_mgr)
+        self.extractor = TraitsExtractor(self.traits.values())
+
+    @staticmethod
+    def _compile(patterns):
+        if patterns:
+            return re.compile('|'.join('(?:%s)' % fnmatch.translate(p)
+                                       for p in patterns))
 
     def included_type(self, event_type):
-        for t in self._included_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return bool(self._included and self._included.match(event_type))
 
     def excluded_type(self, event_type):
-        for t in self._excluded_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return bool(self._excluded and self._excluded.match(event_type))
 
     def match_type(self, event_type):
         return (self.included_type(event_type)
@@ -161,10 +219,9 @@ class EventDefinition(object):
         message_id = notification_body['message_id']
         when = self._extract_when(notification_body)
 
-        traits = (self.traits[t].to_trait(notification_body)
-                  for t in self.traits)
         # Only accept non-None value traits ...
-        traits = [trait for trait in traits if trait is not None]
+        traits = [trait for trait in self.extractor.extract(notification_body)
+                  if trait is not None]
         raw = (notification_body
                if notification_body.get('priority') in self.raw_levels else {})
         event = models.Event(message_id, event_type, when, traits, raw)
@@ -254,33 +311,58 @@ class NotificationEventsConverter(object):
 
     """
 
+    DISPATCH_CACHE_SIZE = 1024
+
     def __init__(self, events_config, trait_plugin_mgr, add_catchall=True):
-        self.definitions = [
+        definitions = [
             EventDefinition(event_def, trait_plugin_mgr)
             for event_def in reversed(events_config)]
-        if add_catchall and not any(d.is_catchall for d in self.definitions):
+        if add_catchall and not any(d.is_catchall for d in definitions):
             event_def = dict(event_type='*', traits={})
-            self.definitions.append(EventDefinition(event_def,
-                                                    trait_plugin_mgr))
+            definitions.append(EventDefinition(event_def,
+                                               trait_plugin_mgr))
+        self.definitions = definitions
 
-    def to_event(self, notification_body):
-        event_type = notification_body['event_type']
-        message_id = notification_body['message_id']
+    @property
+    def definitions(self):
+        return self._definitions
+
+    @definitions.setter
+    def definitions(self, definitions):
+        """Set the definitions and forget the remembered matches."""
+        self._definitions = list(definitions)
+        self._dispatch_cache = {}
+
+    def _get_definition(self, event_type):
+        try:
+            return self._dispatch_cache[event_type]
+        except KeyError:
+            pass
         edef = None
-        for d in self.definitions:
+        for d in self._definitions:
             if d.match_type(event_type):
                 edef = d
                 break
+        if len(self._dispatch_cache) >= self.DISPATCH_CACHE_SIZE:
+            self._dispatch_cache.clear()
+        self._dispatch_cache[event_type] = edef
+        return edef
+
+    def to_event(self, notification_body):
+        event_type = notification_body['event_type']
+        message_id = notification_body['message_id']
+        edef = self._get_definition(event_type)
 
         if edef is None:
-            msg = (_('Dropping Notification %(type)s (uuid:%(msgid)s)')
-                   % dict(type=event_type, msgid=message_id))
             if cfg.CONF.event.drop_unmatched_notifications:
-                LOG.debug(msg)
+                LOG.debug('Dropping Notification %(type)s (uuid:%(msgid)s)',
+                          dict(type=event_type, msgid=message_id))
             else:
                 # If drop_unmatched_notifications is False, this should
                 # never happen. (mdragon)
-                LOG.error(msg)
+                LOG.error(_LE('Dropping Notification %(type)s '
+                              '(uuid:%(msgid)s)'),
+                          dict(type=event_type, msgid=message_id))
             return None
 
         return edef.to_event(notification_body)
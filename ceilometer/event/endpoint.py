@@ -48,6 +48,10 @@ class EventsNotificationEndpoint(object):
         return self.process_notification('error', notifications)
 
     def process_notification(self, priority, notifications):
+        # NOTE: the whole batch is converted first and published through a
+        # single context, so that pipelines are flushed once per batch
+        # rather than once per notification.
+        events = []
         for notification in notifications:
             # NOTE: the rpc layer currently rips out the notification
             # delivery_info, which is critical to determining the
@@ -58,10 +62,17 @@ class EventsNotificationEndpoint(object):
             try:
                 event = self.event_converter.to_event(notification)
                 if event is not None:
-                    with self.manager.publisher() as p:
-                        p(event)
+                    events.append(event)
             except Exception:
                 if not cfg.CONF.notification.ack_on_event_error:
                     return oslo_messaging.NotificationResult.REQUEUE
                 LOG.error(_LE('Fail to process a notification'), exc_info=True)
+        if events:
+            try:
+                with self.manager.publisher() as p:
+                    p(events)
+            except Exception:
+                if not cfg.CONF.notification.ack_on_event_error:
+                    return oslo_messaging.NotificationResult.REQUEUE
+                LOG.error(_LE('Fail to publish events'), exc_info=True)
         return oslo_messaging.NotificationResult.HANDLED
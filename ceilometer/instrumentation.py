@@ -0,0 +1,197 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Counters and timers of the pipelines, sinks, transformers and publishers.
+
+Components are named like sink.<name>.transformer.<index>.<class>, they
+record counters, such as the number of samples in and out, gauges, such as
+the depth of a queue, and timers, such as the time spent handling a batch.
+Recording is a no-op unless enabled, the statistics are periodically dumped
+as JSON to a local file.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log
+from oslo_utils import timeutils
+import six
+
+from ceilometer.i18n import _LE
+from ceilometer import utils
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.BoolOpt('enabled',
+                default=False,
+                help='Record counters and timers of every pipeline, sink, '
+                     'transformer and publisher.'),
+    cfg.StrOpt('stats_file',
+               help='File the recorded statistics are periodically dumped '
+                    'to as JSON, suffixed by the id of the agent worker.'),
+    cfg.IntOpt('dump_interval',
+               default=60,
+               min=1,
+               help='Number of seconds between the dumps of the statistics.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='pipeline_stats')
+
+
+class Timer(object):
+    """Latency histogram, with buckets bounded in seconds."""
+
+    BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+    def as_dict(self):
+        bounds = ['le_%s' % b for b in self.BOUNDS] + ['inf']
+        return {'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'mean': self.total / self.count if self.count else 0.0,
+                'buckets': dict(zip(bounds, self.buckets))}
+
+
+class _Timing(object):
+    def __init__(self, recorder, component, name):
+        self.recorder = recorder
+        self.component = component
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.record(self.component, self.name,
+                             time.time() - self.start)
+
+
+class _NoTiming(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_TIMING = _NoTiming()
+
+
+class Recorder(object):
+    """Records counters, gauges and timers of named components."""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.timers = {}
+            self.since = timeutils.utcnow()
+
+    def incr(self, component, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            counters = self.counters.setdefault(component, {})
+            counters[name] = counters.get(name, 0) + value
+
+    def gauge(self, component, name, value):
+        """Set the current value of a gauge."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges.setdefault(component, {})[name] = value
+
+    def record(self, component, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            timers = self.timers.setdefault(component, {})
+            if name not in timers:
+                timers[name] = Timer()
+            timers[name].record(seconds)
+
+    def timed(self, component, name):
+        """Return a context manager recording the time spent in its block."""
+        if not self.enabled:
+            return _NO_TIMING
+        return _Timing(self, component, name)
+
+    def snapshot(self):
+        """Return the statistics recorded so far as a dict."""
+        with self.lock:
+            components = dict((c, dict(counters))
+                              for c, counters in
+                              six.iteritems(self.counters))
+            for component, gauges in six.iteritems(self.gauges):
+                components.setdefault(component, {}).update(gauges)
+            for component, timers in six.iteritems(self.timers):
+                values = components.setdefault(component, {})
+                for name, timer in six.iteritems(timers):
+                    values[name] = timer.as_dict()
+            return {'since': self.since.isoformat(),
+                    'components': components}
+
+    def dump(self, path):
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f, sort_keys=True, indent=2)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            LOG.exception(_LE('Unable to dump pipeline statistics to %s'),
+                          path)
+
+
+STATS = Recorder()
+
+
+def setup(conf, worker_id):
+    """Enable the recording as configured, return the dump file if any."""
+    STATS.enabled = conf.pipeline_stats.enabled
+    if STATS.enabled and conf.pipeline_stats.stats_file:
+        return '%s.%s' % (conf.pipeline_stats.stats_file, worker_id)
+
+
+def start_dumps(conf, worker_id):
+    """Enable the recording as configured, start the periodic dumps if any.
+
+    :return: the periodic dumping the statistics, or None.
+    """
+    path = setup(conf, worker_id)
+    if path:
+        periodic = utils.create_periodic(
+            target=STATS.dump, spacing=conf.pipeline_stats.dump_interval,
+            run_immediately=False, path=path)
+        utils.spawn_thread(periodic.start)
+        return periodic
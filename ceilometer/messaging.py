@@ -59,12 +59,13 @@ _SERIALIZER = oslo_serializer.JsonPayloadSerializer()
 
 def get_batch_notification_listener(transport, targets, endpoints,
                                     allow_requeue=False,
-                                    batch_size=1, batch_timeout=None):
+                                    batch_size=1, batch_timeout=None,
+                                    pool=None):
     """Return a configured oslo_messaging notification listener."""
     return oslo_messaging.get_batch_notification_listener(
         transport, targets, endpoints, executor='threading',
         allow_requeue=allow_requeue,
-        batch_size=batch_size, batch_timeout=batch_timeout)
+        batch_size=batch_size, batch_timeout=batch_timeout, pool=pool)
 
 
 def get_notifier(transport, publisher_id):
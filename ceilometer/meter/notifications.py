@@ -11,14 +11,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import fnmatch
 import itertools
 import pkg_resources
+import re
 import six
 
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
-from oslo_utils import fnmatch
 from stevedore import extension
 
 from ceilometer.agent import plugin_base
@@ -40,6 +41,16 @@ cfg.CONF.import_opt('disable_non_metric_meters', 'ceilometer.notification',
 LOG = log.getLogger(__name__)
 
 
+def _is_wildcard(pattern):
+    return any(c in pattern for c in '*?[')
+
+
+def _compile_wildcards(patterns):
+    if patterns:
+        return re.compile('|'.join('(?:%s)' % fnmatch.translate(p)
+                                   for p in patterns))
+
+
 class MeterDefinition(object):
 
     SAMPLE_ATTRIBUTES = ["name", "type", "volume", "unit", "timestamp",
@@ -59,6 +70,10 @@ class MeterDefinition(object):
         self._event_type = self.cfg.get('event_type')
         if isinstance(self._event_type, six.string_types):
             self._event_type = [self._event_type]
+        self.exact_event_types = set(t for t in self._event_type
+                                     if not _is_wildcard(t))
+        self.wildcard_event_types = _compile_wildcards(
+            [t for t in self._event_type if _is_wildcard(t)])
 
         if ('type' not in self.cfg.get('lookup', []) and
                 self.cfg['type'] not in sample.TYPES):
@@ -88,9 +103,9 @@ class MeterDefinition(object):
             self.lookup = [self.lookup]
 
     def match_type(self, meter_name):
-        for t in self._event_type:
-            if fnmatch.fnmatch(meter_name, t):
-                return True
+        return (meter_name in self.exact_event_types or
+                bool(self.wildcard_event_types and
+                     self.wildcard_event_types.match(meter_name)))
 
     def to_samples(self, message, all_values=False):
         # Sample defaults
@@ -162,10 +177,51 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
 
     event_types = []
 
+    # NOTE: upper bound of the number of event types the matching
+    # definitions are remembered for.
+    DISPATCH_CACHE_SIZE = 1024
+
     def __init__(self, manager):
         super(ProcessMeterNotifications, self).__init__(manager)
         self.definitions = self._load_definitions()
 
+    @property
+    def definitions(self):
+        return self._definitions
+
+    @definitions.setter
+    def definitions(self, definitions):
+        """Set the definitions and build their event type dispatch index.
+
+        Definitions are indexed by their exact event types, the ones with
+        wildcard event types are only matched once per event type as the
+        matching definitions are remembered.
+        """
+        self._definitions = list(definitions)
+        self._exact_index = {}
+        self._wildcard_definitions = []
+        for d in self._definitions:
+            for t in d.exact_event_types:
+                self._exact_index.setdefault(t, []).append(d)
+            if d.wildcard_event_types:
+                self._wildcard_definitions.append(d)
+        self._dispatch_cache = {}
+
+    def _get_definitions(self, event_type):
+        try:
+            return self._dispatch_cache[event_type]
+        except KeyError:
+            pass
+        definitions = set(self._exact_index.get(event_type, []))
+        definitions.update(d for d in self._wildcard_definitions
+                           if d.wildcard_event_types.match(event_type))
+        # keep the order of the definitions
+        definitions = [d for d in self._definitions if d in definitions]
+        if len(self._dispatch_cache) >= self.DISPATCH_CACHE_SIZE:
+            self._dispatch_cache.clear()
+        self._dispatch_cache[event_type] = definitions
+        return definitions
+
     def _load_definitions(self):
         plugin_manager = extension.ExtensionManager(
             namespace='ceilometer.event.trait_plugin')
@@ -223,7 +279,6 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
         return targets
 
     def process_notification(self, notification_body):
-        for d in self.definitions:
-            if d.match_type(notification_body['event_type']):
-                for s in d.to_samples(notification_body):
-                    yield sample.Sample.from_notification(**s)
+        for d in self._get_definitions(notification_body['event_type']):
+            for s in d.to_samples(notification_body):
+                yield sample.Sample.from_notification(**s)
@@ -20,6 +20,7 @@ from futurist import periodics
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
+from oslo_utils import timeutils
 from stevedore import extension
 
 from ceilometer.agent import plugin_base as base
@@ -78,6 +79,27 @@ OPTS = [
                default=5,
                help='Number of seconds to wait before publishing samples'
                'when batch_size is not reached (None means indefinitely)'),
+    cfg.IntOpt('pipeline_batch_size',
+               default=100, min=1,
+               help='Maximum number of samples or events sent in a single '
+                    'message to the pipeline queues when workload '
+                    'partitioning is enabled.'),
+    cfg.BoolOpt('shard_main_queues',
+                default=False,
+                help='Split the exchanges and topics of the main queues '
+                     'between the workers of the agent, so that each worker '
+                     'consumes a disjoint set of them rather than all the '
+                     'workers consuming every queue. Each worker consumes '
+                     'its own queues, named after its shard, which are '
+                     'shared with the same worker of the other agents. The '
+                     'split is deterministic and does not require '
+                     'coordination, it is only useful when there are at '
+                     'least as many exchanges and topics as workers.'),
+    cfg.IntOpt('statistics_interval',
+               default=0,
+               min=0,
+               help='Number of seconds between the logs of the throughput '
+                    'and queue lag of each worker. 0 disables them.'),
 ]
 
 cfg.CONF.register_opts(exchange_control.EXCHANGE_OPTS)
@@ -86,6 +108,51 @@ cfg.CONF.import_opt('telemetry_driver', 'ceilometer.publisher.messaging',
                     group='publisher_notifier')
 
 
+class WorkerStatistics(object):
+    """Endpoint counting the notifications received by a worker.
+
+    The queue lag is the age of the oldest notification of the last batch,
+    as stamped by the notifier.
+    """
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        self.count = 0
+        self.lag = None
+        self.since = timeutils.utcnow()
+
+    def _record(self, notifications):
+        lag = None
+        try:
+            sent = timeutils.parse_isotime(
+                notifications[0]['metadata']['timestamp'])
+            lag = timeutils.delta_seconds(
+                timeutils.normalize_time(sent), timeutils.utcnow())
+        except (KeyError, TypeError, ValueError):
+            pass
+        with self.lock:
+            self.count += len(notifications)
+            if lag is not None:
+                self.lag = lag
+
+    audit = debug = info = warn = error = critical = sample = _record
+
+    def report(self):
+        now = timeutils.utcnow()
+        with self.lock:
+            count, lag, since = self.count, self.lag, self.since
+            self.count = 0
+            self.since = now
+        period = timeutils.delta_seconds(since, now)
+        LOG.info(_LI('Notification worker %(worker)s processed %(count)d '
+                     'notifications in %(period).0fs (%(rate).1f/s), '
+                     'queue lag: %(lag)s'),
+                 {'worker': self.worker_id, 'count': count, 'period': period,
+                  'rate': count / period if period else 0.0,
+                  'lag': '%.1fs' % lag if lag is not None else 'unknown'})
+
+
 class NotificationService(service_base.PipelineBasedService):
     """Notification service.
 
@@ -120,7 +187,8 @@ class NotificationService(service_base.PipelineBasedService):
     def _get_pipe_manager(self, transport, pipeline_manager):
 
         if self.conf.notification.workload_partitioning:
-            pipe_manager = pipeline.SamplePipelineTransportManager(self.conf)
+            pipe_manager = pipeline.SamplePipelineTransportManager(
+                self.conf, self.conf.notification.pipeline_batch_size)
             for pipe in pipeline_manager.pipelines:
                 key = pipeline.get_pipeline_grouping_key(pipe)
                 pipe_manager.add_transporter(
@@ -134,7 +202,7 @@ class NotificationService(service_base.PipelineBasedService):
     def _get_event_pipeline_manager(self, transport):
         if self.conf.notification.workload_partitioning:
             event_pipe_manager = pipeline.EventPipelineTransportManager(
-                self.conf)
+                self.conf, self.conf.notification.pipeline_batch_size)
             for pipe in self.event_pipeline_manager.pipelines:
                 event_pipe_manager.add_transporter(
                     (pipe.source.support_event, ['event_type'],
@@ -146,18 +214,29 @@ class NotificationService(service_base.PipelineBasedService):
 
     def run(self):
         super(NotificationService, self).run()
+        self.init_pipeline_stats()
         self.shutdown = False
         self.periodic = None
         self.partition_coordinator = None
         self.coord_lock = threading.Lock()
 
         self.listeners = []
+        self.statistics = None
+        self.statistics_periodic = None
+        if self.conf.notification.statistics_interval:
+            self.statistics = WorkerStatistics(self.worker_id)
+            self.statistics_periodic = utils.create_periodic(
+                target=self.statistics.report,
+                spacing=self.conf.notification.statistics_interval,
+                run_immediately=False)
+            utils.spawn_thread(self.statistics_periodic.start)
 
         # NOTE(kbespalov): for the pipeline queues used a single amqp host
         # hence only one listener is required
         self.pipeline_listener = None
 
-        self.pipeline_manager = pipeline.setup_pipeline(self.conf)
+        self.pipeline_manager = pipeline.setup_pipeline(
+            self.conf, worker_id=self.worker_id)
 
         self.event_pipeline_manager = pipeline.setup_event_pipeline(self.conf)
 
@@ -220,6 +299,38 @@ class NotificationService(service_base.PipelineBasedService):
 
         self.init_pipeline_refresh()
 
+    def _get_worker_targets(self, targets):
+        """Return the targets consumed by this worker.
+
+        When the main queues are sharded, the sorted targets are dealt to
+        the workers in turn, so each worker consumes a disjoint and stable
+        subset of the exchanges and topics.
+        """
+        workers = self.conf.notification.workers
+        if not self.conf.notification.shard_main_queues or workers <= 1:
+            return targets
+        if len(targets) < workers:
+            LOG.warning(_LW('%(workers)d workers share only %(targets)d '
+                            'notification targets, some of them are idle'),
+                        {'workers': workers, 'targets': len(targets)})
+        targets = sorted(targets, key=lambda t: (t.exchange or '',
+                                                 t.topic or ''))
+        return targets[self.worker_id % workers::workers]
+
+    def _get_worker_pool(self):
+        """Return the listener pool of the shard of this worker.
+
+        Without a pool, the queues are named after the topic and priority
+        only and are shared by every exchange, so each shard needs its own
+        pool, i.e. its own queues, to actually consume disjoint exchanges.
+        The same shard of the agents on other hosts shares that pool.
+        """
+        workers = self.conf.notification.workers
+        if not self.conf.notification.shard_main_queues or workers <= 1:
+            return None
+        return '%s.shard-%d' % (self.NOTIFICATION_NAMESPACE,
+                                self.worker_id % workers)
+
     def _configure_main_queue_listeners(self, pipe_manager,
                                         event_pipe_manager):
         notification_manager = self._get_notifications_manager(pipe_manager)
@@ -252,13 +363,20 @@ class NotificationService(service_base.PipelineBasedService):
                     targets.append(new_tar)
             endpoints.append(handler)
 
+        targets = self._get_worker_targets(targets)
+        pool = self._get_worker_pool()
+        if self.statistics:
+            endpoints.append(self.statistics)
+        if not targets:
+            return
+
         urls = self.conf.notification.messaging_urls or [None]
         for url in urls:
             transport = messaging.get_transport(self.conf, url)
             # NOTE(gordc): ignore batching as we want pull
             # to maintain sequencing as much as possible.
             listener = messaging.get_batch_notification_listener(
-                transport, targets, endpoints)
+                transport, targets, endpoints, pool=pool)
             listener.start()
             self.listeners.append(listener)
 
@@ -297,6 +415,9 @@ class NotificationService(service_base.PipelineBasedService):
         if self.pipeline_listener:
             self.pipeline_listener.stop()
             self.pipeline_listener.wait()
+            # NOTE: the partitions may be handed to other agents, give them
+            # the latest state of the stateful transformers.
+            self._save_transformer_state()
 
         self.pipeline_listener = messaging.get_batch_notification_listener(
             transport,
@@ -309,17 +430,25 @@ class NotificationService(service_base.PipelineBasedService):
         batch = (1 if self.conf.notification.batch_size > 1 else None)
         self.pipeline_listener.start(override_pool_size=batch)
 
+    def _save_transformer_state(self):
+        for pipe in self.pipeline_manager.pipelines:
+            pipe.sink.save_state()
+
     def terminate(self):
         self.shutdown = True
         if self.periodic:
             self.periodic.stop()
             self.periodic.wait()
+        if self.statistics_periodic:
+            self.statistics_periodic.stop()
+            self.statistics_periodic.wait()
         if self.partition_coordinator:
             self.partition_coordinator.stop()
         with self.coord_lock:
             if self.pipeline_listener:
                 utils.kill_listeners([self.pipeline_listener])
             utils.kill_listeners(self.listeners)
+            self._save_transformer_state()
         super(NotificationService, self).terminate()
 
     def reload_pipeline(self):
@@ -33,6 +33,7 @@ import ceilometer.energy.kwapi
 import ceilometer.event.converter
 import ceilometer.hardware.discovery
 import ceilometer.image.discovery
+import ceilometer.instrumentation
 import ceilometer.ipmi.notifications.ironic
 import ceilometer.ipmi.platform.intel_node_manager
 import ceilometer.ipmi.pollsters
@@ -90,6 +91,7 @@ def list_opts():
         ('notification',
          itertools.chain(ceilometer.notification.OPTS,
                          [ceilometer.service.NOTI_OPT])),
+        ('pipeline_stats', ceilometer.instrumentation.OPTS),
         ('polling', ceilometer.agent.manager.POLLING_OPTS),
         ('publisher', ceilometer.publisher.utils.OPTS),
         ('publisher_notifier', ceilometer.publisher.messaging.NOTIFIER_OPTS),
@@ -15,15 +15,17 @@
 # under the License.
 
 import abc
+import fnmatch
 import hashlib
 from itertools import chain
+import logging
 from operator import methodcaller
 import os
+import re
 
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
-from oslo_utils import fnmatch
 from oslo_utils import timeutils
 import six
 from stevedore import extension
@@ -32,6 +34,7 @@ import yaml
 
 from ceilometer.event.storage import models
 from ceilometer.i18n import _, _LI, _LW
+from ceilometer import instrumentation
 from ceilometer import publisher
 from ceilometer.publisher import utils as publisher_utils
 from ceilometer import sample as sample_util
@@ -91,7 +94,9 @@ class PipelineEndpoint(object):
 
 class SamplePipelineEndpoint(PipelineEndpoint):
     def sample(self, messages):
-        samples = chain.from_iterable(m["payload"] for m in messages)
+        samples = publisher_utils.verify_signatures(
+            chain.from_iterable(m["payload"] for m in messages),
+            self.conf.publisher.telemetry_secret)
         samples = [
             sample_util.Sample(name=s['counter_name'],
                                type=s['counter_type'],
@@ -103,16 +108,22 @@ class SamplePipelineEndpoint(PipelineEndpoint):
                                timestamp=s['timestamp'],
                                resource_metadata=s['resource_metadata'],
                                source=s.get('source'))
-            for s in samples if publisher_utils.verify_signature(
-                s, self.conf.publisher.telemetry_secret)
+            for s in samples
         ]
+        # NOTE: the timestamps are parsed once and cached on the samples,
+        # batches coming from a single agent are usually already ordered.
+        timestamps = [s.get_iso_timestamp() for s in samples]
+        if any(a > b for a, b in zip(timestamps, timestamps[1:])):
+            samples.sort(key=methodcaller('get_iso_timestamp'))
         with self.publish_context as p:
-            p(sorted(samples, key=methodcaller('get_iso_timestamp')))
+            p(samples)
 
 
 class EventPipelineEndpoint(PipelineEndpoint):
     def sample(self, messages):
-        events = chain.from_iterable(m["payload"] for m in messages)
+        events = publisher_utils.verify_signatures(
+            chain.from_iterable(m["payload"] for m in messages),
+            self.conf.publisher.telemetry_secret)
         events = [
             models.Event(
                 message_id=ev['message_id'],
@@ -123,8 +134,7 @@ class EventPipelineEndpoint(PipelineEndpoint):
                                      models.Trait.convert_value(dtype, value))
                         for name, dtype, value in ev['traits']],
                 raw=ev.get('raw', {}))
-            for ev in events if publisher_utils.verify_signature(
-                ev, self.conf.publisher.telemetry_secret)
+            for ev in events
         ]
         try:
             with self.publish_context as p:
@@ -137,8 +147,16 @@ class EventPipelineEndpoint(PipelineEndpoint):
 
 
 class _PipelineTransportManager(object):
-    def __init__(self, conf):
+    """Publishes data to the IPC queues of the partitioned pipelines.
+
+    :param batch_size: maximum number of datapoints sent in a single
+                       message, the datapoints sent to a queue within a
+                       publish context are batched up to that size.
+    """
+
+    def __init__(self, conf, batch_size=100):
         self.conf = conf
+        self.batch_size = batch_size
         self.transporters = []
 
     @staticmethod
@@ -157,13 +175,18 @@ class _PipelineTransportManager(object):
         transporters = self.transporters
         filter_attr = self.filter_attr
         event_type = self.event_type
+        batch_size = self.batch_size
 
         class PipelinePublishContext(object):
+            def __init__(self):
+                self.batches = {}
+
+            def send(self, notifier):
+                payload = self.batches.pop(notifier)
+                notifier.sample({}, event_type=event_type, payload=payload)
+
             def __enter__(self):
                 def p(data):
-                    # TODO(gordc): cleanup so payload is always single
-                    #              datapoint. we can't correctly bucketise
-                    #              datapoints if batched.
                     data = [data] if not isinstance(data, list) else data
                     for datapoint in data:
                         serialized_data = serializer(datapoint)
@@ -173,13 +196,15 @@ class _PipelineTransportManager(object):
                                                      grouping_keys)
                                        % len(notifiers))
                                 notifier = notifiers[key]
-                                notifier.sample({},
-                                                event_type=event_type,
-                                                payload=[serialized_data])
+                                batch = self.batches.setdefault(notifier, [])
+                                batch.append(serialized_data)
+                                if len(batch) >= batch_size:
+                                    self.send(notifier)
                 return p
 
             def __exit__(self, exc_type, exc_value, traceback):
-                pass
+                for notifier in list(self.batches):
+                    self.send(notifier)
 
         return PipelinePublishContext()
 
@@ -222,6 +247,52 @@ class PublishContext(object):
             p.flush()
 
 
+class _NameMatcher(object):
+    """Matches meter or event names against a source filtering list.
+
+    Wildcards like storage.* and !disk.* are supported. The included and
+    excluded patterns are each compiled into a single regex once, and the
+    decision is memoized per name since the set of names seen by a source
+    is small and repeats constantly.
+    """
+
+    def __init__(self, dataset, cache_size=1024):
+        excluded = [x[1:] for x in dataset if x[0] == '!']
+        included = [x for x in dataset if x[0] != '!']
+        self._exclude = self._compile(excluded)
+        self._include = self._compile(included)
+        # if we only have negation, we suppose the default is allow
+        self._default = not included
+        self._cache = {}
+        self._cache_size = cache_size
+
+    @staticmethod
+    def _compile(patterns):
+        if patterns:
+            return re.compile('|'.join('(?:%s)' % fnmatch.translate(p)
+                                       for p in patterns))
+
+    def _match(self, data_name):
+        # Start with negation, we consider that the order is deny, allow
+        if self._exclude and self._exclude.match(data_name):
+            return False
+        if self._include and self._include.match(data_name):
+            return True
+        return self._default
+
+    def __call__(self, data_name):
+        try:
+            return self._cache[data_name]
+        except KeyError:
+            supported = self._match(data_name)
+            # NOTE: names are not trusted to be bounded, so start over rather
+            # than letting the memo grow without limit.
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[data_name] = supported
+            return supported
+
+
 class Source(object):
     """Represents a source of samples or events."""
 
@@ -272,18 +343,7 @@ class Source(object):
 
     @staticmethod
     def is_supported(dataset, data_name):
-        # Support wildcard like storage.* and !disk.*
-        # Start with negation, we consider that the order is deny, allow
-        if any(fnmatch.fnmatch(data_name, datapoint[1:])
-               for datapoint in dataset if datapoint[0] == '!'):
-            return False
-
-        if any(fnmatch.fnmatch(data_name, datapoint)
-               for datapoint in dataset if datapoint[0] != '!'):
-            return True
-
-        # if we only have negation, we suppose the default is allow
-        return all(datapoint.startswith('!') for datapoint in dataset)
+        return _NameMatcher(dataset)(data_name)
 
 
 class EventSource(Source):
@@ -297,9 +357,10 @@ class EventSource(Source):
         super(EventSource, self).__init__(cfg)
         self.events = cfg.get('events')
         self.check_source_filtering(self.events, 'events')
+        self._matcher = _NameMatcher(self.events)
 
     def support_event(self, event_name):
-        return self.is_supported(self.events, event_name)
+        return self._matcher(event_name)
 
 
 class SampleSource(Source):
@@ -330,12 +391,13 @@ class SampleSource(Source):
         if not isinstance(self.discovery, list):
             raise PipelineException("Discovery should be a list", cfg)
         self.check_source_filtering(self.meters, 'meters')
+        self._matcher = _NameMatcher(self.meters)
 
     def get_interval(self):
         return self.interval
 
     def support_meter(self, meter_name):
-        return self.is_supported(self.meters, meter_name)
+        return self._matcher(meter_name)
 
 
 class Sink(object):
@@ -363,8 +425,9 @@ class Sink(object):
     passed data directly from the sink which are published unchanged.
     """
 
-    def __init__(self, cfg, transformer_manager):
+    def __init__(self, cfg, transformer_manager, worker_id=0):
         self.cfg = cfg
+        self.worker_id = worker_id
 
         try:
             self.name = cfg['name']
@@ -391,12 +454,22 @@ class Sink(object):
         self.multi_publish = True if len(self.publishers) > 1 else False
         self.transformers = self._setup_transformers(cfg, transformer_manager)
 
+        # names of the components in the instrumentation statistics
+        self.stats_name = '%s.%s' % (self.STATS_PREFIX, self.name)
+        self.transformers_stats_names = [
+            '%s.transformer.%d.%s' % (self.stats_name, i,
+                                      type(t).__name__)
+            for i, t in enumerate(self.transformers)]
+        self.publishers_stats_names = [
+            '%s.publisher.%d.%s' % (self.stats_name, i, type(p).__name__)
+            for i, p in enumerate(self.publishers)]
+
     def __str__(self):
         return self.name
 
     def _setup_transformers(self, cfg, transformer_manager):
         transformers = []
-        for transformer in self.transformer_cfg:
+        for index, transformer in enumerate(self.transformer_cfg):
             parameter = transformer['parameters'] or {}
             try:
                 ext = transformer_manager[transformer['name']]
@@ -404,7 +477,14 @@ class Sink(object):
                 raise PipelineException(
                     "No transformer named %s loaded" % transformer['name'],
                     cfg)
-            transformers.append(ext.plugin(**parameter))
+            kwargs = parameter
+            if 'cache_backend' in parameter:
+                # NOTE: the stateful transformers sharing a backend save
+                # their state under their own position in the pipelines.
+                kwargs = dict(parameter, worker_id=self.worker_id,
+                              state_namespace='%s.%d.%s' % (
+                                  self.name, index, transformer['name']))
+            transformers.append(ext.plugin(**kwargs))
             LOG.info(_LI(
                 "Pipeline %(pipeline)s: Setup transformer instance %(name)s "
                 "with parameter %(param)s") % ({'pipeline': self,
@@ -417,13 +497,20 @@ class Sink(object):
 class EventSink(Sink):
 
     NAMESPACE = 'ceilometer.event.publisher'
+    STATS_PREFIX = 'event_sink'
 
     def publish_events(self, events):
         if events:
-            for p in self.publishers:
+            stats = instrumentation.STATS
+            stats.incr(self.stats_name, 'events_in', len(events))
+            for p, stats_name in zip(self.publishers,
+                                     self.publishers_stats_names):
                 try:
-                    p.publish_events(events)
+                    with stats.timed(stats_name, 'publish'):
+                        p.publish_events(events)
+                    stats.incr(stats_name, 'published', len(events))
                 except Exception:
+                    stats.incr(stats_name, 'errors')
                     LOG.exception(_("Pipeline %(pipeline)s: %(status)s"
                                     " after error from publisher %(pub)s") %
                                    ({'pipeline': self, 'status': 'Continue' if
@@ -440,17 +527,16 @@ class EventSink(Sink):
 class SampleSink(Sink):
 
     NAMESPACE = 'ceilometer.publisher'
+    STATS_PREFIX = 'sink'
 
-    def _transform_sample(self, start, sample):
+    def _transform_sample(self, transformer, sample):
         try:
-            for transformer in self.transformers[start:]:
-                sample = transformer.handle_sample(sample)
-                if not sample:
-                    LOG.debug(
-                        "Pipeline %(pipeline)s: Sample dropped by "
-                        "transformer %(trans)s", {'pipeline': self,
-                                                  'trans': transformer})
-                    return
+            sample = transformer.handle_sample(sample)
+            if not sample and LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug(
+                    "Pipeline %(pipeline)s: Sample dropped by "
+                    "transformer %(trans)s", {'pipeline': self,
+                                              'trans': transformer})
             return sample
         except Exception as err:
             # TODO(gordc): only use one log level.
@@ -461,6 +547,50 @@ class SampleSink(Sink):
                                                        'smp': sample}))
             LOG.exception(err)
 
+    def _transform_each(self, transformer, samples):
+        return [s for s in (self._transform_sample(transformer, s)
+                            for s in samples) if s]
+
+    def _transform_samples(self, start, samples):
+        stats = instrumentation.STATS
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        for transformer, stats_name in zip(
+                self.transformers[start:],
+                self.transformers_stats_names[start:]):
+            if debug:
+                LOG.debug(
+                    "Pipeline %(pipeline)s: Transform %(count)d samples "
+                    "from %(trans)s transformer", {'pipeline': self,
+                                                   'count': len(samples),
+                                                   'trans': transformer})
+            stats.incr(stats_name, 'samples_in', len(samples))
+            handle_samples = getattr(transformer, 'handle_samples', None)
+            if handle_samples is None:
+                # Transformers not based on TransformerBase only know
+                # about single samples.
+                with stats.timed(stats_name, 'handle'):
+                    samples = self._transform_each(transformer, samples)
+            else:
+                try:
+                    with stats.timed(stats_name, 'handle'):
+                        samples = handle_samples(samples)
+                except Exception as err:
+                    # NOTE: the samples can't be handled again one by one,
+                    # the transformer may already have accounted for some
+                    # of them, it is up to it to isolate the bad ones.
+                    LOG.warning(_("Pipeline %(pipeline)s: "
+                                  "Exit after error from transformer "
+                                  "%(trans)s for %(count)d samples") %
+                                ({'pipeline': self, 'trans': transformer,
+                                  'count': len(samples)}))
+                    LOG.exception(err)
+                    stats.incr(stats_name, 'errors')
+                    samples = []
+            stats.incr(stats_name, 'samples_out', len(samples))
+            if not samples:
+                return []
+        return samples
+
     def _publish_samples(self, start, samples):
         """Push samples into pipeline for publishing.
 
@@ -471,40 +601,56 @@ class SampleSink(Sink):
 
         """
 
-        transformed_samples = []
-        if not self.transformers:
-            transformed_samples = samples
-        else:
-            for sample in samples:
-                LOG.debug(
-                    "Pipeline %(pipeline)s: Transform sample "
-                    "%(smp)s from %(trans)s transformer", {'pipeline': self,
-                                                           'smp': sample,
-                                                           'trans': start})
-                sample = self._transform_sample(start, sample)
-                if sample:
-                    transformed_samples.append(sample)
+        transformed_samples = samples
+        if self.transformers[start:] and samples:
+            transformed_samples = self._transform_samples(start, samples)
 
         if transformed_samples:
-            for p in self.publishers:
+            stats = instrumentation.STATS
+            stats.incr(self.stats_name, 'samples_out',
+                       len(transformed_samples))
+            for p, stats_name in zip(self.publishers,
+                                     self.publishers_stats_names):
                 try:
-                    p.publish_samples(transformed_samples)
+                    with stats.timed(stats_name, 'publish'):
+                        p.publish_samples(transformed_samples)
+                    stats.incr(stats_name, 'published',
+                               len(transformed_samples))
                 except Exception:
+                    stats.incr(stats_name, 'errors')
                     LOG.exception(_(
                         "Pipeline %(pipeline)s: Continue after error "
                         "from publisher %(pub)s") % ({'pipeline': self,
                                                       'pub': p}))
 
     def publish_samples(self, samples):
-        self._publish_samples(0, samples)
+        stats = instrumentation.STATS
+        stats.incr(self.stats_name, 'samples_in', len(samples))
+        with stats.timed(self.stats_name, 'process'):
+            self._publish_samples(0, samples)
+
+    def save_state(self):
+        """Save the state of the stateful transformers now."""
+        for transformer in self.transformers:
+            save_state = getattr(transformer, 'save_state', None)
+            if save_state:
+                try:
+                    save_state()
+                except Exception:
+                    LOG.exception(_(
+                        "Pipeline %(pipeline)s: Error saving the state of "
+                        "transformer %(trans)s") % ({'pipeline': self,
+                                                     'trans': transformer}))
 
     def flush(self):
         """Flush data after all samples have been injected to pipeline."""
 
+        stats = instrumentation.STATS
         for (i, transformer) in enumerate(self.transformers):
             try:
-                self._publish_samples(i + 1,
-                                      list(transformer.flush()))
+                with stats.timed(self.transformers_stats_names[i], 'flush'):
+                    flushed = [s for s in transformer.flush() if s]
+                self._publish_samples(i + 1, flushed)
             except Exception as err:
                 LOG.warning(_(
                     "Pipeline %(pipeline)s: Error flushing "
@@ -522,6 +668,7 @@ class Pipeline(object):
         self.source = source
         self.sink = sink
         self.name = str(self)
+        self.stats_name = 'pipeline.%s' % self.name
 
     def __str__(self):
         return (self.source.name if self.source.name == self.sink.name
@@ -555,6 +702,10 @@ class EventPipeline(Pipeline):
             events = [events]
         supported = [e for e in events
                      if self.source.support_event(e.event_type)]
+        stats = instrumentation.STATS
+        stats.incr(self.stats_name, 'events_in', len(events))
+        stats.incr(self.stats_name, 'events_filtered',
+                   len(events) - len(supported))
         self.sink.publish_events(supported)
 
 
@@ -609,6 +760,10 @@ class SamplePipeline(Pipeline):
             samples = [samples]
         supported = [s for s in samples if self.source.support_meter(s.name)
                      and self._validate_volume(s)]
+        stats = instrumentation.STATS
+        stats.incr(self.stats_name, 'samples_in', len(samples))
+        stats.incr(self.stats_name, 'samples_filtered',
+                   len(samples) - len(supported))
         self.sink.publish_samples(supported)
 
 
@@ -685,7 +840,7 @@ class PipelineManager(ConfigManagerBase):
     """
 
     def __init__(self, conf, cfg_info, transformer_manager,
-                 p_type=SAMPLE_TYPE):
+                 p_type=SAMPLE_TYPE, worker_id=0):
         """Setup the pipelines according to config.
 
         The configuration is supported as follows:
@@ -780,7 +935,8 @@ class PipelineManager(ConfigManagerBase):
                                         name, self)
             else:
                 unique_names.add(name)
-                sinks[s['name']] = p_type['sink'](s, transformer_manager)
+                sinks[s['name']] = p_type['sink'](s, transformer_manager,
+                                                  worker_id)
         unique_names.clear()
 
         for source in sources:
@@ -836,20 +992,20 @@ class PollingManager(ConfigManagerBase):
         unique_names.clear()
 
 
-def setup_event_pipeline(conf, transformer_manager=None):
+def setup_event_pipeline(conf, transformer_manager=None, worker_id=0):
     """Setup event pipeline manager according to yaml config file."""
     default = extension.ExtensionManager('ceilometer.transformer')
     cfg_file = conf.event_pipeline_cfg_file
     return PipelineManager(conf, cfg_file, transformer_manager or default,
-                           EVENT_TYPE)
+                           EVENT_TYPE, worker_id)
 
 
-def setup_pipeline(conf, transformer_manager=None):
+def setup_pipeline(conf, transformer_manager=None, worker_id=0):
     """Setup pipeline manager according to yaml config file."""
     default = extension.ExtensionManager('ceilometer.transformer')
     cfg_file = conf.pipeline_cfg_file
     return PipelineManager(conf, cfg_file, transformer_manager or default,
-                           SAMPLE_TYPE)
+                           SAMPLE_TYPE, worker_id)
 
 
 def setup_polling(conf):
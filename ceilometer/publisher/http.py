@@ -13,18 +13,26 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import threading
+import time
+
 from oslo_log import log
 from oslo_serialization import jsonutils
 import requests
 from requests import adapters
 from six.moves.urllib import parse as urlparse
 
-from ceilometer.i18n import _LE
+from ceilometer.i18n import _LE, _LW
 from ceilometer import publisher
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
 
+MAX_RETRY_INTERVAL = 60
+
+
 class HttpPublisher(publisher.PublisherBase):
     """Publisher metering data to a http endpoint
 
@@ -61,6 +69,17 @@ class HttpPublisher(publisher.PublisherBase):
                 - http://host:80/path?timeout=1&max_retries=2
 
     Http end point is required for this publisher to work properly.
+
+    The connections to the endpoint are kept alive and reused, up to
+    pool_size of them. The other options of the query string are:
+
+    - compress=1 to send gzip compressed requests.
+    - batch_size to post at most that many items per request.
+    - policy, like the messaging publishers: by default the data is posted
+      by the pipeline and a failure raises. With queue or drop, the data is
+      queued, up to max_queue_length requests, the oldest ones being dropped
+      beyond that, and posted by a background thread which, when a post
+      fails, retries it later with queue or drops it with drop.
     """
 
     def __init__(self, parsed_url):
@@ -79,13 +98,31 @@ class HttpPublisher(publisher.PublisherBase):
         self.headers = {'Content-type': 'application/json'}
 
         # Handling other configuration options in the query string
-        if parsed_url.query:
-            params = urlparse.parse_qs(parsed_url.query)
-            self.timeout = self._get_param(params, 'timeout', 1)
-            self.max_retries = self._get_param(params, 'max_retries', 2)
-        else:
-            self.timeout = 1
-            self.max_retries = 2
+        params = urlparse.parse_qs(parsed_url.query)
+        self.timeout = self._get_param(params, 'timeout', 1)
+        self.max_retries = self._get_param(params, 'max_retries', 2)
+        self.pool_size = self._get_param(params, 'pool_size',
+                                         adapters.DEFAULT_POOLSIZE)
+        self.compress = bool(self._get_param(params, 'compress', 0))
+        self.batch_size = self._get_param(params, 'batch_size', 0)
+        self.max_queue_length = self._get_param(params, 'max_queue_length',
+                                                1024)
+        self.policy = params.get('policy', ['default'])[-1]
+        if self.policy not in ['default', 'queue', 'drop']:
+            LOG.warning(_LW('Publishing policy is unknown (%s) force to '
+                            'default'), self.policy)
+            self.policy = 'default'
+        if self.compress:
+            self.headers['Content-Encoding'] = 'gzip'
+
+        self.session = requests.Session()
+        self.session.mount(self.target,
+                           adapters.HTTPAdapter(max_retries=self.max_retries,
+                                                pool_maxsize=self.pool_size))
+
+        self.local_queue = collections.deque()
+        self.lock = threading.Lock()
+        self.sender = None
 
         LOG.debug('HttpPublisher for endpoint %s is initialized!' %
                   self.target)
@@ -99,25 +136,74 @@ class HttpPublisher(publisher.PublisherBase):
                       {'value': default_value, 'name': name})
             return default_value
 
+    def _post(self, content):
+        """Post a request, return False if it failed and can be retried."""
+        res = self.session.post(self.target, data=content,
+                                headers=self.headers, timeout=self.timeout)
+        if res.status_code >= 300:
+            LOG.error(_LE('Data post failed with status code %s'),
+                      res.status_code)
+        return res.status_code < 500
+
     def _do_post(self, data):
         if not data:
             LOG.debug('Data set is empty!')
             return
 
-        session = requests.Session()
-        session.mount(self.target,
-                      adapters.HTTPAdapter(max_retries=self.max_retries))
-
-        content = ','.join([jsonutils.dumps(item) for item in data])
-        content = '[' + content + ']'
-
-        LOG.debug('Data to be posted by HttpPublisher: %s', content)
-
-        res = session.post(self.target, data=content, headers=self.headers,
-                           timeout=self.timeout)
-        if res.status_code >= 300:
-            LOG.error(_LE('Data post failed with status code %s'),
-                      res.status_code)
+        batch_size = self.batch_size or len(data)
+        for i in range(0, len(data), batch_size):
+            batch = data[i:i + batch_size]
+            content = ','.join([jsonutils.dumps(item) for item in batch])
+            content = '[' + content + ']'
+
+            LOG.debug('Data to be posted by HttpPublisher: %s', content)
+
+            if self.compress:
+                content = utils.gzip_compress(content.encode('utf-8'))
+            if self.policy == 'default':
+                self._post(content)
+            else:
+                self._enqueue(content, len(batch))
+
+    def _enqueue(self, content, count):
+        with self.lock:
+            if len(self.local_queue) >= self.max_queue_length > 0:
+                __, dropped = self.local_queue.popleft()
+                LOG.warning(_LW("Publisher max local_queue length is "
+                                "exceeded, dropping %d oldest datapoints"),
+                            dropped)
+            self.local_queue.append((content, count))
+            if self.sender is None:
+                self.sender = utils.spawn_thread(self._send_queue)
+
+    def _send_queue(self):
+        retry_interval = 1
+        while True:
+            with self.lock:
+                if not self.local_queue:
+                    self.sender = None
+                    return
+                item = self.local_queue[0]
+            content, count = item
+            try:
+                delivered = self._post(content)
+            except requests.exceptions.RequestException as e:
+                LOG.warning(_LW('Data post failed: %s'), e)
+                delivered = False
+            if not delivered and self.policy == 'queue':
+                LOG.warning(_LW("Failed to publish %d datapoints, queue "
+                                "them"), count)
+                time.sleep(retry_interval)
+                retry_interval = min(retry_interval * 2, MAX_RETRY_INTERVAL)
+                continue
+            if not delivered:
+                LOG.warning(_LW("Failed to publish %d datapoints, dropping "
+                                "them"), count)
+            retry_interval = 1
+            with self.lock:
+                # the oldest requests may have been dropped meanwhile
+                if self.local_queue and self.local_queue[0] is item:
+                    self.local_queue.popleft()
 
     def publish_samples(self, samples):
         """Send a metering message for publishing
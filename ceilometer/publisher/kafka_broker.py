@@ -60,8 +60,28 @@ class KafkaBrokerPublisher(messaging.MessagingPublisher):
     max_queue_length field as well. When the transfer fails with retry
     option, try to resend the data as many times as specified in max_retry
     field. If max_retry is not specified, default the number of retry is 100.
+
+    The datapoints are sent asynchronously, batched by the producer, but the
+    delivery stays synchronous per publication: each publication waits for
+    all of them to be acknowledged, and only the ones which were not are
+    queued or retried according to the policy. The batching
+    of the producer is tuned by the linger_ms and batch_size fields, and
+    compression (gzip, snappy or lz4) enables the compression of the batches.
+
+    By default each datapoint is a Kafka record of its own. With envelope=1,
+    all the datapoints of a publication are sent as a single record, which
+    the consuming application must unpack, a JSON object like::
+
+        {"envelope": 1, "messages": [datapoint, ...]}
     """
 
+    ENVELOPE_VERSION = 1
+
+    # URL field: (KafkaProducer argument, type)
+    PRODUCER_OPTIONS = {'linger_ms': ('linger_ms', int),
+                        'batch_size': ('batch_size', int),
+                        'compression': ('compression_type', str)}
+
     def __init__(self, parsed_url):
         super(KafkaBrokerPublisher, self).__init__(parsed_url)
         options = urlparse.parse_qs(parsed_url.query)
@@ -71,14 +91,20 @@ class KafkaBrokerPublisher(messaging.MessagingPublisher):
             parsed_url.netloc, default_port=9092)
         self._topic = options.get('topic', ['ceilometer'])[-1]
         self.max_retry = int(options.get('max_retry', [100])[-1])
+        self.envelope = bool(int(options.get('envelope', [0])[-1]))
+        self._producer_options = {}
+        for name, (arg, convert) in self.PRODUCER_OPTIONS.items():
+            if name in options:
+                self._producer_options[arg] = convert(options[name][-1])
 
     def _ensure_connection(self):
         if self._producer:
             return
 
         try:
-            client = kafka.KafkaClient("%s:%s" % (self._host, self._port))
-            self._producer = kafka.SimpleProducer(client)
+            self._producer = kafka.KafkaProducer(
+                bootstrap_servers="%s:%s" % (self._host, self._port),
+                **self._producer_options)
         except Exception as e:
             LOG.exception(_LE("Failed to connect to Kafka service: %s"), e)
             raise messaging.DeliveryFailure('Kafka Client is not available, '
@@ -86,11 +112,30 @@ class KafkaBrokerPublisher(messaging.MessagingPublisher):
 
     def _send(self, event_type, data):
         self._ensure_connection()
-        # TODO(sileht): don't split the payload into multiple network
-        # message ... but how to do that without breaking consuming
-        # application...
+        if self.envelope:
+            records = [{'envelope': self.ENVELOPE_VERSION, 'messages': data}]
+        else:
+            records = data
+        futures = []
+        error = None
+        for record in records:
+            try:
+                futures.append(self._producer.send(
+                    self._topic, jsonutils.dump_as_bytes(record)))
+            except Exception as e:
+                error = e
+                break
         try:
-            for d in data:
-                self._producer.send_messages(self._topic, jsonutils.dumps(d))
+            self._producer.flush()
         except Exception as e:
-            messaging.raise_delivery_failure(e)
+            error = error or e
+        # NOTE: only the records which were not acknowledged are sent again,
+        # the broker already has the others.
+        undelivered = ([r for r, f in zip(records, futures)
+                        if not f.succeeded()] + records[len(futures):])
+        if undelivered:
+            error = error or next(
+                (f.exception for f in futures if f.exception is not None),
+                kafka.errors.KafkaError('Records not acknowledged'))
+            messaging.raise_delivery_failure(
+                error, undelivered=data if self.envelope else undelivered)
@@ -16,18 +16,24 @@
 """
 
 import abc
+import collections
 import itertools
 import operator
+import os
+import random
+import time
 
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
+from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
 from oslo_utils import excutils
 import six
 import six.moves.urllib.parse as urlparse
 
-from ceilometer.i18n import _, _LE, _LI
+from ceilometer.i18n import _, _LE, _LI, _LW
+from ceilometer import instrumentation
 from ceilometer import messaging
 from ceilometer import publisher
 from ceilometer.publisher import utils
@@ -60,19 +66,54 @@ cfg.CONF.import_opt('host', 'ceilometer.service')
 
 
 class DeliveryFailure(Exception):
-    def __init__(self, message=None, cause=None):
+    """The data could not be sent.
+
+    :param undelivered: the part of the data which was not sent, None
+                        meaning all of it.
+    """
+
+    def __init__(self, message=None, cause=None, undelivered=None):
         super(DeliveryFailure, self).__init__(message)
         self.cause = cause
+        self.undelivered = undelivered
 
 
-def raise_delivery_failure(exc):
+def raise_delivery_failure(exc, undelivered=None):
     excutils.raise_with_cause(DeliveryFailure,
                               encodeutils.exception_to_unicode(exc),
-                              cause=exc)
+                              cause=exc, undelivered=undelivered)
+
+
+# seconds, the retries of the default policy wait a random delay of up to
+# RETRY_DELAY * 2 ** retry, capped to MAX_RETRY_DELAY, and stop after
+# MAX_RETRY_TIME in a publication
+RETRY_DELAY = 0.1
+MAX_RETRY_DELAY = 5
+MAX_RETRY_TIME = 10
+
+# bytes written to a spill segment before starting a new one
+SEGMENT_SIZE = 4 * 1024 * 1024
 
 
 @six.add_metaclass(abc.ABCMeta)
 class MessagingPublisher(publisher.PublisherBase):
+    """Base of the publishers sending the data through a message bus.
+
+    The policy field of the URL sets what is done when the data can't be
+    sent: default retries up to max_retry times then raises, drop drops the
+    data and queue keeps it in a local queue, sent before any new data on
+    the next publication. The retries of the default policy back off and
+    don't block a publication for more than MAX_RETRY_TIME seconds, the
+    data still not sent by then is kept in the local queue too.
+
+    The local queue is bounded by max_queue_length batches (1024 by
+    default), max_queue_samples datapoints and max_queue_bytes bytes of
+    JSON, 0 meaning no limit. Beyond them, the oldest batches are dropped
+    or, when spill_dir is set, written to segment files of that directory,
+    dedicated to the publisher, which are replayed, oldest first, once the
+    bus is back, even after a restart. max_spill_bytes bounds the size of
+    the segments, the oldest ones being dropped beyond it.
+    """
 
     def __init__(self, parsed_url):
         options = urlparse.parse_qs(parsed_url.query)
@@ -85,9 +126,21 @@ class MessagingPublisher(publisher.PublisherBase):
         self.policy = options.get('policy', ['default'])[-1]
         self.max_queue_length = int(options.get(
             'max_queue_length', [1024])[-1])
+        self.max_queue_samples = int(options.get(
+            'max_queue_samples', [0])[-1])
+        self.max_queue_bytes = int(options.get('max_queue_bytes', [0])[-1])
+        self.spill_dir = options.get('spill_dir', [None])[-1]
+        self.max_spill_bytes = int(options.get('max_spill_bytes', [0])[-1])
         self.max_retry = 0
 
-        self.local_queue = []
+        # (topic, data, size in bytes) tuples, the size is only computed
+        # when the queue is bounded in bytes
+        self.local_queue = collections.deque()
+        self.queue_samples = 0
+        self.queue_bytes = 0
+        # the credentials of the URL are not exposed in the statistics
+        self.stats_name = 'publisher.%s.%s' % (
+            type(self).__name__, parsed_url.hostname or 'default')
 
         if self.policy in ['default', 'queue', 'drop']:
             LOG.info(_LI('Publishing policy set to %s'), self.policy)
@@ -96,8 +149,45 @@ class MessagingPublisher(publisher.PublisherBase):
                           'default'), self.policy)
             self.policy = 'default'
 
+        if self.spill_dir and self.policy == 'drop':
+            LOG.warning(_LW('spill_dir is not used by the drop policy'))
+            self.spill_dir = None
+        # the spill segments, oldest first, the directory is only listed at
+        # startup to replay the ones of a previous run
+        self.segments = []
+        # offset of the first line of the oldest segment not replayed yet
+        self.segment_offset = 0
+        if self.spill_dir:
+            if not os.path.isdir(self.spill_dir):
+                os.makedirs(self.spill_dir)
+            self.segments = [os.path.join(self.spill_dir, n) for n in
+                             sorted(os.listdir(self.spill_dir))
+                             if n.endswith('.segment')]
+
         self.retry = 1 if self.policy in ['queue', 'drop'] else None
 
+    def _enqueue(self, topic, data):
+        size = len(jsonutils.dumps(data)) if self.max_queue_bytes else 0
+        self.local_queue.append((topic, data, size))
+        self.queue_samples += len(data)
+        self.queue_bytes += size
+
+    def _dequeued(self, data, size):
+        self.queue_samples -= len(data)
+        self.queue_bytes -= size
+
+    def _undelivered(self, queue, failure):
+        """Keep only the undelivered part of the head of the queue."""
+        topic, data, size = queue[0]
+        if failure.undelivered is None or failure.undelivered is data:
+            return
+        self._dequeued(data, size)
+        data = failure.undelivered
+        size = len(jsonutils.dumps(data)) if self.max_queue_bytes else 0
+        queue[0] = (topic, data, size)
+        self.queue_samples += len(data)
+        self.queue_bytes += size
+
     def publish_samples(self, samples):
         """Publish samples on RPC.
 
@@ -105,13 +195,10 @@ class MessagingPublisher(publisher.PublisherBase):
 
         """
 
-        meters = [
-            utils.meter_message_from_counter(
-                sample, cfg.CONF.publisher.telemetry_secret)
-            for sample in samples
-        ]
+        meters = utils.meter_messages_from_counters(
+            samples, cfg.CONF.publisher.telemetry_secret)
         topic = cfg.CONF.publisher_notifier.metering_topic
-        self.local_queue.append((topic, meters))
+        self._enqueue(topic, meters)
 
         if self.per_meter_topic:
             for meter_name, meter_list in itertools.groupby(
@@ -121,7 +208,7 @@ class MessagingPublisher(publisher.PublisherBase):
                 topic_name = topic + '.' + meter_name
                 LOG.debug('Publishing %(m)d samples on %(n)s',
                           {'m': len(meter_list), 'n': topic_name})
-                self.local_queue.append((topic_name, meter_list))
+                self._enqueue(topic_name, meter_list)
 
         self.flush()
 
@@ -132,28 +219,156 @@ class MessagingPublisher(publisher.PublisherBase):
         # self.local_queue after in case of another call having already added
         # something in the self.local_queue
         queue = self.local_queue
-        self.local_queue = []
-        self.local_queue = (self._process_queue(queue, self.policy) +
-                            self.local_queue)
-        if self.policy == 'queue':
+        self.local_queue = collections.deque()
+        if self.segments and not self._replay_segments():
+            # the spilled data is older, it must be sent first
+            remaining = queue
+        else:
+            remaining = self._process_queue(queue, self.policy)
+        remaining.extend(self.local_queue)
+        self.local_queue = remaining
+        if self.local_queue:
             self._check_queue_length()
+        self._record_queue_depth()
+
+    def _queue_exceeded(self):
+        return (len(self.local_queue) > self.max_queue_length > 0 or
+                self.queue_samples > self.max_queue_samples > 0 or
+                self.queue_bytes > self.max_queue_bytes > 0)
 
     def _check_queue_length(self):
-        queue_length = len(self.local_queue)
-        if queue_length > self.max_queue_length > 0:
-            count = queue_length - self.max_queue_length
-            self.local_queue = self.local_queue[count:]
-            LOG.warning(_("Publisher max local_queue length is exceeded, "
-                        "dropping %d oldest samples") % count)
+        overflow = []
+        while self.local_queue and self._queue_exceeded():
+            topic, data, size = self.local_queue.popleft()
+            self._dequeued(data, size)
+            overflow.append((topic, data))
+        if not overflow:
+            return
+        if self.spill_dir and self._spill(overflow):
+            return
+        count = sum(len(data) for __, data in overflow)
+        instrumentation.STATS.incr(self.stats_name, 'dropped', count)
+        LOG.warning(_("Publisher max local_queue length is exceeded, "
+                    "dropping %d oldest samples") % count)
+
+    def _record_queue_depth(self):
+        stats = instrumentation.STATS
+        stats.gauge(self.stats_name, 'queue_length', len(self.local_queue))
+        stats.gauge(self.stats_name, 'queue_samples', self.queue_samples)
+        if self.max_queue_bytes:
+            stats.gauge(self.stats_name, 'queue_bytes', self.queue_bytes)
+
+    def _spill(self, batches):
+        """Append batches to the newest segment, return True if written."""
+        segments = self.segments
+        if segments and os.path.getsize(segments[-1]) < SEGMENT_SIZE:
+            path = segments[-1]
+        else:
+            # names made of the time sort in order and survive restarts
+            path = os.path.join(self.spill_dir,
+                                '%020d.segment' % int(time.time() * 10 ** 6))
+        try:
+            with open(path, 'a') as f:
+                for topic, data in batches:
+                    f.write(jsonutils.dumps([topic, data]) + '\n')
+        except (IOError, OSError, TypeError):
+            LOG.exception(_LE('Unable to spill the local queue to %s'), path)
+            return False
+        if not segments or segments[-1] != path:
+            segments.append(path)
+        count = sum(len(data) for __, data in batches)
+        instrumentation.STATS.incr(self.stats_name, 'spilled', count)
+        LOG.warning(_LW('Publisher max local_queue length is exceeded, '
+                        'spilling %(count)d oldest samples to %(path)s'),
+                    {'count': count, 'path': path})
+        self._check_spill_size()
+        return True
+
+    def _check_spill_size(self):
+        if not self.max_spill_bytes:
+            return
+        segments = self.segments
+        sizes = [os.path.getsize(s) for s in segments]
+        while len(segments) > 1 and sum(sizes) > self.max_spill_bytes:
+            LOG.warning(_LW('Publisher max spill size is exceeded, dropping '
+                            'the oldest segment %s'), segments[0])
+            instrumentation.STATS.incr(self.stats_name, 'dropped_segments')
+            os.remove(segments.pop(0))
+            sizes.pop(0)
+            self.segment_offset = 0
+
+    def _replay_segments(self):
+        """Send the spilled batches, return True if they all were sent."""
+        while self.segments:
+            path = self.segments[0]
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(self.segment_offset)
+                    if not self._replay_segment(path, f):
+                        return False
+                os.remove(path)
+            except (IOError, OSError):
+                LOG.exception(_LE('Unable to replay the spill segment %s, '
+                                  'dropping it'), path)
+                instrumentation.STATS.incr(self.stats_name,
+                                           'dropped_segments')
+            self.segments.pop(0)
+            self.segment_offset = 0
+        return True
+
+    def _replay_segment(self, path, f):
+        """Send the batches of a segment from the current offset.
+
+        The offset moves past the batches sent, so the outage of the bus
+        only costs reading the next batch, the segment is only rewritten
+        when a batch was partly delivered. The batches sent before a
+        restart may be sent again.
+        """
+        for line in iter(f.readline, b''):
+            try:
+                topic, data = jsonutils.loads(line)
+            except ValueError:
+                LOG.warning(_LW('Ignoring an invalid line of the spill '
+                                'segment %s'), path)
+                self.segment_offset = f.tell()
+                continue
+            try:
+                self._send(topic, data)
+            except DeliveryFailure as e:
+                LOG.warning(_LW('Failed to replay the spilled samples '
+                                'of %s, keep them'), path)
+                if e.undelivered is not None and e.undelivered is not data:
+                    self._rewrite_segment(path, [jsonutils.dump_as_bytes(
+                        [topic, e.undelivered]) + b'\n', f.read()])
+                return False
+            self.segment_offset = f.tell()
+            instrumentation.STATS.incr(self.stats_name, 'replayed',
+                                       len(data))
+        return True
+
+    def _rewrite_segment(self, path, chunks):
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.writelines(chunks)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            # the whole batch is sent again on the next replay
+            LOG.exception(_LE('Unable to rewrite the spill segment %s'),
+                          path)
+            return
+        self.segment_offset = 0
 
     def _process_queue(self, queue, policy):
         current_retry = 0
+        deadline = time.time() + MAX_RETRY_TIME
         while queue:
-            topic, data = queue[0]
+            topic, data, size = queue[0]
             try:
                 self._send(topic, data)
-            except DeliveryFailure:
-                data = sum([len(m) for __, m in queue])
+            except DeliveryFailure as e:
+                self._undelivered(queue, e)
+                data = sum([len(m) for __, m, __ in queue])
                 if policy == 'queue':
                     LOG.warning(_("Failed to publish %d datapoints, queue "
                                   "them"), data)
@@ -161,15 +376,34 @@ class MessagingPublisher(publisher.PublisherBase):
                 elif policy == 'drop':
                     LOG.warning(_("Failed to publish %d datapoints, "
                                 "dropping them"), data)
-                    return []
+                    for __, m, s in queue:
+                        self._dequeued(m, s)
+                    instrumentation.STATS.incr(self.stats_name, 'dropped',
+                                               data)
+                    return collections.deque()
                 current_retry += 1
                 if current_retry >= self.max_retry:
+                    for __, m, s in queue:
+                        self._dequeued(m, s)
                     LOG.exception(_LE("Failed to retry to send sample data "
                                       "with max_retry times"))
                     raise
+                # back off, with jitter so that the agents retry at
+                # different times instead of hammering the broker together
+                delay = random.uniform(0, min(
+                    MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (current_retry - 1)))
+                if time.time() + delay > deadline:
+                    # NOTE: don't stall the pipeline, the next publication
+                    # retries first.
+                    LOG.warning(_LW("Failed to publish %d datapoints for "
+                                    "too long, queue them"), data)
+                    return queue
+                time.sleep(delay)
+                instrumentation.STATS.incr(self.stats_name, 'retries')
             else:
-                queue.pop(0)
-        return []
+                queue.popleft()
+                self._dequeued(data, size)
+        return queue
 
     def publish_events(self, events):
         """Send an event message for publishing
@@ -180,7 +414,7 @@ class MessagingPublisher(publisher.PublisherBase):
             event, cfg.CONF.publisher.telemetry_secret) for event in events]
 
         topic = cfg.CONF.publisher_notifier.event_topic
-        self.local_queue.append((topic, ev_list))
+        self._enqueue(topic, ev_list)
         self.flush()
 
     @abc.abstractmethod
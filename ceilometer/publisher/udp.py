@@ -15,12 +15,14 @@
 """Publish a sample using an UDP mechanism
 """
 
+import logging
 import socket
 
 import msgpack
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import netutils
+from six.moves.urllib import parse as urlparse
 
 import ceilometer
 from ceilometer.i18n import _, _LW
@@ -34,10 +36,22 @@ LOG = log.getLogger(__name__)
 
 
 class UDPPublisher(publisher.PublisherBase):
+    """Publisher sending the samples over UDP to a collector.
+
+    The publisher sends one sample per datagram by default. To pack several
+    samples into a single datagram, which only collectors of this release
+    or later understand, the maximum size of a datagram must be set::
+
+      - udp://collector:4952?max_datagram_size=1400
+    """
+
     def __init__(self, parsed_url):
         self.host, self.port = netutils.parse_host_port(
             parsed_url.netloc,
             default_port=cfg.CONF.collector.udp_port)
+        options = urlparse.parse_qs(parsed_url.query)
+        self.max_datagram_size = int(
+            options.get('max_datagram_size', [0])[-1])
         addrinfo = None
         try:
             addrinfo = socket.getaddrinfo(self.host, None, socket.AF_INET6,
@@ -64,17 +78,22 @@ class UDPPublisher(publisher.PublisherBase):
         :param samples: Samples from pipeline after transformation
         """
 
-        for sample in samples:
-            msg = utils.meter_message_from_counter(
-                sample, cfg.CONF.publisher.telemetry_secret)
-            host = self.host
-            port = self.port
-            LOG.debug("Publishing sample %(msg)s over UDP to "
-                      "%(host)s:%(port)d", {'msg': msg, 'host': host,
-                                            'port': port})
+        msgs = utils.meter_messages_from_counters(
+            samples, cfg.CONF.publisher.telemetry_secret)
+        if self.max_datagram_size:
+            datagrams = utils.pack_udp_datagrams(msgs, self.max_datagram_size)
+        else:
+            datagrams = [(msgpack.dumps(msg), 1) for msg in msgs]
+
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        for data, count in datagrams:
+            if debug:
+                LOG.debug("Publishing %(count)d samples over UDP to "
+                          "%(host)s:%(port)d", {'count': count,
+                                                'host': self.host,
+                                                'port': self.port})
             try:
-                self.socket.sendto(msgpack.dumps(msg),
-                                   (self.host, self.port))
+                self.socket.sendto(data, (self.host, self.port))
             except Exception as e:
                 LOG.warning(_("Unable to send sample over UDP"))
                 LOG.exception(e)
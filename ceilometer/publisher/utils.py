@@ -15,9 +15,12 @@
 """Utils for publishers
 """
 
+import base64
 import hashlib
 import hmac
+import json
 
+import msgpack
 from oslo_config import cfg
 import six
 
@@ -36,17 +39,46 @@ OPTS = [
                                 cfg.DeprecatedOpt("metering_secret",
                                                   "publisher")]
                ),
+    cfg.IntOpt('telemetry_signature_version',
+               default=1,
+               min=1,
+               max=2,
+               help='Version of the signature computed for published '
+                    'messages. Version 1 hashes every flattened key and '
+                    'value of the message, version 2 hashes a single '
+                    'canonical serialization of it and is much cheaper for '
+                    'large metadata. Signatures of both versions are always '
+                    'verified, so all consumers must be upgraded before '
+                    'publishers switch to version 2.'),
 ]
 cfg.CONF.register_opts(OPTS, group="publisher")
 
 
-def compute_signature(message, secret):
-    """Return the signature for a message dictionary."""
-    if not secret:
-        return ''
+SIGNATURE_V2_PREFIX = 'v2:'
 
-    if isinstance(secret, six.text_type):
-        secret = secret.encode('utf-8')
+
+def _canonical_json(data):
+    try:
+        return json.dumps(data, sort_keys=True, separators=(',', ':'),
+                          default=six.text_type)
+    except TypeError:
+        # NOTE: keys of mixed types can't be sorted, but they are all
+        # strings once the message has been through the bus anyway.
+        return _canonical_json(json.loads(json.dumps(
+            data, default=six.text_type)))
+
+
+def compute_metadata_digest(metadata):
+    """Return the digest of a resource metadata for version 2 signatures.
+
+    It can be computed once and passed to compute_signature for all the
+    messages sharing the same metadata.
+    """
+    return hashlib.sha256(
+        _canonical_json(metadata).encode('utf-8')).hexdigest()
+
+
+def _compute_signature_v1(message, secret):
     digest_maker = hmac.new(secret, b'', hashlib.sha256)
     for name, value in utils.recursive_keypairs(message):
         if name == 'message_signature':
@@ -58,6 +90,42 @@ def compute_signature(message, secret):
     return digest_maker.hexdigest()
 
 
+def _compute_signature_v2(message, secret, metadata_digest=None):
+    content = dict((k, v) for k, v in six.iteritems(message)
+                   if k not in ('message_signature', 'resource_metadata'))
+    digest_maker = hmac.new(secret, _canonical_json(content).encode('utf-8'),
+                            hashlib.sha256)
+    if 'resource_metadata' in message:
+        if metadata_digest is None:
+            metadata_digest = compute_metadata_digest(
+                message['resource_metadata'])
+        digest_maker.update(metadata_digest.encode('ascii'))
+    # NOTE: the version is carried by the signature itself rather than by
+    # another message field, as messages are stored as is by some backends.
+    # It is base64 encoded so that it still fits in 64 characters.
+    signature = base64.urlsafe_b64encode(digest_maker.digest()).rstrip(b'=')
+    return SIGNATURE_V2_PREFIX + signature.decode('ascii')
+
+
+def compute_signature(message, secret, version=1, metadata_digest=None):
+    """Return the signature for a message dictionary.
+
+    :param message: the message to sign.
+    :param secret: the secret the message is signed with.
+    :param version: the version of the signature to compute.
+    :param metadata_digest: for version 2, the precomputed digest of the
+                            message resource metadata, if any.
+    """
+    if not secret:
+        return ''
+
+    if isinstance(secret, six.text_type):
+        secret = secret.encode('utf-8')
+    if version == 2:
+        return _compute_signature_v2(message, secret, metadata_digest)
+    return _compute_signature_v1(message, secret)
+
+
 def besteffort_compare_digest(first, second):
     """Returns True if both string inputs are equal, otherwise False.
 
@@ -88,17 +156,13 @@ else:
     compare_digest = besteffort_compare_digest
 
 
-def verify_signature(message, secret):
-    """Check the signature in the message.
-
-    Message is verified against the value computed from the rest of the
-    contents.
-    """
-    if not secret:
-        return True
-
+def _verify_signature(message, secret):
     old_sig = message.get('message_signature', '')
-    new_sig = compute_signature(message, secret)
+    version = 1
+    if (isinstance(old_sig, six.string_types) and
+            old_sig.startswith(SIGNATURE_V2_PREFIX)):
+        version = 2
+    new_sig = compute_signature(message, secret, version)
 
     if isinstance(old_sig, six.text_type):
         try:
@@ -111,11 +175,47 @@ def verify_signature(message, secret):
     return compare_digest(new_sig, old_sig)
 
 
-def meter_message_from_counter(sample, secret):
+def verify_signature(message, secret):
+    """Check the signature in the message.
+
+    Message is verified against the value computed from the rest of the
+    contents.
+    """
+    if not secret:
+        return True
+    return _verify_signature(message, secret)
+
+
+def verify_signatures(messages, secret):
+    """Return the messages of a batch whose signature is valid.
+
+    The secret is only prepared once for the whole batch, and nothing is
+    checked when it is empty.
+    """
+    if not secret:
+        return list(messages)
+    if isinstance(secret, six.text_type):
+        secret = secret.encode('utf-8')
+    return [m for m in messages if _verify_signature(m, secret)]
+
+
+def _signature_version(version):
+    if version is None:
+        return cfg.CONF.publisher.telemetry_signature_version
+    return version
+
+
+def meter_message_from_counter(sample, secret, version=None,
+                               metadata_digests=None):
     """Make a metering message ready to be published or stored.
 
     Returns a dictionary containing a metering message
     for a notification message and a Sample instance.
+
+    :param version: the signature version, defaults to the configured one.
+    :param metadata_digests: an optional dict used to share the resource
+                             metadata digests between the samples of a
+                             batch which reference the same metadata.
     """
     msg = {'source': sample.source,
            'counter_name': sample.name,
@@ -129,15 +229,98 @@ def meter_message_from_counter(sample, secret):
            'resource_metadata': sample.resource_metadata,
            'message_id': sample.id,
            }
-    msg['message_signature'] = compute_signature(msg, secret)
+    version = _signature_version(version)
+    metadata_digest = None
+    if secret and version == 2 and metadata_digests is not None:
+        # NOTE: keyed by identity, so it is only valid while the samples of
+        # the batch, and so their metadata, are alive and left untouched.
+        key = id(sample.resource_metadata)
+        metadata_digest = metadata_digests.get(key)
+        if metadata_digest is None:
+            metadata_digest = compute_metadata_digest(
+                sample.resource_metadata)
+            metadata_digests[key] = metadata_digest
+    msg['message_signature'] = compute_signature(msg, secret, version,
+                                                 metadata_digest)
     return msg
 
 
-def message_from_event(event, secret):
+def meter_messages_from_counters(samples, secret, version=None):
+    """Make the metering messages of a batch of samples.
+
+    The signature version is only looked up once, and the resource metadata
+    digests are shared by the samples of the batch.
+    """
+    version = _signature_version(version)
+    metadata_digests = {}
+    return [meter_message_from_counter(sample, secret, version,
+                                       metadata_digests)
+            for sample in samples]
+
+
+# NOTE: several metering messages sent in a single UDP datagram are wrapped
+# in an envelope, a message sent alone is not.
+UDP_ENVELOPE_VERSION = 1
+
+
+def pack_udp_datagrams(messages, max_size):
+    """Pack metering messages into as few UDP datagrams as possible.
+
+    :param messages: the metering messages.
+    :param max_size: maximum size of a datagram in bytes, a message bigger
+                     than that is still sent alone in its own datagram.
+    :return: the list of datagrams, and the number of messages of each.
+    """
+    packer = msgpack.Packer()
+    prefix = (packer.pack_map_header(2) +
+              packer.pack('envelope') + packer.pack(UDP_ENVELOPE_VERSION) +
+              packer.pack('samples'))
+    # the array header takes up to 5 bytes
+    max_size -= len(prefix) + 5
+
+    datagrams = []
+
+    def pack(batch):
+        if len(batch) == 1:
+            datagrams.append((batch[0], 1))
+        else:
+            datagrams.append((prefix + packer.pack_array_header(len(batch)) +
+                              b''.join(batch), len(batch)))
+
+    batch = []
+    size = 0
+    for msg in messages:
+        data = packer.pack(msg)
+        if batch and size + len(data) > max_size:
+            pack(batch)
+            batch = []
+            size = 0
+        batch.append(data)
+        size += len(data)
+    if batch:
+        pack(batch)
+    return datagrams
+
+
+def unpack_udp_payload(payload):
+    """Return the metering messages of a decoded UDP datagram.
+
+    :raises ValueError: if the version of the envelope is not supported.
+    """
+    if isinstance(payload, dict) and 'envelope' in payload:
+        if payload['envelope'] != UDP_ENVELOPE_VERSION:
+            raise ValueError('Unsupported envelope version %s' %
+                             payload['envelope'])
+        return payload['samples']
+    return [payload]
+
+
+def message_from_event(event, secret, version=None):
     """Make an event message ready to be published or stored.
 
     Returns a serialized model of Event containing an event message
     """
     msg = event.serialize()
-    msg['message_signature'] = compute_signature(msg, secret)
+    msg['message_signature'] = compute_signature(
+        msg, secret, _signature_version(version))
     return msg
@@ -25,6 +25,7 @@ import uuid
 
 from oslo_config import cfg
 from oslo_utils import timeutils
+import six
 
 OPTS = [
     cfg.StrOpt('sample_source',
@@ -35,6 +36,15 @@ OPTS = [
 cfg.CONF.register_opts(OPTS)
 
 
+def _intern(value):
+    # NOTE: the names, units, types and sources come from a small set but are
+    # decoded again for each message, share them. Only native strings can be
+    # interned.
+    if isinstance(value, str):
+        return six.moves.intern(value)
+    return value
+
+
 # Fields explanation:
 #
 # Source: the source of this sample
@@ -53,23 +63,31 @@ cfg.CONF.register_opts(OPTS)
 # id: an uuid of a sample, can be taken from API  when post sample via API
 class Sample(object):
 
+    FIELDS = ('name', 'type', 'unit', 'volume', 'user_id', 'project_id',
+              'resource_id', 'timestamp', 'resource_metadata', 'source', 'id')
+
+    # NOTE: agents can hold a lot of samples at once during bursts, so they
+    # don't carry a per instance __dict__.
+    __slots__ = FIELDS + ('_iso_timestamp',)
+
     def __init__(self, name, type, unit, volume, user_id, project_id,
                  resource_id, timestamp=None, resource_metadata=None,
                  source=None, id=None):
-        self.name = name
-        self.type = type
-        self.unit = unit
+        self.name = _intern(name)
+        self.type = _intern(type)
+        self.unit = _intern(unit)
         self.volume = volume
         self.user_id = user_id
         self.project_id = project_id
         self.resource_id = resource_id
         self.timestamp = timestamp
         self.resource_metadata = resource_metadata or {}
-        self.source = source or cfg.CONF.sample_source
+        self.source = _intern(source or cfg.CONF.sample_source)
         self.id = id or str(uuid.uuid1())
+        self._iso_timestamp = None
 
     def as_dict(self):
-        return copy.copy(self.__dict__)
+        return dict((k, getattr(self, k)) for k in Sample.FIELDS)
 
     def __repr__(self):
         return '<name: %s, volume: %s, resource_id: %s, timestamp: %s>' % (
@@ -100,7 +118,14 @@ class Sample(object):
         self.timestamp = timestamp
 
     def get_iso_timestamp(self):
-        return timeutils.parse_isotime(self.timestamp)
+        # NOTE: the parsed timestamp is cached along with the value it was
+        # parsed from, as the timestamp may be set again afterwards.
+        cached = self._iso_timestamp
+        if cached is None or cached[0] is not self.timestamp:
+            cached = (self.timestamp,
+                      timeutils.parse_isotime(self.timestamp))
+            self._iso_timestamp = cached
+        return cached[1]
 
 
 TYPE_GAUGE = 'gauge'
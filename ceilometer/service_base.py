@@ -20,6 +20,7 @@ from oslo_log import log
 import six
 
 from ceilometer.i18n import _LE
+from ceilometer import instrumentation
 from ceilometer import pipeline
 from ceilometer import utils
 
@@ -49,10 +50,18 @@ class PipelineBasedService(cotyledon.Service):
                 spacing=self.conf.pipeline_polling_interval)
             utils.spawn_thread(self.refresh_pipeline_periodic.start)
 
+    def init_pipeline_stats(self):
+        """Initializes the recording and the dumps of pipeline statistics."""
+        self.pipeline_stats_periodic = instrumentation.start_dumps(
+            self.conf, self.worker_id)
+
     def terminate(self):
         if self.refresh_pipeline_periodic:
             self.refresh_pipeline_periodic.stop()
             self.refresh_pipeline_periodic.wait()
+        if getattr(self, 'pipeline_stats_periodic', None):
+            self.pipeline_stats_periodic.stop()
+            self.pipeline_stats_periodic.wait()
 
     @abc.abstractmethod
     def reload_pipeline(self):
@@ -77,7 +86,7 @@ class PipelineBasedService(cotyledon.Service):
                     # Pipeline in the notification agent.
                     if hasattr(self, 'pipeline_manager'):
                         self.pipeline_manager = pipeline.setup_pipeline(
-                            self.conf)
+                            self.conf, worker_id=self.worker_id)
                     # Polling in the polling agent.
                     elif hasattr(self, 'polling_manager'):
                         self.polling_manager = pipeline.setup_polling(
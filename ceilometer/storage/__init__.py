@@ -16,6 +16,7 @@
 """
 
 from oslo_config import cfg
+from oslo_config import types
 from oslo_db import options as db_options
 from oslo_log import log
 import retrying
@@ -52,6 +53,26 @@ OPTS = [
                 help="Indicates if expirer expires only samples. If set true,"
                 " expired samples will be deleted, but residual"
                 " resource and meter definition data will remain."),
+    cfg.IntOpt('sql_id_cache_size',
+               default=10000,
+               min=0,
+               help="Maximum number of meter and resource ids cached by "
+               "each SQL connection to avoid looking them up when "
+               "recording samples (0 disables the cache)."),
+    cfg.IntOpt('sql_id_cache_ttl',
+               default=3600,
+               help="Number of seconds a meter or resource id stays in the "
+               "SQL id cache (<= 0 means forever)."),
+    cfg.ListOpt('sql_rollup_granularities',
+                default=[],
+                item_type=types.Integer(min=1),
+                help="Granularities, in seconds, of the rollups of samples "
+                "maintained by the SQL backend when recording samples, "
+                "e.g. 300,3600,86400. Statistics are computed from the "
+                "coarsest rollup matching the requested period and time "
+                "range, starting from the time the granularity was first "
+                "enabled. All the collectors must share this setting. "
+                "(empty disables rollups)"),
 ]
 
 cfg.CONF.register_opts(OPTS, group='database')
@@ -14,8 +14,11 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import calendar
+import copy
 import datetime
 import hashlib
+import math
 import os
 
 from oslo_config import cfg
@@ -53,6 +56,16 @@ STANDARD_AGGREGATES = dict(
     count=func.count(models.Sample.volume).label('count')
 )
 
+ROLLUP_AGGREGATES = dict(
+    avg=(func.sum(models.SampleRollup.volume_sum)
+         / func.sum(models.SampleRollup.sample_count)).label('avg'),
+    sum=func.sum(models.SampleRollup.volume_sum).label('sum'),
+    min=func.min(models.SampleRollup.volume_min).label('min'),
+    max=func.max(models.SampleRollup.volume_max).label('max'),
+    count=cast(func.sum(models.SampleRollup.sample_count),
+               sa.Integer).label('count')
+)
+
 UNPARAMETERIZED_AGGREGATES = dict(
     stddev=func.stddev_pop(models.Sample.volume).label('stddev')
 )
@@ -231,6 +244,18 @@ class Connection(base.Connection):
         for opt in storage.OPTS:
             options.pop(opt.name, None)
         self._engine_facade = db_session.EngineFacade(url, **options)
+        # caches of meter and resource ids, keyed respectively by
+        # (name, type, unit) and by (resource_id, user_id, project_id,
+        # source_id, metadata_hash)
+        cache_size = cfg.CONF.database.sql_id_cache_size
+        cache_ttl = cfg.CONF.database.sql_id_cache_ttl
+        self._meter_cache = utils.LRUCache(cache_size, cache_ttl)
+        self._resource_cache = utils.LRUCache(cache_size, cache_ttl)
+        # rollup granularities, coarsest first, and the start of their
+        # complete periods once known
+        self._rollup_granularities = sorted(
+            set(cfg.CONF.database.sql_rollup_granularities), reverse=True)
+        self._rollup_since = {}
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
@@ -253,6 +278,7 @@ class Connection(base.Connection):
             migration.db_sync(engine, path)
 
     def clear(self):
+        self._clear_id_caches()
         engine = self._engine_facade.get_engine()
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
@@ -260,7 +286,6 @@ class Connection(base.Connection):
 
     @staticmethod
     def _create_meter(conn, name, type, unit):
-        # TODO(gordc): implement lru_cache to improve performance
         try:
             meter = models.Meter.__table__
             trans = conn.begin_nested()
@@ -284,59 +309,140 @@ class Connection(base.Connection):
         return meter_id
 
     @staticmethod
-    def _create_resource(conn, res_id, user_id, project_id, source_id,
-                         rmeta):
-        # TODO(gordc): implement lru_cache to improve performance
+    def _metadata_hash(rmeta):
+        m_hash = jsonutils.dumps(rmeta, sort_keys=True)
+        if six.PY3:
+            m_hash = m_hash.encode('utf-8')
+        return hashlib.md5(m_hash).hexdigest()
+
+    @staticmethod
+    def _metadata_rows(internal_id, rmeta, meta_map):
+        """Collect the typed metadata rows of a resource into meta_map."""
+        if not rmeta or not isinstance(rmeta, dict):
+            return
+        for key, v in utils.dict_to_keyval(rmeta):
+            try:
+                _model = sql_utils.META_TYPE_MAP[type(v)]
+                meta_map.setdefault(_model, []).append(
+                    {'id': internal_id, 'meta_key': key, 'value': v})
+            except KeyError:
+                LOG.warning(_("Unknown metadata type. Key "
+                              "(%s) will not be queryable."), key)
+
+    @staticmethod
+    def _lookup_meters(conn, keys):
+        """Return a dict of (name, type, unit) to id for existing meters."""
+        meter = models.Meter.__table__
+        names = list(set(k[0] for k in keys))
+        rows = conn.execute(
+            sa.select([meter.c.id, meter.c.name, meter.c.type, meter.c.unit])
+            .where(meter.c.name.in_(names)))
+        found = {}
+        for row in rows:
+            key = (row.name, row.type, row.unit)
+            if key in keys:
+                found[key] = row.id
+        return found
+
+    @staticmethod
+    def _create_meters(conn, keys):
+        """Resolve meter ids for a set of (name, type, unit) keys.
+
+        Known meters are looked up with a single query and the missing ones
+        are inserted with one executemany.
+        """
+        meter_ids = Connection._lookup_meters(conn, keys)
+        missing = [k for k in keys if k not in meter_ids]
+        if not missing:
+            return meter_ids
         try:
-            res = models.Resource.__table__
-            m_hash = jsonutils.dumps(rmeta, sort_keys=True)
-            if six.PY3:
-                m_hash = m_hash.encode('utf-8')
-            m_hash = hashlib.md5(m_hash).hexdigest()
             trans = conn.begin_nested()
             if conn.dialect.name == 'sqlite':
                 trans = conn.begin()
             with trans:
-                res_row = conn.execute(
-                    sa.select([res.c.internal_id])
-                    .where(sa.and_(res.c.resource_id == res_id,
-                                   res.c.user_id == user_id,
-                                   res.c.project_id == project_id,
-                                   res.c.source_id == source_id,
-                                   res.c.metadata_hash == m_hash))).first()
-                internal_id = res_row[0] if res_row else None
-                if internal_id is None:
-                    result = conn.execute(res.insert(), resource_id=res_id,
-                                          user_id=user_id,
-                                          project_id=project_id,
-                                          source_id=source_id,
-                                          resource_metadata=rmeta,
-                                          metadata_hash=m_hash)
-                    internal_id = result.inserted_primary_key[0]
-                    if rmeta and isinstance(rmeta, dict):
-                        meta_map = {}
-                        for key, v in utils.dict_to_keyval(rmeta):
-                            try:
-                                _model = sql_utils.META_TYPE_MAP[type(v)]
-                                if meta_map.get(_model) is None:
-                                    meta_map[_model] = []
-                                meta_map[_model].append(
-                                    {'id': internal_id, 'meta_key': key,
-                                     'value': v})
-                            except KeyError:
-                                LOG.warning(_("Unknown metadata type. Key "
-                                              "(%s) will not be queryable."),
-                                            key)
-                        for _model in meta_map.keys():
-                            conn.execute(_model.__table__.insert(),
-                                         meta_map[_model])
-
+                conn.execute(models.Meter.__table__.insert(),
+                             [{'name': name, 'type': type, 'unit': unit}
+                              for name, type, unit in missing])
         except dbexc.DBDuplicateEntry:
-            # retry function to pick up duplicate committed object
-            internal_id = Connection._create_resource(
-                conn, res_id, user_id, project_id, source_id, rmeta)
+            # another writer created some of them concurrently, fallback
+            # on the row by row path to pick up the committed objects
+            for key in missing:
+                meter_ids[key] = Connection._create_meter(conn, *key)
+        else:
+            meter_ids.update(Connection._lookup_meters(conn, set(missing)))
+        return meter_ids
 
-        return internal_id
+    @staticmethod
+    def _create_resources(conn, resources):
+        """Resolve resource internal ids for a dict of keys to metadata.
+
+        Keys are (resource_id, user_id, project_id, source_id,
+        metadata_hash) tuples. Known resources are looked up with a single
+        query, the metadata rows of the missing ones are inserted with one
+        executemany per metadata table.
+        """
+        res = models.Resource.__table__
+        rows = conn.execute(
+            sa.select([res.c.internal_id, res.c.resource_id, res.c.user_id,
+                       res.c.project_id, res.c.source_id,
+                       res.c.metadata_hash])
+            .where(sa.and_(
+                res.c.resource_id.in_(list(set(k[0] for k in resources))),
+                res.c.metadata_hash.in_(list(set(k[4] for k in resources))))))
+        internal_ids = {}
+        for row in rows:
+            key = (row.resource_id, row.user_id, row.project_id,
+                   row.source_id, row.metadata_hash)
+            if key in resources:
+                internal_ids[key] = row.internal_id
+
+        meta_map = {}
+        for key, rmeta in six.iteritems(resources):
+            if key in internal_ids:
+                continue
+            # NOTE: the resource table has no unique constraint and
+            # executemany doesn't return generated keys, so new resources
+            # are inserted one by one. They are rare compared to samples.
+            result = conn.execute(res.insert(), resource_id=key[0],
+                                  user_id=key[1], project_id=key[2],
+                                  source_id=key[3], resource_metadata=rmeta,
+                                  metadata_hash=key[4])
+            internal_ids[key] = result.inserted_primary_key[0]
+            Connection._metadata_rows(internal_ids[key], rmeta, meta_map)
+        for _model, meta_rows in six.iteritems(meta_map):
+            conn.execute(_model.__table__.insert(), meta_rows)
+        return internal_ids
+
+    def _clear_id_caches(self):
+        self._meter_cache.clear()
+        self._resource_cache.clear()
+
+    def record_metering_data(self, data):
+        """Write the data to the backend storage system.
+
+        :param data: a dictionary such as returned by
+                     ceilometer.publisher.utils.meter_message_from_counter
+        """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Record the metering data in batch.
+
+        Meters and resources are resolved from the id caches, or with set
+        based lookups, and all the samples are written with one
+        executemany, in a single transaction.
+
+        :param samples: a list of samples dict.
+        """
+        if not samples:
+            return
+        try:
+            self._record_metering_data_batch(samples)
+        except dbexc.DBReferenceError:
+            # NOTE: cached ids may refer to meters or resources purged by an
+            # expirer running in another process, retry without them
+            self._clear_id_caches()
+            self._record_metering_data_batch(samples)
 
     # FIXME(sileht): use set_defaults to pass cfg.CONF.database.retry_interval
     # and cfg.CONF.database.max_retries to this method when global config
@@ -344,32 +450,241 @@ class Connection(base.Connection):
     # the default instead of the configured value)
     @api.wrap_db_retry(retry_interval=10, max_retries=10,
                        retry_on_deadlock=True)
-    def record_metering_data(self, data):
-        """Write the data to the backend storage system.
+    def _record_metering_data_batch(self, samples):
+        meter_ids = {}
+        resource_ids = {}
+        new_meters = set()
+        new_resources = {}
+        sample_keys = []
+        for data in samples:
+            m_key = (data['counter_name'], data['counter_type'],
+                     data['counter_unit'])
+            rmeta = data['resource_metadata']
+            r_key = (data['resource_id'], data['user_id'],
+                     data['project_id'], data['source'],
+                     self._metadata_hash(rmeta))
+            if m_key not in meter_ids and m_key not in new_meters:
+                m_id = self._meter_cache.get(m_key)
+                if m_id is None:
+                    new_meters.add(m_key)
+                else:
+                    meter_ids[m_key] = m_id
+            if r_key not in resource_ids and r_key not in new_resources:
+                res_id = self._resource_cache.get(r_key)
+                if res_id is None:
+                    new_resources[r_key] = rmeta
+                else:
+                    resource_ids[r_key] = res_id
+            sample_keys.append((m_key, r_key))
 
-        :param data: a dictionary such as returned by
-                     ceilometer.publisher.utils.meter_message_from_counter
-        """
+        if self._rollup_granularities:
+            self._get_rollup_since(create=True)
         engine = self._engine_facade.get_engine()
         with engine.begin() as conn:
-            # Record the raw data for the sample.
-            m_id = self._create_meter(conn,
-                                      data['counter_name'],
-                                      data['counter_type'],
-                                      data['counter_unit'])
-            res_id = self._create_resource(conn,
-                                           data['resource_id'],
-                                           data['user_id'],
-                                           data['project_id'],
-                                           data['source'],
-                                           data['resource_metadata'])
+            if new_meters:
+                new_meter_ids = self._create_meters(conn, new_meters)
+                meter_ids.update(new_meter_ids)
+            if new_resources:
+                new_resource_ids = self._create_resources(conn,
+                                                          new_resources)
+                resource_ids.update(new_resource_ids)
             sample = models.Sample.__table__
-            conn.execute(sample.insert(), meter_id=m_id,
-                         resource_id=res_id,
-                         timestamp=data['timestamp'],
-                         volume=data['counter_volume'],
-                         message_signature=data['message_signature'],
-                         message_id=data['message_id'])
+            conn.execute(sample.insert(), [
+                {'meter_id': meter_ids[m_key],
+                 'resource_id': resource_ids[r_key],
+                 'timestamp': data['timestamp'],
+                 'volume': data['counter_volume'],
+                 'message_signature': data['message_signature'],
+                 'message_id': data['message_id']}
+                for data, (m_key, r_key) in zip(samples, sample_keys)])
+            if self._rollup_granularities:
+                self._update_rollups(conn, [
+                    (meter_ids[m_key], resource_ids[r_key], data)
+                    for data, (m_key, r_key) in zip(samples, sample_keys)])
+
+        # only cache ids once they are committed
+        if new_meters:
+            for m_key, m_id in six.iteritems(new_meter_ids):
+                self._meter_cache.set(m_key, m_id)
+        if new_resources:
+            for r_key, res_id in six.iteritems(new_resource_ids):
+                self._resource_cache.set(r_key, res_id)
+
+    def _get_rollup_since(self, create=False):
+        """Return a dict of rollup granularity to start of complete periods.
+
+        :param create: start the rollups of the configured granularities
+                       which aren't known yet, from their next period.
+        """
+        missing = [g for g in self._rollup_granularities
+                   if g not in self._rollup_since]
+        if not missing:
+            return self._rollup_since
+        table = models.SampleRollupGranularity.__table__
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            since = dict(conn.execute(sa.select([table.c.granularity,
+                                                 table.c.since])).fetchall())
+            now = utils.dt_to_decimal(timeutils.utcnow())
+            rows = [{'granularity': g,
+                     'since': utils.decimal_to_dt((now // g + 1) * g)}
+                    for g in missing if g not in since]
+            if create and rows:
+                try:
+                    conn.execute(table.insert(), rows)
+                except dbexc.DBDuplicateEntry:
+                    # started concurrently by another collector
+                    return self._get_rollup_since(create)
+                since.update((r['granularity'], r['since']) for r in rows)
+        self._rollup_since.update(
+            (g, since[g]) for g in self._rollup_granularities if g in since)
+        return self._rollup_since
+
+    def _update_rollups(self, conn, samples):
+        """Add samples to the rollups of the configured granularities.
+
+        :param conn: connection to update the rollups with.
+        :param samples: a list of (meter id, resource internal id, sample
+                        dict) tuples.
+        """
+        rollups = {}
+        for meter_id, resource_id, data in samples:
+            volume = data['counter_volume']
+            if volume is None:
+                continue
+            ts = utils.sanitize_timestamp(data['timestamp'])
+            epoch = calendar.timegm(ts.utctimetuple())
+            for g in self._rollup_granularities:
+                key = (meter_id, resource_id, g, epoch // g)
+                r = rollups.get(key)
+                if r is None:
+                    rollups[key] = {'b_meter_id': meter_id,
+                                    'b_resource_id': resource_id,
+                                    'b_granularity': g,
+                                    'b_period': key[3],
+                                    'b_count': 1,
+                                    'b_sum': volume,
+                                    'b_min': volume,
+                                    'b_max': volume,
+                                    'b_tsmin': ts,
+                                    'b_tsmax': ts}
+                else:
+                    r['b_count'] += 1
+                    r['b_sum'] += volume
+                    r['b_min'] = min(r['b_min'], volume)
+                    r['b_max'] = max(r['b_max'], volume)
+                    r['b_tsmin'] = min(r['b_tsmin'], ts)
+                    r['b_tsmax'] = max(r['b_tsmax'], ts)
+        if not rollups:
+            return
+
+        table = models.SampleRollup.__table__
+        existing = self._lookup_rollups(conn, rollups)
+        if existing:
+            conn.execute(self._rollup_update(),
+                         [rollups[key] for key in existing])
+        missing = [rollups[key] for key in rollups if key not in existing]
+        if not missing:
+            return
+        insert = table.insert().values(
+            meter_id=sa.bindparam('b_meter_id'),
+            resource_id=sa.bindparam('b_resource_id'),
+            granularity=sa.bindparam('b_granularity'),
+            period=sa.bindparam('b_period'),
+            sample_count=sa.bindparam('b_count'),
+            volume_sum=sa.bindparam('b_sum'),
+            volume_min=sa.bindparam('b_min'),
+            volume_max=sa.bindparam('b_max'),
+            timestamp_min=sa.bindparam('b_tsmin'),
+            timestamp_max=sa.bindparam('b_tsmax'))
+        try:
+            with self._begin_rollup_insert(conn):
+                conn.execute(insert, missing)
+        except dbexc.DBDuplicateEntry:
+            # some rollups were created concurrently, fallback on updating
+            # or inserting them one by one
+            for rollup in missing:
+                if conn.execute(self._rollup_update(), rollup).rowcount:
+                    continue
+                try:
+                    with self._begin_rollup_insert(conn):
+                        conn.execute(insert, rollup)
+                except dbexc.DBDuplicateEntry:
+                    # created concurrently since it was updated
+                    conn.execute(self._rollup_update(), rollup)
+
+    @staticmethod
+    def _lookup_rollups(conn, keys):
+        """Return the keys of the rollups which already exist.
+
+        :param keys: (meter id, resource internal id, granularity, period)
+                     tuples.
+        """
+        table = models.SampleRollup.__table__
+        rows = conn.execute(
+            sa.select([table.c.meter_id, table.c.resource_id,
+                       table.c.granularity, table.c.period])
+            .where(sa.and_(
+                table.c.meter_id.in_(list(set(k[0] for k in keys))),
+                table.c.resource_id.in_(list(set(k[1] for k in keys))),
+                table.c.period.in_(list(set(k[3] for k in keys))))))
+        return set(tuple(row) for row in rows) & set(keys)
+
+    @staticmethod
+    def _begin_rollup_insert(conn):
+        # NOTE: a savepoint lets the outer transaction go on after a
+        # duplicate entry, sqlite serializes the writers so cannot hit one
+        if conn.dialect.name == 'sqlite':
+            return conn.begin()
+        return conn.begin_nested()
+
+    @staticmethod
+    def _rollup_update():
+        table = models.SampleRollup.__table__
+        ts_type = models.PreciseTimestamp()
+        b_min = sa.bindparam('b_min', type_=sa.Float(53))
+        b_max = sa.bindparam('b_max', type_=sa.Float(53))
+        b_tsmin = sa.bindparam('b_tsmin', type_=ts_type)
+        b_tsmax = sa.bindparam('b_tsmax', type_=ts_type)
+        return table.update().where(sa.and_(
+            table.c.meter_id == sa.bindparam('b_meter_id'),
+            table.c.resource_id == sa.bindparam('b_resource_id'),
+            table.c.granularity == sa.bindparam('b_granularity'),
+            table.c.period == sa.bindparam('b_period'))).values(
+            sample_count=table.c.sample_count + sa.bindparam('b_count'),
+            volume_sum=table.c.volume_sum + sa.bindparam('b_sum'),
+            volume_min=sa.case([(table.c.volume_min < b_min,
+                                 table.c.volume_min)], else_=b_min),
+            volume_max=sa.case([(table.c.volume_max > b_max,
+                                 table.c.volume_max)], else_=b_max),
+            timestamp_min=sa.case([(table.c.timestamp_min < b_tsmin,
+                                    table.c.timestamp_min)], else_=b_tsmin),
+            timestamp_max=sa.case([(table.c.timestamp_max > b_tsmax,
+                                    table.c.timestamp_max)], else_=b_tsmax))
+
+    @staticmethod
+    def _rebuild_rollups(session, granularity, period):
+        """Recompute the rollups of a period from its samples."""
+        start = datetime.datetime.utcfromtimestamp(period * granularity)
+        end = start + datetime.timedelta(seconds=granularity)
+        query = (session.query(
+            models.Sample.meter_id, models.Sample.resource_id,
+            sa.literal(granularity, sa.Integer),
+            sa.literal(period, sa.BigInteger),
+            func.count(models.Sample.volume), func.sum(models.Sample.volume),
+            func.min(models.Sample.volume), func.max(models.Sample.volume),
+            func.min(models.Sample.timestamp),
+            func.max(models.Sample.timestamp))
+            .filter(models.Sample.timestamp >= start)
+            .filter(models.Sample.timestamp < end)
+            .filter(models.Sample.volume.isnot(None))
+            .group_by(models.Sample.meter_id, models.Sample.resource_id))
+        table = models.SampleRollup.__table__
+        session.execute(table.insert().from_select(
+            [table.c.meter_id, table.c.resource_id, table.c.granularity,
+             table.c.period, table.c.sample_count, table.c.volume_sum,
+             table.c.volume_min, table.c.volume_max, table.c.timestamp_min,
+             table.c.timestamp_max], query.statement))
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
@@ -387,6 +702,21 @@ class Connection(base.Connection):
             rows = sample_q.delete()
             LOG.info(_LI("%d samples removed from database"), rows)
 
+        # remove rollups of periods ended before the expired samples and
+        # recompute the one they partly expired from the remaining samples
+        end_epoch = utils.dt_to_decimal(end)
+        for granularity, in (session.query(
+                models.SampleRollupGranularity.granularity).all()):
+            period = int(end_epoch // granularity)
+            with session.begin():
+                (session.query(models.SampleRollup)
+                 .filter(models.SampleRollup.granularity == granularity)
+                 .filter(models.SampleRollup.period <
+                         period + (1 if end_epoch % granularity else 0))
+                 .delete(synchronize_session=False))
+                if end_epoch % granularity:
+                    self._rebuild_rollups(session, granularity, period)
+
         if not cfg.CONF.database.sql_expire_samples_only:
             with session.begin():
                 # remove Meter definitions with no matching samples
@@ -421,6 +751,19 @@ class Connection(base.Connection):
                               .filter(models.Resource.metadata_hash
                                       .like('delete_%')))
                 resource_q.delete(synchronize_session=False)
+
+            # remove rollups of the removed meters and resources
+            with session.begin():
+                meter_subq = session.query(models.Meter.id).subquery()
+                resource_subq = (session.query(models.Resource.internal_id)
+                                 .subquery())
+                (session.query(models.SampleRollup)
+                 .filter(sa.or_(
+                     ~models.SampleRollup.meter_id.in_(meter_subq),
+                     ~models.SampleRollup.resource_id.in_(resource_subq)))
+                 .delete(synchronize_session=False))
+            # cached ids may refer to the removed meters and resources
+            self._clear_id_caches()
             LOG.info(_LI("Expired residual resource and"
                          " meter definition data"))
 
@@ -677,15 +1020,15 @@ class Connection(base.Connection):
         return self._retrieve_samples(transformer.get_query())
 
     @staticmethod
-    def _get_aggregate_functions(aggregate):
+    def _get_aggregate_functions(aggregate, standard=STANDARD_AGGREGATES):
         if not aggregate:
-            return [f for f in STANDARD_AGGREGATES.values()]
+            return [f for f in standard.values()]
 
         functions = []
 
         for a in aggregate:
-            if a.func in STANDARD_AGGREGATES:
-                functions.append(STANDARD_AGGREGATES[a.func])
+            if a.func in standard:
+                functions.append(standard[a.func])
             elif a.func in UNPARAMETERIZED_AGGREGATES:
                 functions.append(UNPARAMETERIZED_AGGREGATES[a.func])
             elif a.func in PARAMETERIZED_AGGREGATES['compute']:
@@ -703,14 +1046,30 @@ class Connection(base.Connection):
 
         return functions
 
-    def _make_stats_query(self, sample_filter, groupby, aggregate):
-
-        select = [
-            func.min(models.Sample.timestamp).label('tsmin'),
-            func.max(models.Sample.timestamp).label('tsmax'),
-            models.Meter.unit
-        ]
-        select.extend(self._get_aggregate_functions(aggregate))
+    def _make_stats_query(self, sample_filter, groupby, aggregate,
+                          rollup=False):
+
+        if rollup:
+            # NOTE: the time range is applied on the rollup periods
+            table = models.SampleRollup
+            select = [
+                func.min(table.timestamp_min).label('tsmin'),
+                func.max(table.timestamp_max).label('tsmax'),
+                models.Meter.unit
+            ]
+            select.extend(self._get_aggregate_functions(aggregate,
+                                                        ROLLUP_AGGREGATES))
+            sample_filter = copy.copy(sample_filter)
+            sample_filter.start_timestamp = None
+            sample_filter.end_timestamp = None
+        else:
+            table = models.Sample
+            select = [
+                func.min(table.timestamp).label('tsmin'),
+                func.max(table.timestamp).label('tsmax'),
+                models.Meter.unit
+            ]
+            select.extend(self._get_aggregate_functions(aggregate))
 
         session = self._engine_facade.get_session()
 
@@ -729,9 +1088,9 @@ class Connection(base.Connection):
         query = (
             session.query(*select)
             .join(models.Meter,
-                  models.Meter.id == models.Sample.meter_id)
+                  models.Meter.id == table.meter_id)
             .join(models.Resource,
-                  models.Resource.internal_id == models.Sample.resource_id)
+                  models.Resource.internal_id == table.resource_id)
             .group_by(models.Meter.unit))
 
         if groupby:
@@ -793,6 +1152,14 @@ class Connection(base.Connection):
                     raise ceilometer.NotImplementedError('Unable to group by '
                                                          'these fields')
 
+        granularity = self._get_rollup_granularity(sample_filter, period,
+                                                   aggregate)
+        if granularity:
+            for stat in self._get_rollup_statistics(
+                    sample_filter, granularity, period, groupby, aggregate):
+                yield stat
+            return
+
         if not period:
             for res in self._make_stats_query(sample_filter,
                                               groupby,
@@ -814,15 +1181,160 @@ class Connection(base.Connection):
                 return
 
         query = self._make_stats_query(sample_filter, groupby, aggregate)
+        start = sample_filter.start_timestamp or res.tsmin
+        end = sample_filter.end_timestamp or res.tsmax
+        dialect = self._engine_facade.get_engine().dialect.name
+        period_index = self._period_index(dialect, start, period)
+        if period_index is None:
+            stats = self._get_meter_statistics_by_period(
+                query, start, end, period, groupby, aggregate)
+        else:
+            stats = self._get_meter_statistics_grouped_by_period(
+                query, period_index, start, end, period, groupby, aggregate)
+        for stat in stats:
+            yield stat
+
+    def _get_rollup_granularity(self, sample_filter, period, aggregate):
+        """Return the coarsest rollup granularity able to answer a query.
+
+        None is returned when no rollup matches the filter, the period and
+        the aggregates.
+        """
+        if not self._rollup_granularities:
+            return None
+        start = sample_filter.start_timestamp
+        end = sample_filter.end_timestamp
+        if (not start or (period and not end) or sample_filter.message_id
+                or sample_filter.start_timestamp_op == 'gt'
+                or sample_filter.end_timestamp_op == 'le'):
+            return None
+        for a in aggregate or []:
+            if (a.func not in ROLLUP_AGGREGATES
+                    and a.func not in PARAMETERIZED_AGGREGATES['compute']):
+                return None
+        since = self._get_rollup_since()
+        start_epoch = utils.dt_to_decimal(start)
+        end_epoch = utils.dt_to_decimal(end) if end else 0
+        for g in self._rollup_granularities:
+            if (g in since and since[g] <= start and not start_epoch % g
+                    and not end_epoch % g and not (period or 0) % g):
+                return g
+        return None
+
+    def _get_rollup_statistics(self, sample_filter, granularity, period,
+                               groupby, aggregate):
+        rollup = models.SampleRollup
+        start = sample_filter.start_timestamp
+        end = sample_filter.end_timestamp
+        first = int(utils.dt_to_decimal(start) // granularity)
+        query = self._make_stats_query(sample_filter, groupby, aggregate,
+                                       rollup=True)
+        query = query.filter(rollup.granularity == granularity)
+        query = query.filter(rollup.period >= first)
+
+        if not period:
+            if end:
+                query = query.filter(
+                    rollup.period < int(utils.dt_to_decimal(end)
+                                        // granularity))
+            for res in query:
+                if res.count:
+                    yield self._stats_result_to_model(res, 0,
+                                                      res.tsmin, res.tsmax,
+                                                      groupby,
+                                                      aggregate)
+            return
+
+        # NOTE: keep the periods of iter_period(), the last one being the
+        # first ending after end
+        count = int(math.ceil(timeutils.delta_seconds(start, end)
+                              / float(period)))
+        step = period // granularity
+        query = query.filter(rollup.period < first + count * step)
+        offset = rollup.period - sa.literal_column(str(first))
+        step = sa.literal_column(str(step))
+        period_index = ((offset - offset % step) / step).label('period_index')
+        query = (query.add_columns(period_index)
+                 .group_by(period_index.element)
+                 .order_by(period_index.element))
+        for r in query.all():
+            if r.count:
+                period_start = start + datetime.timedelta(
+                    seconds=period * int(r.period_index))
+                yield self._stats_result_to_model(
+                    result=r,
+                    period=int(period),
+                    period_start=period_start,
+                    period_end=period_start + datetime.timedelta(
+                        seconds=period),
+                    groupby=groupby,
+                    aggregate=aggregate
+                )
+
+    @staticmethod
+    def _period_index(dialect, start, period):
+        """Return the SQL expression of the period index of a sample.
+
+        The index is the number of whole periods elapsed between start and
+        the sample timestamp, it is None if the dialect isn't supported.
+        """
+        ts = models.Sample.timestamp
+        start = sa.literal_column(repr(float(utils.dt_to_decimal(start))))
+        period = sa.literal_column(str(int(period)))
+        if dialect == 'postgresql':
+            return func.floor((sa.extract('epoch', ts) - start) / period)
+        elif dialect == 'mysql':
+            # NOTE: PreciseTimestamp are stored as decimal epoch with MySQL
+            epoch = sa.type_coerce(ts, sa.Numeric(asdecimal=False))
+            return func.floor((epoch - start) / period)
+        elif dialect == 'sqlite':
+            # NOTE: strftime('%s') truncates to the second, the fraction is
+            # added back with the milliseconds of strftime('%f'), timestamps
+            # being greater than start the cast to integer acts as floor
+            epoch = (cast(func.strftime('%s', ts), sa.Integer)
+                     + func.strftime('%f', ts) - func.strftime('%S', ts))
+            return cast((epoch - start) / period, sa.Integer)
+        return None
+
+    def _get_meter_statistics_grouped_by_period(self, query, period_index,
+                                                start, end, period, groupby,
+                                                aggregate):
+        # NOTE: keep the periods of iter_period(), the last one being the
+        # first ending after end
+        count = int(math.ceil(timeutils.delta_seconds(start, end)
+                              / float(period)))
+        if count <= 0:
+            return
+        query = query.filter(models.Sample.timestamp >= start)
+        query = query.filter(models.Sample.timestamp <
+                             start + datetime.timedelta(
+                                 seconds=period * count))
+        period_index = period_index.label('period_index')
+        query = (query.add_columns(period_index)
+                 .group_by(period_index.element)
+                 .order_by(period_index.element))
+        for r in query.all():
+            if r.count:
+                period_start = start + datetime.timedelta(
+                    seconds=period * int(r.period_index))
+                yield self._stats_result_to_model(
+                    result=r,
+                    period=int(period),
+                    period_start=period_start,
+                    period_end=period_start + datetime.timedelta(
+                        seconds=period),
+                    groupby=groupby,
+                    aggregate=aggregate
+                )
+
+    def _get_meter_statistics_by_period(self, query, start, end, period,
+                                        groupby, aggregate):
         # HACK(jd) This is an awful method to compute stats by period, but
         # since we're trying to be SQL agnostic we have to write portable
         # code, so here it is, admire! We're going to do one request to get
         # stats by period. We would like to use GROUP BY, but there's no
         # portable way to manipulate timestamp in SQL, so we can't.
-        for period_start, period_end in base.iter_period(
-                sample_filter.start_timestamp or res.tsmin,
-                sample_filter.end_timestamp or res.tsmax,
-                period):
+        for period_start, period_end in base.iter_period(start, end, period):
             q = query.filter(models.Sample.timestamp >= period_start)
             q = q.filter(models.Sample.timestamp < period_end)
             for r in q.all():
@@ -0,0 +1,52 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+
+# Add tables of pre-aggregated samples
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    rollup = sa.Table(
+        'sample_rollup', meta,
+        sa.Column('meter_id', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('resource_id', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('granularity', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('period', sa.BigInteger, primary_key=True,
+                  autoincrement=False),
+        sa.Column('sample_count', sa.Integer, nullable=False),
+        sa.Column('volume_sum', sa.Float(53)),
+        sa.Column('volume_min', sa.Float(53)),
+        sa.Column('volume_max', sa.Float(53)),
+        sa.Column('timestamp_min', models.PreciseTimestamp()),
+        sa.Column('timestamp_max', models.PreciseTimestamp()),
+        sa.Index('ix_sample_rollup_granularity_period',
+                 'granularity', 'period'),
+        sa.Index('ix_sample_rollup_resource_id', 'resource_id'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    rollup.create()
+    granularity = sa.Table(
+        'sample_rollup_granularity', meta,
+        sa.Column('granularity', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('since', models.PreciseTimestamp(), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    granularity.create()
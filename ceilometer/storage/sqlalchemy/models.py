@@ -231,6 +231,38 @@ class Sample(Base):
     message_id = Column(String(128))
 
 
+class SampleRollup(Base):
+    """Metering data pre-aggregated by meter, resource and period.
+
+    period is the number of granularity seconds elapsed since the epoch.
+    """
+
+    __tablename__ = 'sample_rollup'
+    __table_args__ = (
+        Index('ix_sample_rollup_granularity_period', 'granularity', 'period'),
+        Index('ix_sample_rollup_resource_id', 'resource_id'),
+        _COMMON_TABLE_ARGS,
+    )
+    meter_id = Column(Integer, primary_key=True, autoincrement=False)
+    resource_id = Column(Integer, primary_key=True, autoincrement=False)
+    granularity = Column(Integer, primary_key=True, autoincrement=False)
+    period = Column(BigInteger, primary_key=True, autoincrement=False)
+    sample_count = Column(Integer, nullable=False)
+    volume_sum = Column(Float(53))
+    volume_min = Column(Float(53))
+    volume_max = Column(Float(53))
+    timestamp_min = Column(PreciseTimestamp())
+    timestamp_max = Column(PreciseTimestamp())
+
+
+class SampleRollupGranularity(Base):
+    """Granularity of the rollups and start of their complete periods."""
+
+    __tablename__ = 'sample_rollup_granularity'
+    granularity = Column(Integer, primary_key=True, autoincrement=False)
+    since = Column(PreciseTimestamp(), nullable=False)
+
+
 class FullSample(object):
     """A fake model for query samples."""
     id = Sample.id
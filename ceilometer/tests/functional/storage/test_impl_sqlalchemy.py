@@ -22,6 +22,7 @@ import datetime
 import warnings
 
 import mock
+from oslo_config import fixture as fixture_config
 from oslo_db import exception
 from oslo_utils import timeutils
 from six.moves import reprlib
@@ -30,6 +31,7 @@ from ceilometer.event.storage import impl_sqlalchemy as impl_sqla_event
 from ceilometer.event.storage import models
 from ceilometer.publisher import utils
 from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_sqlalchemy
 from ceilometer.storage.sqlalchemy import models as sql_models
 from ceilometer.tests import base as test_base
@@ -223,3 +225,347 @@ class FilterQueryTestForMeters(scenarios.DBTestBase):
     def test_get_meters_by_project(self):
         meters = list(self.conn.get_meters(project='None'))
         self.assertEqual(1, len(meters))
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class BatchRecordingTest(tests_db.TestBase):
+
+    def _make_samples(self, count):
+        samples = []
+        for i in range(count):
+            s = sample.Sample(name='sample-%s' % (i % 2),
+                              type=sample.TYPE_GAUGE,
+                              unit='',
+                              volume=i,
+                              user_id='user-id',
+                              project_id='project-id',
+                              resource_id='resource-%s' % (i % 3),
+                              timestamp=datetime.datetime(2016, 6, 1, 15, i),
+                              resource_metadata={'fake_meta': i % 3,
+                                                 'name': 'res-%s' % (i % 3)},
+                              source='test')
+            msg = utils.meter_message_from_counter(s, 'not-so-secret')
+            msg['timestamp'] = s.timestamp
+            samples.append(msg)
+        return samples
+
+    def test_record_metering_data_batch(self):
+        self.conn.record_metering_data_batch(self._make_samples(9))
+
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(9, session.query(sql_models.Sample).count())
+        self.assertEqual(2, session.query(sql_models.Meter).count())
+        self.assertEqual(3, session.query(sql_models.Resource).count())
+        self.assertEqual(3, session.query(sql_models.MetaBigInt).count())
+        self.assertEqual(3, session.query(sql_models.MetaText).count())
+        volumes = sorted(s.counter_volume for s in self.conn.get_samples(
+            storage.SampleFilter(meter='sample-0')))
+        self.assertEqual([0, 2, 4, 6, 8], volumes)
+
+    def test_record_metering_data_batch_existing_definitions(self):
+        samples = self._make_samples(6)
+        self.conn.record_metering_data(samples[0])
+        self.conn.record_metering_data_batch(samples[1:])
+
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(6, session.query(sql_models.Sample).count())
+        self.assertEqual(2, session.query(sql_models.Meter).count())
+        self.assertEqual(3, session.query(sql_models.Resource).count())
+        self.assertEqual(3, session.query(sql_models.MetaBigInt).count())
+
+    def test_record_metering_data_batch_id_cache(self):
+        samples = self._make_samples(6)
+        self.conn.record_metering_data_batch(samples[:3])
+        self.assertEqual(2, len(self.conn._meter_cache))
+        self.assertEqual(3, len(self.conn._resource_cache))
+        with mock.patch.object(self.conn, '_create_meters') as create_m:
+            with mock.patch.object(self.conn,
+                                   '_create_resources') as create_r:
+                self.conn.record_metering_data_batch(samples[3:])
+        self.assertFalse(create_m.called)
+        self.assertFalse(create_r.called)
+        self.assertEqual(2, self.conn._meter_cache.hits)
+        self.assertEqual(3, self.conn._resource_cache.hits)
+
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(6, session.query(sql_models.Sample).count())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_id_cache_cleared_by_expirer(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 2)
+        self.conn.record_metering_data_batch(self._make_samples(3))
+        self.assertEqual(3, len(self.conn._resource_cache))
+        self.conn.clear_expired_metering_data(60)
+        self.assertEqual(0, len(self.conn._meter_cache))
+        self.assertEqual(0, len(self.conn._resource_cache))
+
+        self.conn.record_metering_data_batch(self._make_samples(3))
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(3, session.query(sql_models.Sample).count())
+        self.assertEqual(3, session.query(sql_models.Resource).count())
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class StatisticsByPeriodTest(scenarios.DBTestBase):
+
+    def prepare_data(self):
+        for i in range(12):
+            c = sample.Sample(
+                'volume.size',
+                'gauge',
+                'GiB',
+                i,
+                user_id='user-%s' % (i % 2),
+                project_id='project-id',
+                resource_id='resource-id',
+                timestamp=(datetime.datetime(2012, 9, 25, 10, 30) +
+                           datetime.timedelta(seconds=425 * i)),
+                resource_metadata={},
+                source='test',
+            )
+            msg = utils.meter_message_from_counter(c, 'not-so-secret')
+            self.conn.record_metering_data(msg)
+
+    def _get_statistics(self, groupby=None, **kwargs):
+        f = storage.SampleFilter(meter='volume.size', **kwargs)
+        grouped = list(self.conn.get_meter_statistics(f, period=900,
+                                                      groupby=groupby))
+        with mock.patch.object(impl_sqlalchemy.Connection, '_period_index',
+                               return_value=None):
+            by_period = list(self.conn.get_meter_statistics(
+                f, period=900, groupby=groupby))
+        key = lambda s: (s['period_start'],
+                         sorted((s['groupby'] or {}).items()))
+        self.assertEqual(sorted((s.as_dict() for s in by_period), key=key),
+                         sorted((s.as_dict() for s in grouped), key=key))
+        return grouped
+
+    def test_period(self):
+        results = self._get_statistics()
+        self.assertEqual(6, len(results))
+        self.assertEqual(datetime.datetime(2012, 9, 25, 10, 30),
+                         results[0].period_start)
+        self.assertEqual(3, results[0].count)
+
+    def test_period_with_start_end(self):
+        results = self._get_statistics(
+            start_timestamp=datetime.datetime(2012, 9, 25, 10, 0),
+            end_timestamp=datetime.datetime(2012, 9, 25, 11, 0))
+        self.assertEqual(2, len(results))
+        self.assertEqual(datetime.datetime(2012, 9, 25, 10, 30),
+                         results[0].period_start)
+        self.assertEqual(3, results[0].count)
+        self.assertEqual(datetime.datetime(2012, 9, 25, 11, 0),
+                         results[1].period_end)
+        self.assertEqual(2, results[1].count)
+
+    def test_period_with_groupby(self):
+        results = self._get_statistics(groupby=['user_id'])
+        self.assertEqual(11, len(results))
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class RollupTest(tests_db.TestBase):
+
+    def setUp(self):
+        # NOTE: the granularities are read when the connection is created
+        # by the base class, so they are set beforehand
+        conf = self.useFixture(fixture_config.Config()).conf
+        conf.set_override('sql_rollup_granularities', [300, 3600],
+                          group='database')
+        super(RollupTest, self).setUp()
+        patcher = mock.patch.object(timeutils, 'utcnow')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value = datetime.datetime(2012, 9, 25)
+        for i in range(12):
+            s = sample.Sample(
+                'cpu_util',
+                'gauge',
+                '%',
+                i,
+                user_id='user-id',
+                project_id='project-%s' % (i % 3 % 2),
+                resource_id='resource-%s' % (i % 3),
+                timestamp=(datetime.datetime(2012, 9, 25, 10, 5) +
+                           datetime.timedelta(minutes=10 * i)),
+                resource_metadata={},
+                source='test',
+            )
+            msg = utils.meter_message_from_counter(s, 'not-so-secret')
+            self.conn.record_metering_data(msg)
+
+    def _assert_same_statistics(self, f, **kwargs):
+        with mock.patch.object(self.conn, '_get_rollup_statistics',
+                               wraps=self.conn._get_rollup_statistics) as r:
+            from_rollups = list(self.conn.get_meter_statistics(f, **kwargs))
+        self.assertTrue(r.called)
+        with mock.patch.object(self.conn, '_rollup_granularities', []):
+            from_samples = list(self.conn.get_meter_statistics(f, **kwargs))
+        key = lambda s: (s['period_start'],
+                         sorted((s['groupby'] or {}).items()))
+        self.assertEqual(sorted((s.as_dict() for s in from_samples), key=key),
+                         sorted((s.as_dict() for s in from_rollups), key=key))
+        return r.call_args[0][1]
+
+    def test_rollups_recorded(self):
+        session = self.conn._engine_facade.get_session()
+        rollups = (session.query(sql_models.SampleRollup)
+                   .filter(sql_models.SampleRollup.granularity == 3600)
+                   .all())
+        # 2 hours of 3 resources
+        self.assertEqual(6, len(rollups))
+        self.assertEqual(12, sum(r.sample_count for r in rollups))
+        self.assertEqual(66, sum(r.volume_sum for r in rollups))
+        self.assertEqual(12, (session.query(sql_models.SampleRollup)
+                              .filter(sql_models.SampleRollup.granularity ==
+                                      300).count()))
+
+    def test_statistics_period(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 9, 25, 10),
+            end_timestamp=datetime.datetime(2012, 9, 25, 12))
+        self.assertEqual(3600, self._assert_same_statistics(f, period=3600))
+        self.assertEqual(300, self._assert_same_statistics(f, period=1800))
+
+    def test_statistics_no_period(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 9, 25, 10, 30))
+        self.assertEqual(300, self._assert_same_statistics(f))
+
+    def test_statistics_groupby_and_filter(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            project='project-1',
+            start_timestamp=datetime.datetime(2012, 9, 25, 10),
+            end_timestamp=datetime.datetime(2012, 9, 25, 12))
+        self._assert_same_statistics(f, period=3600,
+                                     groupby=['resource_id'])
+
+    def test_statistics_cardinality(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 9, 25, 10),
+            end_timestamp=datetime.datetime(2012, 9, 25, 12))
+        aggregate = [mock.Mock(func='cardinality', param='resource_id'),
+                     mock.Mock(func='max', param=None)]
+        self._assert_same_statistics(f, period=3600, aggregate=aggregate)
+
+    def test_rollup_not_matching(self):
+        start = datetime.datetime(2012, 9, 25, 10)
+        end = datetime.datetime(2012, 9, 25, 12)
+        for f, period, aggregate in [
+                (storage.SampleFilter(meter='cpu_util',
+                                      start_timestamp=start), 3600, None),
+                (storage.SampleFilter(meter='cpu_util',
+                                      start_timestamp=start +
+                                      datetime.timedelta(seconds=1),
+                                      end_timestamp=end), 3600, None),
+                (storage.SampleFilter(meter='cpu_util', start_timestamp=start,
+                                      start_timestamp_op='gt',
+                                      end_timestamp=end), 3600, None),
+                (storage.SampleFilter(meter='cpu_util', start_timestamp=start,
+                                      end_timestamp=end), 90, None),
+                (storage.SampleFilter(meter='cpu_util', start_timestamp=start,
+                                      end_timestamp=end), 3600,
+                 [mock.Mock(func='stddev', param=None)]),
+                (storage.SampleFilter(meter='cpu_util',
+                                      start_timestamp=datetime.datetime(
+                                          2012, 9, 24),
+                                      end_timestamp=end), 3600, None)]:
+            self.assertIsNone(self.conn._get_rollup_granularity(
+                f, period, aggregate))
+
+    def test_clear_expired_rollups(self):
+        # rollups are expired with samples, even when definitions are kept
+        self.CONF.set_override('sql_expire_samples_only', True,
+                               group='database')
+        timeutils.utcnow.return_value = datetime.datetime(2012, 9, 25, 12)
+        self.conn.clear_expired_metering_data(3600)
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(3, (session.query(sql_models.SampleRollup)
+                             .filter(sql_models.SampleRollup.granularity ==
+                                     3600).count()))
+        self.assertEqual(6, (session.query(sql_models.SampleRollup)
+                             .filter(sql_models.SampleRollup.granularity ==
+                                     300).count()))
+
+    def test_clear_expired_rollups_partial_period(self):
+        self.CONF.set_override('sql_expire_samples_only', True,
+                               group='database')
+        timeutils.utcnow.return_value = datetime.datetime(2012, 9, 25, 12, 30)
+        self.conn.clear_expired_metering_data(3600)
+        session = self.conn._engine_facade.get_session()
+        rollups = (session.query(sql_models.SampleRollup)
+                   .filter(sql_models.SampleRollup.granularity == 3600)
+                   .all())
+        # only the samples after 11:30 are left in the 11:00 period
+        self.assertEqual(3, len(rollups))
+        self.assertEqual(3, sum(r.sample_count for r in rollups))
+        self.assertEqual(30, sum(r.volume_sum for r in rollups))
+        self.assertEqual(3, (session.query(sql_models.SampleRollup)
+                             .filter(sql_models.SampleRollup.granularity ==
+                                     300).count()))
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 9, 25, 11),
+            end_timestamp=datetime.datetime(2012, 9, 25, 12))
+        self.assertEqual(3600, self._assert_same_statistics(
+            f, period=3600, groupby=['resource_id']))
+
+    def test_rollups_created_concurrently(self):
+        engine = self.conn._engine_facade.get_engine()
+        if engine.dialect.name == 'sqlite':
+            # NOTE: sqlite serializes the writers and has no savepoints
+            self.skipTest('Test is not applicable for sqlite')
+        s = sample.Sample(
+            'cpu_util', 'gauge', '%', 100,
+            user_id='user-id',
+            project_id='project-0',
+            resource_id='resource-0',
+            timestamp=datetime.datetime(2012, 9, 25, 10, 1),
+            resource_metadata={},
+            source='test',
+        )
+        msg = utils.meter_message_from_counter(s, 'not-so-secret')
+        # the rollups are created by another writer after the lookup
+        with mock.patch.object(self.conn, '_lookup_rollups',
+                               return_value=set()):
+            self.conn.record_metering_data(msg)
+        session = self.conn._engine_facade.get_session()
+        rollups = (session.query(sql_models.SampleRollup)
+                   .filter(sql_models.SampleRollup.granularity == 3600)
+                   .all())
+        self.assertEqual(6, len(rollups))
+        self.assertEqual(13, sum(r.sample_count for r in rollups))
+        self.assertEqual(166, sum(r.volume_sum for r in rollups))
+        self.assertEqual(100, max(r.volume_max for r in rollups))
+
+    def test_rollup_granularities_option(self):
+        self.assertEqual([3600, 300], self.conn._rollup_granularities)
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual([300, 3600], sorted(
+            g for g, in session.query(
+                sql_models.SampleRollupGranularity.granularity)))
+
+    def test_clear_expired_rollups_of_removed_resources(self):
+        self.CONF.set_override('sql_expire_samples_only', False,
+                               group='database')
+        session = self.conn._engine_facade.get_session()
+        resource = (session.query(sql_models.Resource.internal_id)
+                    .filter(sql_models.Resource.resource_id == 'resource-0')
+                    .scalar())
+        # the samples of resource-0 are gone but its rollups of the
+        # current period remain until the resource itself is removed
+        with session.begin():
+            (session.query(sql_models.Sample)
+             .filter(sql_models.Sample.resource_id == resource)
+             .delete(synchronize_session=False))
+        self.conn.clear_expired_metering_data(3600 * 24 * 365)
+        self.assertEqual(0, (session.query(sql_models.SampleRollup)
+                             .filter(sql_models.SampleRollup.resource_id ==
+                                     resource).count()))
+        self.assertEqual(4, (session.query(sql_models.SampleRollup)
+                             .filter(sql_models.SampleRollup.granularity ==
+                                     3600).count()))
@@ -12,7 +12,9 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import errno
 import socket
+import struct
 
 import mock
 import msgpack
@@ -24,6 +26,7 @@ from stevedore import extension
 
 from ceilometer import collector
 from ceilometer import dispatcher
+from ceilometer import instrumentation
 from ceilometer.publisher import utils
 from ceilometer import sample
 from ceilometer.tests import base as tests_base
@@ -103,7 +106,24 @@ class TestCollector(tests_base.BaseTestCase):
             self.srv.udp_run = False
             return msgpack.dumps(sample), ('127.0.0.1', 12345)
 
-        sock = mock.Mock()
+        sock = mock.Mock(spec=['setsockopt', 'bind', 'setblocking',
+                               'recvfrom', 'close'])
+        sock.recvfrom = recvfrom
+        return sock
+
+    def _make_fake_socket_batch(self, samples):
+        datagrams = [(msgpack.dumps(s), ('127.0.0.1', 12345))
+                     for s in samples]
+
+        def recvfrom(size):
+            if datagrams:
+                return datagrams.pop(0)
+            # Make the loop stop
+            self.srv.udp_run = False
+            raise socket.error(errno.EAGAIN, 'Resource unavailable')
+
+        sock = mock.Mock(spec=['setsockopt', 'bind', 'setblocking',
+                               'recvfrom', 'close'])
         sock.recvfrom = recvfrom
         return sock
 
@@ -134,7 +154,87 @@ class TestCollector(tests_base.BaseTestCase):
 
         self._verify_udp_socket(udp_socket)
         mock_record = self.mock_dispatcher.record_metering_data
-        mock_record.assert_called_once_with(self.sample)
+        mock_record.assert_called_once_with([self.sample])
+
+    def _run_udp(self, udp_socket):
+        with mock.patch('select.select', return_value=([udp_socket], [], [])):
+            with mock.patch('socket.socket', return_value=udp_socket):
+                self.srv.run()
+                self.addCleanup(self.srv.terminate)
+                self.srv.udp_thread.join(5)
+                self.assertFalse(self.srv.udp_thread.is_alive())
+
+    def test_udp_receive_batch(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('batch_size', 3, group='collector')
+        self.CONF.set_override('enabled', True, group='pipeline_stats')
+        self.useFixture(mockpatch.PatchObject(instrumentation.STATS,
+                                              'enabled', True))
+        instrumentation.STATS.reset()
+        udp_socket = self._make_fake_socket_batch([self.sample] * 5)
+        self._run_udp(udp_socket)
+
+        mock_record = self.mock_dispatcher.record_metering_data
+        self.assertEqual([mock.call([self.sample] * 3),
+                          mock.call([self.sample] * 2)],
+                         mock_record.call_args_list)
+        counters = instrumentation.STATS.snapshot()['components'][
+            collector.UDP_STATS]
+        self.assertEqual(5, counters['datagrams'])
+        self.assertEqual(5, counters['samples'])
+        self.assertEqual(2, counters['dispatch']['count'])
+
+    def test_udp_receive_envelope(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('batch_size', 10, group='collector')
+        bad_sample = dict(self.sample, counter_volume=2)
+        datagrams = utils.pack_udp_datagrams(
+            [self.sample, bad_sample, self.utf8_msg], 64 * 1024)
+        self.assertEqual(1, len(datagrams))
+        udp_socket = self._make_fake_socket_batch([])
+        data = [datagrams[0][0]]
+
+        def recvfrom(size):
+            if data:
+                return data.pop(0), ('127.0.0.1', 12345)
+            self.srv.udp_run = False
+            raise socket.error(errno.EAGAIN, 'Resource unavailable')
+
+        udp_socket.recvfrom = recvfrom
+        self._run_udp(udp_socket)
+
+        self.mock_dispatcher.record_metering_data.assert_called_once_with(
+            [self.sample, self.utf8_msg])
+
+    def test_udp_receive_overflow(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('enabled', True, group='pipeline_stats')
+        self.useFixture(mockpatch.PatchObject(instrumentation.STATS,
+                                              'enabled', True))
+        instrumentation.STATS.reset()
+        datagrams = [msgpack.dumps(self.sample)] * 3
+        overflows = [0, 3, 5]
+
+        def recvmsg(size, ancsize):
+            if not datagrams:
+                self.srv.udp_run = False
+                raise socket.error(errno.EAGAIN, 'Resource unavailable')
+            ancdata = [(socket.SOL_SOCKET, collector.SO_RXQ_OVFL,
+                        struct.pack('I', overflows.pop(0)))]
+            return datagrams.pop(0), ancdata, 0, ('127.0.0.1', 12345)
+
+        udp_socket = mock.Mock(spec=['setsockopt', 'bind', 'setblocking',
+                                     'recvmsg', 'close'])
+        udp_socket.recvmsg = recvmsg
+        self._run_udp(udp_socket)
+
+        udp_socket.setsockopt.assert_called_with(
+            socket.SOL_SOCKET, collector.SO_RXQ_OVFL, 1)
+        self.assertEqual(3, self.mock_dispatcher.record_metering_data.
+                         call_count)
+        counters = instrumentation.STATS.snapshot()['components'][
+            collector.UDP_STATS]
+        self.assertEqual(5, counters['overflow_drops'])
 
     def test_udp_socket_ipv6(self):
         self._setup_messaging(False)
@@ -166,7 +266,7 @@ class TestCollector(tests_base.BaseTestCase):
 
         self._verify_udp_socket(udp_socket)
 
-        mock_record.assert_called_once_with(self.sample)
+        mock_record.assert_called_once_with([self.sample])
 
     @staticmethod
     def _raise_error(*args, **kwargs):
@@ -215,7 +315,7 @@ class TestCollector(tests_base.BaseTestCase):
                 self.srv.udp_thread.join(5)
                 self.assertFalse(self.srv.udp_thread.is_alive())
                 self.assertTrue(utils.verify_signature(
-                    self.mock_dispatcher.method_calls[0][1][0],
+                    self.mock_dispatcher.method_calls[0][1][0][0],
                     "not-so-secret"))
 
     def _test_collector_requeue(self, listener, batch_listener=False):
@@ -14,6 +14,7 @@
 # under the License.
 """Tests for Ceilometer notify daemon."""
 
+import datetime
 import shutil
 import time
 
@@ -26,8 +27,10 @@ from stevedore import extension
 import yaml
 
 from ceilometer.agent import plugin_base
+from ceilometer.event.storage import models
 from ceilometer import messaging
 from ceilometer import notification
+from ceilometer import pipeline
 from ceilometer.publisher import test as test_publisher
 from ceilometer.tests import base as tests_base
 
@@ -179,6 +182,122 @@ class TestNotification(tests_base.BaseTestCase):
             args, kwargs = mock_listener.call_args
             self.assertEqual(1, len(self.srv.listeners))
 
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    @mock.patch('ceilometer.pipeline.setup_event_pipeline', mock.MagicMock())
+    @mock.patch('oslo_messaging.get_batch_notification_listener')
+    def test_shard_main_queues(self, mock_listener):
+        exchanges = ['nova', 'cinder', 'glance', 'neutron', 'heat']
+
+        def fake_get_notifications_manager_many_targets(pm):
+            plugin = _FakeNotificationPlugin(pm)
+            plugin.get_targets = lambda conf: [
+                oslo_messaging.Target(topic='notifications', exchange=e)
+                for e in exchanges]
+            return extension.ExtensionManager.make_test_instance(
+                [extension.Extension('test', None, None, plugin)])
+
+        self.CONF([], project='ceilometer', validate_default_values=True)
+        self.CONF.set_override('workers', 3, group='notification')
+        self.CONF.set_override('shard_main_queues', True,
+                               group='notification')
+        self.CONF.set_override('workload_partitioning', False,
+                               group='notification')
+        shards = []
+        pools = []
+        for worker_id in range(4):
+            srv = notification.NotificationService(worker_id, self.CONF)
+            with mock.patch.object(srv, '_get_notifications_manager') as nm:
+                nm.side_effect = fake_get_notifications_manager_many_targets
+                srv.run()
+                self.addCleanup(srv.terminate)
+            targets = mock_listener.call_args[0][1]
+            shards.append(sorted(t.exchange for t in targets))
+            pools.append(mock_listener.call_args[1]['pool'])
+        self.assertEqual([['cinder', 'neutron'], ['glance', 'nova'],
+                          ['heat'], ['cinder', 'neutron']], shards)
+        # the queues are named after the pool on RabbitMQ, each shard needs
+        # its own ones, shared with the same shard of the other agents
+        self.assertEqual(['ceilometer.notification.shard-0',
+                          'ceilometer.notification.shard-1',
+                          'ceilometer.notification.shard-2',
+                          'ceilometer.notification.shard-0'], pools)
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    @mock.patch('ceilometer.pipeline.setup_event_pipeline', mock.MagicMock())
+    @mock.patch('oslo_messaging.get_batch_notification_listener')
+    def test_main_queues_not_sharded(self, mock_listener):
+        self.CONF([], project='ceilometer', validate_default_values=True)
+        self.CONF.set_override('workers', 3, group='notification')
+        self.CONF.set_override('workload_partitioning', False,
+                               group='notification')
+        srv = notification.NotificationService(1, self.CONF)
+        with mock.patch.object(srv, '_get_notifications_manager') as nm:
+            nm.side_effect = lambda pm: extension.ExtensionManager.\
+                make_test_instance([extension.Extension(
+                    'test', None, None, _FakeNotificationPlugin(pm))])
+            srv.run()
+            self.addCleanup(srv.terminate)
+        self.assertIsNone(mock_listener.call_args[1]['pool'])
+
+    def test_worker_statistics(self):
+        stats = notification.WorkerStatistics(2)
+        stats.info([{'metadata': {'timestamp': '2012-05-08 20:23:48.028'}},
+                    {'metadata': {}}])
+        stats.sample([{'metadata': {}}])
+        self.assertEqual(3, stats.count)
+        self.assertGreater(stats.lag, 0)
+        with mock.patch('ceilometer.notification.LOG') as log:
+            stats.report()
+        self.assertEqual(1, log.info.call_count)
+        self.assertEqual(3, log.info.call_args[0][1]['count'])
+        self.assertEqual(2, log.info.call_args[0][1]['worker'])
+        self.assertEqual(0, stats.count)
+
+    def test_pipeline_transport_batches(self):
+        pipe_manager = pipeline.EventPipelineTransportManager(self.CONF, 2)
+        notifier = mock.Mock()
+        pipe_manager.add_transporter(
+            (lambda event_type: event_type != 'skip', ['event_type'],
+             [notifier]))
+        events = [models.Event(message_id=str(i),
+                               event_type=['a', 'b', 'skip'][i % 3],
+                               generated=datetime.datetime.utcnow(),
+                               traits=[], raw={})
+                  for i in range(9)]
+        with mock.patch('ceilometer.publisher.utils.message_from_event',
+                        side_effect=lambda e, secret: {
+                            'event_type': e.event_type,
+                            'message_id': e.message_id}) as serializer:
+            with pipe_manager.publisher() as p:
+                p(events)
+        self.assertEqual(9, serializer.call_count)
+        payloads = [c[1]['payload'] for c in notifier.sample.call_args_list]
+        self.assertEqual([['0', '1'], ['3', '4'], ['6', '7']],
+                         [[e['message_id'] for e in payload]
+                          for payload in payloads])
+
+    def test_sample_pipeline_endpoint_orders_samples(self):
+        pipe = mock.MagicMock(conf=self.CONF)
+        pipe.name = 'test'
+        endpoint = pipeline.SamplePipelineEndpoint(pipe)
+        self.CONF.set_override('telemetry_secret', '', group='publisher')
+
+        def payload(*timestamps):
+            return [{'counter_name': 'cpu', 'counter_type': 'gauge',
+                     'counter_unit': 'ns', 'counter_volume': i,
+                     'user_id': 'u', 'project_id': 'p',
+                     'resource_id': 'r', 'timestamp': ts,
+                     'resource_metadata': {}}
+                    for i, ts in enumerate(timestamps)]
+
+        endpoint.sample([{'payload': payload('2016-01-01T00:00:02',
+                                             '2016-01-01T00:00:01')},
+                         {'payload': payload('2016-01-01T00:00:00')}])
+        samples = pipe.publish_data.call_args[0][0]
+        self.assertEqual(['2016-01-01T00:00:00', '2016-01-01T00:00:01',
+                          '2016-01-01T00:00:02'],
+                         [s.timestamp for s in samples])
+
 
 class BaseRealNotification(tests_base.BaseTestCase):
     def setup_pipeline(self, counter_names):
@@ -477,13 +596,14 @@ class TestRealNotificationHA(BaseRealNotification):
                 'metadata': TEST_NOTICE_METADATA}])
 
         self.assertTrue(mock_notifier.called)
-        self.assertEqual(3, mock_notifier.call_count)
+        # NOTE: the samples of the same resource are batched in one message
+        self.assertEqual(2, mock_notifier.call_count)
         self.assertEqual('pipeline.event',
                          mock_notifier.call_args_list[0][1]['event_type'])
+        self.assertEqual(1, len(mock_notifier.call_args_list[0][1]['payload']))
         self.assertEqual('ceilometer.pipeline',
                          mock_notifier.call_args_list[1][1]['event_type'])
-        self.assertEqual('ceilometer.pipeline',
-                         mock_notifier.call_args_list[2][1]['event_type'])
+        self.assertEqual(2, len(mock_notifier.call_args_list[1][1]['payload']))
 
 
 class TestRealNotificationMultipleAgents(tests_base.BaseTestCase):
@@ -30,6 +30,7 @@ import six
 from stevedore import extension
 import yaml
 
+from ceilometer import instrumentation
 from ceilometer import pipeline
 from ceilometer import publisher
 from ceilometer.publisher import test as test_publisher
@@ -49,6 +50,7 @@ class BasePipelineTestCase(base.BaseTestCase):
         The faked entry point setting is below:
         update: TransformerClass
         except: TransformerClassException
+        batch_except: TransformerClassBatchException
         drop:   TransformerClassDrop
         """
         pass
@@ -57,6 +59,7 @@ class BasePipelineTestCase(base.BaseTestCase):
         class_name_ext = {
             'update': self.TransformerClass,
             'except': self.TransformerClassException,
+            'batch_except': self.TransformerClassBatchException,
             'drop': self.TransformerClassDrop,
             'cache': accumulator.TransformerAccumulator,
             'aggregator': conversions.AggregatorTransformer,
@@ -131,6 +134,17 @@ class BasePipelineTestCase(base.BaseTestCase):
         def handle_sample(counter):
             raise Exception()
 
+    class TransformerClassBatchException(transformer.TransformerBase):
+        grouping_keys = ['resource_id']
+
+        def handle_sample(self, counter):
+            if counter.name == 'bad':
+                raise Exception()
+            return counter
+
+        def handle_samples(self, samples):
+            return [self.handle_sample(s) for s in samples]
+
     def cfg2file(self, data):
         self.tmp_cfg.write(yaml.safe_dump(data))
         self.tmp_cfg.close()
@@ -293,6 +307,34 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('a',
                          getattr(self.TransformerClass.samples[0], "name"))
 
+    def test_publisher_transformer_instrumented(self):
+        pipeline_manager = pipeline.PipelineManager(
+            self.CONF,
+            self.cfg2file(self.pipeline_cfg), self.transformer_manager)
+        stats = instrumentation.STATS
+        self.addCleanup(setattr, stats, 'enabled', False)
+        stats.reset()
+        stats.enabled = True
+        with pipeline_manager.publisher() as p:
+            p([self.test_counter])
+
+        pipe = pipeline_manager.pipelines[0]
+        components = stats.snapshot()['components']
+        self.assertEqual({'samples_in': 1, 'samples_filtered': 0},
+                         components[pipe.stats_name])
+        self.assertEqual(1, components[pipe.sink.stats_name]['samples_in'])
+        self.assertEqual(1, components[pipe.sink.stats_name]['samples_out'])
+        self.assertEqual(
+            1, components[pipe.sink.stats_name]['process']['count'])
+        transformer = components[pipe.sink.transformers_stats_names[0]]
+        self.assertEqual(1, transformer['samples_in'])
+        self.assertEqual(1, transformer['samples_out'])
+        self.assertEqual(1, transformer['handle']['count'])
+        self.assertEqual(1, transformer['flush']['count'])
+        publisher = components[pipe.sink.publishers_stats_names[0]]
+        self.assertEqual(1, publisher['published'])
+        self.assertEqual(1, publisher['publish']['count'])
+
     def test_multiple_included_counters(self):
         counter_cfg = ['a', 'b']
         self._set_pipeline_cfg('counters', counter_cfg)
@@ -502,6 +544,26 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertTrue(pipeline_manager.pipelines[0].
                         support_meter('instance'))
 
+    def test_counter_matching_memoized(self):
+        counter_cfg = ['cpu', 'disk.*']
+        self._set_pipeline_cfg('counters', counter_cfg)
+        pipeline_manager = pipeline.PipelineManager(
+            self.CONF,
+            self.cfg2file(self.pipeline_cfg), self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        matcher = pipe.source._matcher
+        matcher._cache_size = 2
+        with mock.patch.object(matcher, '_match',
+                               wraps=matcher._match) as match:
+            self.assertTrue(pipe.support_meter('cpu'))
+            self.assertTrue(pipe.support_meter('cpu'))
+            self.assertFalse(pipe.support_meter('cpu_util'))
+            self.assertEqual(2, match.call_count)
+            self.assertTrue(pipe.support_meter('disk.read.bytes'))
+            self.assertEqual(1, len(matcher._cache))
+            self.assertTrue(pipe.support_meter('disk.read.bytes'))
+            self.assertEqual(3, match.call_count)
+
     def test_multiple_pipeline(self):
         self._augment_pipeline_cfg()
 
@@ -575,6 +637,26 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('b',
                          getattr(self.TransformerClass.samples[1], "name"))
 
+    def test_transformer_batch_exception(self):
+        self._reraise_exception = False
+        transformer_cfg = [{'name': 'batch_except', 'parameters': {}}]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['a', 'bad'])
+        pipeline_manager = pipeline.PipelineManager(
+            self.CONF,
+            self.cfg2file(self.pipeline_cfg), self.transformer_manager)
+        bad = copy.copy(self.test_counter)
+        bad.name = 'bad'
+
+        with pipeline_manager.publisher() as p:
+            p([self.test_counter, bad])
+
+        # the batch is not handled again, the transformer may have already
+        # accounted for some of its samples
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual([], publisher.samples)
+        self.assertEqual(0, publisher.calls)
+
     def test_none_transformer_pipeline(self):
         self._set_pipeline_cfg('transformers', None)
         pipeline_manager = pipeline.PipelineManager(
@@ -1885,6 +1967,15 @@ class BasePipelineTestCase(base.BaseTestCase):
         expected = []
         self._do_test_arithmetic(expression, scenario, expected)
 
+    def test_arithmetic_transformer_expr_invalid(self):
+        expression = '100.0 * $(memory.usage) /'
+        scenario = [
+            dict(name='memory', volume=1024.0),
+            dict(name='memory.usage', volume=512.0),
+        ]
+        expected = []
+        self._do_test_arithmetic(expression, scenario, expected)
+
     def test_arithmetic_transformer_nan(self):
         expression = 'float(\'nan\') * $(memory.usage) / $(memory)'
         scenario = [
@@ -46,7 +46,7 @@ class TestSample(sample.Sample):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.as_dict() == other.as_dict()
         return False
 
     def __ne__(self, other):
@@ -36,7 +36,7 @@ class NotificationBaseTestCase(base.BaseTestCase):
 
     def test_plugin_info(self):
         plugin = self.FakePlugin(mock.Mock())
-        plugin.to_samples_and_publish = mock.Mock()
+        plugin.to_samples = mock.Mock(return_value=[])
         message = {
             'ctxt': {'user_id': 'fake_user_id',
                      'project_id': 'fake_project_id'},
@@ -57,4 +57,42 @@ class NotificationBaseTestCase(base.BaseTestCase):
             'payload': {'foo': 'bar'},
             'message_id': '3577a84f-29ec-4904-9566-12c52289c2e8'
         }
-        plugin.to_samples_and_publish.assert_called_with(notification)
+        plugin.to_samples.assert_called_with(notification)
+
+    def test_plugin_publishes_batch_once(self):
+        manager = mock.MagicMock()
+        plugin = self.FakePlugin(manager)
+        plugin.process_notification = mock.Mock(
+            side_effect=[['sample1'], Exception('boom'), ['sample2']])
+        message = {'ctxt': {}, 'publisher_id': 'fake.publisher_id',
+                   'event_type': 'fake.event', 'payload': {},
+                   'metadata': {'message_id': 'id', 'timestamp': 'ts'}}
+        plugin.info([message] * 3)
+        self.assertEqual(3, plugin.process_notification.call_count)
+        manager.publisher.assert_called_once_with()
+        p = manager.publisher.return_value.__enter__.return_value
+        p.assert_called_once_with(['sample1', 'sample2'])
+
+    def test_plugin_publish_error_isolated(self):
+        manager = mock.MagicMock()
+        plugin = self.FakePlugin(manager)
+        plugin.process_notification = mock.Mock(
+            side_effect=[['sample1'], ['bad'], ['sample2']])
+        published = []
+
+        def publish(samples):
+            if 'bad' in samples:
+                raise Exception('boom')
+            published.extend(samples)
+        p = manager.publisher.return_value.__enter__.return_value
+        p.side_effect = publish
+        message = {'ctxt': {}, 'publisher_id': 'fake.publisher_id',
+                   'event_type': 'fake.event', 'payload': {},
+                   'metadata': {'message_id': 'id', 'timestamp': 'ts'}}
+        with mock.patch('ceilometer.agent.plugin_base.LOG') as log:
+            plugin.info([message] * 3)
+        # only the samples of the bad notification are dropped
+        self.assertEqual(['sample1', 'sample2'], published)
+        self.assertEqual(4, p.call_count)
+        self.assertEqual(2, log.error.call_count)
+        self.assertEqual(1, log.error.call_args[0][1])
@@ -14,7 +14,9 @@
 # under the License.
 
 import datetime
+import json
 import uuid
+import zlib
 
 import mock
 from oslo_config import fixture as fixture_config
@@ -55,7 +57,7 @@ class TestDispatcherHttp(base.BaseTestCase):
         # The target should be None
         self.assertEqual('', dispatcher.target)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data(self.msg)
 
         # Since the target is not set, no http post should occur, thus the
@@ -66,7 +68,7 @@ class TestDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.target = 'fake'
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(1, post.call_count)
@@ -78,7 +80,7 @@ class TestDispatcherHttp(base.BaseTestCase):
 
         self.assertEqual(True, dispatcher.verify_ssl)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(True, post.call_args[1]['verify'])
@@ -90,7 +92,7 @@ class TestDispatcherHttp(base.BaseTestCase):
 
         self.assertEqual(True, dispatcher.verify_ssl)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(True, post.call_args[1]['verify'])
@@ -102,7 +104,7 @@ class TestDispatcherHttp(base.BaseTestCase):
 
         self.assertEqual(False, dispatcher.verify_ssl)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(False, post.call_args[1]['verify'])
@@ -114,7 +116,7 @@ class TestDispatcherHttp(base.BaseTestCase):
 
         self.assertEqual('/path/to/cert.crt', dispatcher.verify_ssl)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual('/path/to/cert.crt', post.call_args[1]['verify'])
@@ -124,7 +126,7 @@ class TestDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.batch_mode = False
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch('requests.post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data([self.msg, self.msg])
             self.assertEqual(2, post.call_count)
 
@@ -133,10 +135,31 @@ class TestDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.batch_mode = True
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch('requests.post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_metering_data([self.msg, self.msg, self.msg])
             self.assertEqual(1, post.call_count)
 
+    def test_http_dispatcher_compress(self):
+        self.CONF.dispatcher_http.target = 'fake'
+        self.CONF.dispatcher_http.compress = True
+        dispatcher = http.HttpDispatcher(self.CONF)
+
+        with mock.patch.object(requests.Session, 'post') as post:
+            dispatcher.record_metering_data(self.msg)
+
+        kwargs = post.call_args[1]
+        self.assertEqual('gzip', kwargs['headers']['Content-Encoding'])
+        data = zlib.decompress(kwargs['data'], 16 + zlib.MAX_WBITS)
+        self.assertEqual(self.msg, json.loads(data.decode('utf-8')))
+
+    def test_http_dispatcher_pool_size(self):
+        self.CONF.dispatcher_http.target = 'https://example.com'
+        self.CONF.dispatcher_http.pool_size = 3
+        dispatcher = http.HttpDispatcher(self.CONF)
+
+        adapter = dispatcher.session.get_adapter(dispatcher.target)
+        self.assertEqual(3, adapter._pool_maxsize)
+
 
 class TestEventDispatcherHttp(base.BaseTestCase):
     """Test sending events with the http dispatcher"""
@@ -157,7 +180,7 @@ class TestEventDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.event_target = 'fake'
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_events(self.event)
 
         self.assertEqual(1, post.call_count)
@@ -166,7 +189,7 @@ class TestEventDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.event_target = 'fake'
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             response = requests.Response()
             response.status_code = 500
             post.return_value = response
@@ -182,7 +205,7 @@ class TestEventDispatcherHttp(base.BaseTestCase):
         # The target should be None
         self.assertEqual('', dispatcher.event_target)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_events(self.event)
 
         # Since the target is not set, no http post should occur, thus the
@@ -193,7 +216,7 @@ class TestEventDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.event_target = 'fake'
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_events(self.event)
 
         self.assertEqual('fake', post.call_args[0][0])
@@ -205,7 +228,7 @@ class TestEventDispatcherHttp(base.BaseTestCase):
 
         self.assertEqual('/path/to/cert.crt', dispatcher.verify_ssl)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_events(self.event)
 
         self.assertEqual('/path/to/cert.crt', post.call_args[1]['verify'])
@@ -215,7 +238,7 @@ class TestEventDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.batch_mode = False
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch('requests.post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_events([self.event, self.event])
             self.assertEqual(2, post.call_count)
 
@@ -224,6 +247,6 @@ class TestEventDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.batch_mode = True
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch('requests.post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
             dispatcher.record_events([self.event, self.event])
             self.assertEqual(1, post.call_count)
@@ -298,14 +298,14 @@ class TestTraitDefinition(ConverterBase):
     def test_string_fields_config(self):
         cfg = dict(fields='payload.test')
         t = converter.TraitDefinition('test_trait', cfg, self.fake_plugin_mgr)
-        self.assertPathsEqual(t.getter.__self__,
+        self.assertPathsEqual(t.getter.path,
                               jsonpath_rw_ext.parse('payload.test'))
 
     def test_list_fields_config(self):
         cfg = dict(fields=['payload.test', 'payload.other'])
         t = converter.TraitDefinition('test_trait', cfg, self.fake_plugin_mgr)
         self.assertPathsEqual(
-            t.getter.__self__,
+            t.getter.path,
             jsonpath_rw_ext.parse('(payload.test)|(payload.other)'))
 
     def test_invalid_path_config(self):
@@ -439,6 +439,29 @@ class TestEventDefinition(ConverterBase):
                             dtype=dtype)
         self.assertDoesNotHaveTrait(e, 'host')
 
+    def test_to_event_fused_traits(self):
+        traits_cfg = dict(self.traits_cfg)
+        traits_cfg['uuid'] = {'type': 'text',
+                              'fields': ['payload.instance_id',
+                                         'payload.instance_uuid']}
+        traits_cfg['host_copy'] = 'payload.host'
+        traits_cfg['nested'] = 'payload.host.name'
+        cfg = dict(event_type='test.thing', traits=traits_cfg)
+        edef = converter.EventDefinition(cfg, self.fake_plugin_mgr)
+        # every trait is extracted in a single notification walk
+        self.assertTrue(all(fields for trait, fields in
+                            edef.extractor.traits))
+
+        for notification in (self.test_notification1,
+                             self.test_notification2,
+                             self.test_notification3):
+            e = edef.to_event(notification)
+            expected = [t for t in (trait.to_trait(notification)
+                                    for trait in edef.traits.values())
+                        if t is not None]
+            self.assertEqual(sorted((t.name, t.value) for t in expected),
+                             sorted((t.name, t.value) for t in e.traits))
+
     def test_bogus_cfg_no_traits(self):
         bogus = dict(event_type='test.foo')
         self.assertRaises(declarative.DefinitionException,
@@ -708,6 +731,21 @@ class TestNotificationConverter(ConverterBase):
         e = c.to_event(self.test_notification2)
         self.assertIsNotValidEvent(e, self.test_notification2)
 
+    def test_converter_definition_cache(self):
+        c = converter.NotificationEventsConverter(
+            self.valid_event_def1,
+            self.fake_plugin_mgr,
+            add_catchall=True)
+        with mock.patch.object(converter.EventDefinition, 'match_type',
+                               side_effect=[True]) as match_type:
+            c.to_event(self.test_notification1)
+            c.to_event(self.test_notification1)
+        self.assertEqual(1, match_type.call_count)
+
+        c.definitions = c.definitions[1:]
+        e = c.to_event(self.test_notification1)
+        self.assertEqual(1, len(e.traits))
+
     @staticmethod
     def _convert_message(convert, level):
         message = {'priority': level, 'event_type': "foo",
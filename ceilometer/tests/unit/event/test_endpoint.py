@@ -142,6 +142,48 @@ class TestEventEndpoint(tests_base.BaseTestCase):
                              'payload': TEST_NOTICE_PAYLOAD,
                              'metadata': TEST_NOTICE_METADATA}])
 
+    def test_message_to_event_batch_published_once(self):
+        self._setup_endpoint(['test://'])
+        message = {'ctxt': TEST_NOTICE_CTXT,
+                   'publisher_id': 'compute.vagrant-precise',
+                   'event_type': 'compute.instance.create.end',
+                   'payload': TEST_NOTICE_PAYLOAD,
+                   'metadata': TEST_NOTICE_METADATA}
+        ret = self.endpoint.info([message] * 3)
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.assertEqual(1, self.fake_publisher.publish_events.call_count)
+        self.assertEqual(
+            3, len(self.fake_publisher.publish_events.call_args[0][0]))
+
+    def test_bad_notification_in_batch_requeue(self):
+        self._setup_endpoint(['test://'])
+        self.endpoint.event_converter.to_event.side_effect = [
+            mock.MagicMock(event_type='test.test'), Exception]
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        message = {'ctxt': TEST_NOTICE_CTXT,
+                   'publisher_id': 'compute.vagrant-precise',
+                   'event_type': 'compute.instance.create.end',
+                   'payload': TEST_NOTICE_PAYLOAD,
+                   'metadata': TEST_NOTICE_METADATA}
+        ret = self.endpoint.info([message] * 2)
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
+        self.assertFalse(self.fake_publisher.publish_events.called)
+
+    def test_bad_notification_in_batch_ack(self):
+        self._setup_endpoint(['test://'])
+        self.endpoint.event_converter.to_event.side_effect = [
+            Exception, mock.MagicMock(event_type='test.test')]
+        message = {'ctxt': TEST_NOTICE_CTXT,
+                   'publisher_id': 'compute.vagrant-precise',
+                   'event_type': 'compute.instance.create.end',
+                   'payload': TEST_NOTICE_PAYLOAD,
+                   'metadata': TEST_NOTICE_METADATA}
+        ret = self.endpoint.info([message] * 2)
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.assertEqual(
+            1, len(self.fake_publisher.publish_events.call_args[0][0]))
+
     def test_bad_event_non_ack_and_requeue(self):
         self._setup_endpoint(['test://'])
         self.fake_publisher.publish_events.side_effect = Exception
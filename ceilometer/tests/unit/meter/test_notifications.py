@@ -713,3 +713,31 @@ class TestMeterProcessing(test.BaseTestCase):
         self._load_meter_def_file(cfg)
         c = list(self.handler.process_notification(NOTIFICATION))
         self.assertEqual(1, len(c))
+
+    def test_event_type_dispatch(self):
+        definition = dict(type="delta", unit="B", volume="$.payload.volume",
+                          resource_id="$.payload.resource_id",
+                          project_id="$.payload.project_id")
+        cfg = yaml.dump(
+            {'metric': [dict(definition, name="test1",
+                             event_type="test.create"),
+                        dict(definition, name="test2",
+                             event_type=["test.*", "other.create"]),
+                        dict(definition, name="test3",
+                             event_type="other.*"),
+                        dict(definition, name="test4",
+                             event_type="test.c?eate")]})
+        self._load_meter_def_file(cfg)
+        c = list(self.handler.process_notification(NOTIFICATION))
+        self.assertEqual(['test1', 'test2', 'test4'],
+                         sorted(s.name for s in c))
+        with mock.patch.object(self.handler, '_wildcard_definitions',
+                               []):
+            # the matching definitions are remembered
+            c = list(self.handler.process_notification(NOTIFICATION))
+            self.assertEqual(3, len(c))
+        msg = dict(NOTIFICATION, event_type='other.create')
+        c = list(self.handler.process_notification(msg))
+        self.assertEqual(['test2', 'test3'], sorted(s.name for s in c))
+        msg = dict(NOTIFICATION, event_type='unknown.create')
+        self.assertEqual([], list(self.handler.process_notification(msg)))
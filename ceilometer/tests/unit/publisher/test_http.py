@@ -16,11 +16,13 @@
 """
 
 import datetime
+import json
 import mock
 from oslotest import base
 import requests
 from six.moves.urllib import parse as urlparse
 import uuid
+import zlib
 
 from ceilometer.event.storage import models as event
 from ceilometer.publisher import http
@@ -173,3 +175,98 @@ class TestHttpPublisher(base.BaseTestCase):
 
         self.assertEqual(0, m_req.call_count)
         self.assertTrue(thelog.debug.called)
+
+    def test_http_post_batch_size(self):
+        parsed_url = urlparse.urlparse('http://localhost:90/path1?'
+                                       'batch_size=2')
+        publisher = http.HttpPublisher(parsed_url)
+
+        res = mock.Mock()
+        res.status_code = 200
+        with mock.patch.object(requests.Session, 'post',
+                               return_value=res) as m_req:
+            publisher.publish_samples(self.sample_data)
+
+        self.assertEqual(2, m_req.call_count)
+        self.assertEqual(
+            [2, 1], [len(json.loads(c[1]['data'])) for c in
+                     m_req.call_args_list])
+
+    def test_http_post_compress(self):
+        parsed_url = urlparse.urlparse('http://localhost:90/path1?'
+                                       'compress=1')
+        publisher = http.HttpPublisher(parsed_url)
+
+        res = mock.Mock()
+        res.status_code = 200
+        with mock.patch.object(requests.Session, 'post',
+                               return_value=res) as m_req:
+            publisher.publish_samples(self.sample_data)
+
+        self.assertEqual(1, m_req.call_count)
+        kwargs = m_req.call_args[1]
+        self.assertEqual('gzip', kwargs['headers']['Content-Encoding'])
+        data = zlib.decompress(kwargs['data'], 16 + zlib.MAX_WBITS)
+        self.assertEqual(['alpha', 'beta', 'gamma'],
+                         [s['name'] for s in
+                          json.loads(data.decode('utf-8'))])
+
+    def test_http_session_reused(self):
+        parsed_url = urlparse.urlparse('http://localhost:90/path1?'
+                                       'pool_size=4')
+        publisher = http.HttpPublisher(parsed_url)
+        adapter = publisher.session.get_adapter(publisher.target)
+        self.assertEqual(4, adapter._pool_maxsize)
+
+        res = mock.Mock()
+        res.status_code = 200
+        with mock.patch.object(requests.Session, 'post',
+                               return_value=res) as m_req:
+            with mock.patch.object(requests, 'Session') as m_session:
+                publisher.publish_samples(self.sample_data)
+                publisher.publish_events(self.event_data)
+
+        self.assertEqual(2, m_req.call_count)
+        self.assertEqual(0, m_session.call_count)
+
+    def _publish_queued(self, policy, side_effect):
+        parsed_url = urlparse.urlparse('http://localhost:90/path1?'
+                                       'policy=%s' % policy)
+        publisher = http.HttpPublisher(parsed_url)
+        with mock.patch.object(requests.Session, 'post',
+                               side_effect=side_effect) as m_req:
+            with mock.patch('time.sleep') as m_sleep:
+                publisher.publish_samples(self.sample_data)
+                sender = publisher.sender
+                if sender:
+                    sender.join(5)
+        self.assertIsNone(publisher.sender)
+        self.assertEqual(0, len(publisher.local_queue))
+        return m_req, m_sleep
+
+    def test_http_post_policy_drop(self):
+        m_req, m_sleep = self._publish_queued(
+            'drop', requests.exceptions.ConnectionError)
+        self.assertEqual(1, m_req.call_count)
+        self.assertEqual(0, m_sleep.call_count)
+
+    def test_http_post_policy_queue(self):
+        res = mock.Mock()
+        res.status_code = 200
+        m_req, m_sleep = self._publish_queued(
+            'queue', [requests.exceptions.ConnectionError, res])
+        self.assertEqual(2, m_req.call_count)
+        self.assertEqual(1, m_sleep.call_count)
+
+    @mock.patch('ceilometer.utils.spawn_thread')
+    def test_http_post_policy_queue_length(self, m_spawn):
+        parsed_url = urlparse.urlparse('http://localhost:90/path1?'
+                                       'policy=queue&max_queue_length=2')
+        publisher = http.HttpPublisher(parsed_url)
+        for s in self.sample_data:
+            publisher.publish_samples([s])
+
+        self.assertEqual(1, m_spawn.call_count)
+        self.assertEqual(['beta', 'gamma'],
+                         [json.loads(content)[0]['name']
+                          for content, count in publisher.local_queue])
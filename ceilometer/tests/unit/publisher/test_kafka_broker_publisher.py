@@ -15,6 +15,7 @@
 """Tests for ceilometer/publisher/kafka_broker.py
 """
 import datetime
+import json
 import uuid
 
 import mock
@@ -27,9 +28,51 @@ from ceilometer import sample
 from ceilometer.tests import base as tests_base
 
 
+class FakeFuture(object):
+    def __init__(self):
+        self.exception = None
+        self.is_done = False
+
+    def succeeded(self):
+        return self.is_done and self.exception is None
+
+
+class FakeProducer(object):
+    """Local stand-in for a Kafka broker and the producer sending to it.
+
+    The records are delivered, or fail to, when the producer is flushed.
+
+    :param fail: whether the records fail to be delivered, or a function
+                 telling whether a record does.
+    """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.records = []
+        self.pending = []
+
+    def send(self, topic, value):
+        future = FakeFuture()
+        self.pending.append((topic, value, future))
+        return future
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for topic, value, future in pending:
+            value = json.loads(value.decode())
+            future.is_done = True
+            if self.fail is True or (callable(self.fail) and
+                                     self.fail(value)):
+                future.exception = Exception('delivery failed')
+            else:
+                self.records.append((topic, value))
+
+
 @mock.patch('ceilometer.publisher.kafka_broker.LOG', mock.Mock())
-@mock.patch('ceilometer.publisher.kafka_broker.kafka.KafkaClient',
+@mock.patch('ceilometer.publisher.kafka_broker.kafka.KafkaProducer',
             mock.Mock())
+# NOTE: retry immediately instead of backing off
+@mock.patch('ceilometer.publisher.messaging.MAX_RETRY_DELAY', 0)
 class TestKafkaPublisher(tests_base.BaseTestCase):
     test_event_data = [
         event.Event(message_id=uuid.uuid4(),
@@ -103,7 +146,7 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
             publisher.publish_samples(self.test_data)
-            self.assertEqual(5, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(5, fake_producer.send.call_count)
             self.assertEqual(0, len(publisher.local_queue))
 
     def test_publish_without_options(self):
@@ -112,7 +155,7 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
             publisher.publish_samples(self.test_data)
-            self.assertEqual(5, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(5, fake_producer.send.call_count)
             self.assertEqual(0, len(publisher.local_queue))
 
     def test_publish_to_host_without_policy(self):
@@ -129,11 +172,11 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
             'kafka://127.0.0.1:9092?topic=ceilometer&policy=default'))
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
-            fake_producer.send_messages.side_effect = TypeError
+            fake_producer.send.side_effect = TypeError
             self.assertRaises(msg_publisher.DeliveryFailure,
                               publisher.publish_samples,
                               self.test_data)
-            self.assertEqual(100, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(100, fake_producer.send.call_count)
             self.assertEqual(0, len(publisher.local_queue))
 
     def test_publish_to_host_with_drop_policy(self):
@@ -141,9 +184,9 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
             'kafka://127.0.0.1:9092?topic=ceilometer&policy=drop'))
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
-            fake_producer.send_messages.side_effect = Exception("test")
+            fake_producer.send.side_effect = Exception("test")
             publisher.publish_samples(self.test_data)
-            self.assertEqual(1, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(1, fake_producer.send.call_count)
             self.assertEqual(0, len(publisher.local_queue))
 
     def test_publish_to_host_with_queue_policy(self):
@@ -151,9 +194,9 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
             'kafka://127.0.0.1:9092?topic=ceilometer&policy=queue'))
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
-            fake_producer.send_messages.side_effect = Exception("test")
+            fake_producer.send.side_effect = Exception("test")
             publisher.publish_samples(self.test_data)
-            self.assertEqual(1, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(1, fake_producer.send.call_count)
             self.assertEqual(1, len(publisher.local_queue))
 
     def test_publish_to_down_host_with_default_queue_size(self):
@@ -161,7 +204,7 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
             'kafka://127.0.0.1:9092?topic=ceilometer&policy=queue'))
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
-            fake_producer.send_messages.side_effect = Exception("test")
+            fake_producer.send.side_effect = Exception("test")
 
             for i in range(0, 2000):
                 for s in self.test_data:
@@ -179,7 +222,7 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
             'kafka://127.0.0.1:9092?topic=ceilometer&policy=queue'))
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
-            fake_producer.send_messages.side_effect = Exception("test")
+            fake_producer.send.side_effect = Exception("test")
             for i in range(0, 16):
                 for s in self.test_data:
                     s.name = 'test-%d' % i
@@ -187,7 +230,7 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
 
             self.assertEqual(16, len(publisher.local_queue))
 
-            fake_producer.send_messages.side_effect = None
+            fake_producer.send.side_effect = None
             for s in self.test_data:
                 s.name = 'test-%d' % 16
             publisher.publish_samples(self.test_data)
@@ -199,12 +242,107 @@ class TestKafkaPublisher(tests_base.BaseTestCase):
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
             publisher.publish_events(self.test_event_data)
-            self.assertEqual(5, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(5, fake_producer.send.call_count)
 
         with mock.patch.object(publisher, '_producer') as fake_producer:
-            fake_producer.send_messages.side_effect = Exception("test")
+            fake_producer.send.side_effect = Exception("test")
             self.assertRaises(msg_publisher.DeliveryFailure,
                               publisher.publish_events,
                               self.test_event_data)
-            self.assertEqual(100, len(fake_producer.send_messages.mock_calls))
+            self.assertEqual(100, fake_producer.send.call_count)
             self.assertEqual(0, len(publisher.local_queue))
+
+    def test_publish_producer_options(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer&linger_ms=20'
+            '&batch_size=65536&compression=gzip'))
+
+        with mock.patch('kafka.KafkaProducer') as producer:
+            publisher.publish_samples(self.test_data)
+        producer.assert_called_once_with(bootstrap_servers='127.0.0.1:9092',
+                                         linger_ms=20, batch_size=65536,
+                                         compression_type='gzip')
+
+    def test_publish_fake_broker(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer'))
+        publisher._producer = FakeProducer()
+
+        publisher.publish_samples(self.test_data)
+        self.assertEqual(5, len(publisher._producer.records))
+        self.assertEqual(
+            [s.name for s in self.test_data],
+            [value['counter_name']
+             for topic, value in publisher._producer.records])
+
+    def test_publish_envelope(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer&envelope=1'))
+        publisher._producer = FakeProducer()
+
+        publisher.publish_samples(self.test_data)
+        self.assertEqual(1, len(publisher._producer.records))
+        topic, value = publisher._producer.records[0]
+        self.assertEqual('ceilometer', topic)
+        self.assertEqual(1, value['envelope'])
+        self.assertEqual([s.name for s in self.test_data],
+                         [m['counter_name'] for m in value['messages']])
+
+    def test_publish_delivery_failure_with_queue_policy(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer&policy=queue'))
+        publisher._producer = FakeProducer(fail=True)
+
+        publisher.publish_samples(self.test_data)
+        self.assertEqual(1, len(publisher.local_queue))
+
+        publisher._producer.fail = False
+        publisher.publish_samples(self.test_data)
+        self.assertEqual(0, len(publisher.local_queue))
+        self.assertEqual(10, len(publisher._producer.records))
+
+    def test_publish_partial_delivery_failure_with_queue_policy(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer&policy=queue'))
+        publisher._producer = FakeProducer(
+            fail=lambda value: value['counter_name'] == 'test2')
+
+        publisher.publish_samples(self.test_data)
+        self.assertEqual(3, len(publisher._producer.records))
+        self.assertEqual(1, len(publisher.local_queue))
+        self.assertEqual(['test2', 'test2'],
+                         [m['counter_name']
+                          for m in publisher.local_queue[0][1]])
+        self.assertEqual(2, publisher.queue_samples)
+
+        publisher._producer.fail = False
+        publisher.publish_samples([])
+        self.assertEqual(0, len(publisher.local_queue))
+        self.assertEqual(
+            sorted(s.name for s in self.test_data),
+            sorted(value['counter_name']
+                   for topic, value in publisher._producer.records))
+
+    def test_publish_partial_delivery_failure_with_default_policy(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer&max_retry=2'))
+        failures = ['test3']
+        publisher._producer = FakeProducer(
+            fail=lambda value: (value['counter_name'] in failures and
+                                not failures.pop()))
+
+        publisher.publish_samples(self.test_data)
+        self.assertEqual(
+            [s.name for s in self.test_data if s.name != 'test3'] +
+            ['test3'],
+            [value['counter_name']
+             for topic, value in publisher._producer.records])
+
+    def test_publish_delivery_failure_with_default_policy(self):
+        publisher = kafka.KafkaBrokerPublisher(netutils.urlsplit(
+            'kafka://127.0.0.1:9092?topic=ceilometer'))
+        publisher._producer = FakeProducer(fail=True)
+
+        self.assertRaises(msg_publisher.DeliveryFailure,
+                          publisher.publish_samples, self.test_data)
+        self.assertEqual(0, len(publisher.local_queue))
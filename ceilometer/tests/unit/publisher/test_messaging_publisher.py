@@ -15,14 +15,18 @@
 """Tests for ceilometer/publisher/messaging.py
 """
 import datetime
+import json
+import os
 import uuid
 
+import fixtures
 import mock
 from oslo_config import fixture as fixture_config
 from oslo_utils import netutils
 import testscenarios.testcase
 
 from ceilometer.event.storage import models as event
+from ceilometer import instrumentation
 from ceilometer.publisher import messaging as msg_publisher
 from ceilometer import sample
 from ceilometer.tests import base as tests_base
@@ -312,3 +316,199 @@ class TestPublisherPolicyReactions(TestPublisher):
             'test-1999',
             publisher.local_queue[1023][1][0][self.attr]
         )
+
+    def _publish_down(self, publisher, count, start=0):
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = msg_publisher.DeliveryFailure()
+            for i in range(start, start + count):
+                for s in self.test_data:
+                    setattr(s, self.attr, 'test-%d' % i)
+                getattr(publisher, self.pub_func)(self.test_data)
+
+    def test_published_with_policy_samples_sized_queue_and_rpc_down(self):
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=queue&max_queue_samples=12' % self.protocol))
+        self._publish_down(publisher, 5)
+
+        self.assertEqual(2, len(publisher.local_queue))
+        self.assertEqual(10, publisher.queue_samples)
+        self.assertEqual(['test-3', 'test-4'],
+                         [data[0][self.attr]
+                          for __, data, __ in publisher.local_queue])
+
+    def test_published_with_policy_bytes_sized_queue_and_rpc_down(self):
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=queue&max_queue_bytes=4096' % self.protocol))
+        self._publish_down(publisher, 20)
+
+        self.assertLessEqual(publisher.queue_bytes, 4096)
+        self.assertEqual(
+            sum(size for __, __, size in publisher.local_queue),
+            publisher.queue_bytes)
+        self.assertEqual('test-19',
+                         publisher.local_queue[-1][1][0][self.attr])
+
+    def test_published_with_policy_queue_spilled_and_replayed(self):
+        spill_dir = self.useFixture(fixtures.TempDir()).path
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=queue&max_queue_length=2&spill_dir=%s'
+            % (self.protocol, spill_dir)))
+        self._publish_down(publisher, 5)
+
+        self.assertEqual(2, len(publisher.local_queue))
+        segments = os.listdir(spill_dir)
+        self.assertEqual(1, len(segments))
+        with open(os.path.join(spill_dir, segments[0])) as f:
+            self.assertEqual(3, len(f.readlines()))
+
+        # the broker fails again while the spilled data is replayed
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = [None, msg_publisher.DeliveryFailure()]
+            for s in self.test_data:
+                setattr(s, self.attr, 'test-5')
+            getattr(publisher, self.pub_func)(self.test_data)
+        self.assertEqual(2, len(publisher.local_queue))
+        # the segment is not rewritten, the replay resumes after test-1
+        with open(os.path.join(spill_dir, segments[0])) as f:
+            lines = f.readlines()
+        self.assertEqual(4, len(lines))
+        self.assertEqual(len(lines[0]), publisher.segment_offset)
+
+        with mock.patch.object(publisher, '_send') as fake_send:
+            for s in self.test_data:
+                setattr(s, self.attr, 'test-6')
+            getattr(publisher, self.pub_func)(self.test_data)
+        self.assertEqual(0, len(publisher.local_queue))
+        self.assertEqual([], os.listdir(spill_dir))
+        self.assertEqual(['test-1', 'test-2', 'test-3', 'test-4', 'test-5',
+                          'test-6'],
+                         [c[1][1][0][self.attr]
+                          for c in fake_send.mock_calls])
+
+    def test_published_with_policy_queue_spill_replay_down(self):
+        spill_dir = self.useFixture(fixtures.TempDir()).path
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=queue&max_queue_length=1&spill_dir=%s'
+            % (self.protocol, spill_dir)))
+        self._publish_down(publisher, 3)
+        self.assertEqual(0, publisher.segment_offset)
+
+        with mock.patch.object(publisher, '_rewrite_segment') as rewrite:
+            self._publish_down(publisher, 2, start=3)
+        self.assertFalse(rewrite.called)
+        self.assertEqual(0, publisher.segment_offset)
+
+        # the head batch is partly delivered, only its remainder is kept
+        def partly_send(topic, data):
+            raise msg_publisher.DeliveryFailure(undelivered=data[1:])
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = partly_send
+            publisher.flush()
+        segment = os.path.join(spill_dir, os.listdir(spill_dir)[0])
+        with open(segment) as f:
+            lines = f.readlines()
+        self.assertEqual(4, len(lines))
+        self.assertEqual(len(self.test_data) - 1,
+                         len(json.loads(lines[0])[1]))
+        self.assertEqual(0, publisher.segment_offset)
+
+    def test_published_with_policy_queue_spill_missing(self):
+        spill_dir = self.useFixture(fixtures.TempDir()).path
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=queue&max_queue_length=1&spill_dir=%s'
+            % (self.protocol, spill_dir)))
+        self._publish_down(publisher, 2)
+        os.remove(publisher.segments[0])
+
+        with mock.patch.object(publisher, '_send') as fake_send:
+            getattr(publisher, self.pub_func)(self.test_data)
+        self.assertEqual([], publisher.segments)
+        self.assertEqual(2, fake_send.call_count)
+        self.assertEqual(0, len(publisher.local_queue))
+
+    def test_published_with_policy_queue_spill_size(self):
+        spill_dir = self.useFixture(fixtures.TempDir()).path
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=queue&max_queue_length=1&spill_dir=%s'
+            '&max_spill_bytes=1' % (self.protocol, spill_dir)))
+        with mock.patch.object(msg_publisher, 'SEGMENT_SIZE', 1):
+            self._publish_down(publisher, 4)
+
+        # the newest segment is kept whatever its size
+        segments = os.listdir(spill_dir)
+        self.assertEqual(1, len(segments))
+        with open(os.path.join(spill_dir, segments[0])) as f:
+            self.assertEqual(
+                'test-2',
+                json.loads(f.read())[1][0][self.attr])
+
+    @mock.patch('random.uniform', side_effect=lambda a, b: b)
+    @mock.patch('time.sleep')
+    def test_published_with_policy_default_backoff(self, sleep, uniform):
+        publisher = self.publisher_cls(
+            netutils.urlsplit('%s://?policy=default' % self.protocol))
+        publisher.max_retry = 8
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = msg_publisher.DeliveryFailure()
+            self.assertRaises(msg_publisher.DeliveryFailure,
+                              getattr(publisher, self.pub_func),
+                              self.test_data)
+            self.assertEqual(8, fake_send.call_count)
+        self.assertEqual([0.1, 0.2, 0.4, 0.8, 1.6, 3.2, 5],
+                         [c[1][0] for c in sleep.mock_calls])
+        self.assertEqual(0, publisher.queue_samples)
+
+    @mock.patch('ceilometer.publisher.messaging.MAX_RETRY_TIME', 0.5)
+    @mock.patch('random.uniform', side_effect=lambda a, b: b)
+    @mock.patch('time.sleep')
+    def test_published_with_policy_default_retry_time(self, sleep, uniform):
+        publisher = self.publisher_cls(
+            netutils.urlsplit('%s://?policy=default' % self.protocol))
+        publisher.max_retry = 100
+        self._publish_down(publisher, 1)
+
+        self.assertEqual([0.1, 0.2, 0.4],
+                         [c[1][0] for c in sleep.mock_calls])
+        self.assertEqual(1, len(publisher.local_queue))
+        with mock.patch.object(publisher, '_send') as fake_send:
+            getattr(publisher, self.pub_func)(self.test_data)
+        self.assertEqual(2, fake_send.call_count)
+        self.assertEqual(0, len(publisher.local_queue))
+
+    def test_published_with_policy_queue_spill_listing(self):
+        spill_dir = self.useFixture(fixtures.TempDir()).path
+        url = netutils.urlsplit('%s://?policy=queue&max_queue_length=1'
+                                '&spill_dir=%s' % (self.protocol, spill_dir))
+        publisher = self.publisher_cls(url)
+        with mock.patch('os.listdir') as listdir:
+            self._publish_down(publisher, 1)
+        self.assertFalse(listdir.called)
+        self._publish_down(publisher, 2, start=1)
+        self.assertEqual(1, len(publisher.segments))
+
+        # the segments of a previous run are replayed
+        publisher = self.publisher_cls(url)
+        self.assertEqual(1, len(publisher.segments))
+        with mock.patch.object(publisher, '_send') as fake_send:
+            publisher.flush()
+        self.assertEqual(['test-0', 'test-1'],
+                         [c[1][1][0][self.attr]
+                          for c in fake_send.mock_calls])
+        self.assertEqual([], publisher.segments)
+        self.assertEqual([], os.listdir(spill_dir))
+
+    def test_published_with_policy_queue_stats(self):
+        stats = instrumentation.STATS
+        stats.enabled = True
+        self.addCleanup(setattr, stats, 'enabled', False)
+        self.addCleanup(stats.reset)
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://foo:bar@localhost?policy=queue&max_queue_length=2'
+            % self.protocol))
+        self._publish_down(publisher, 3)
+
+        name = 'publisher.%s.localhost' % self.publisher_cls.__name__
+        self.assertEqual({'queue_length': 2,
+                          'queue_samples': 10,
+                          'dropped': 5},
+                         stats.snapshot()['components'][name])
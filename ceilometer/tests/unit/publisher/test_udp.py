@@ -179,6 +179,28 @@ class TestUDPPublisher(base.BaseTestCase):
         sent_counters.sort(key=sort_func)
         self.assertEqual(counters, sent_counters)
 
+    def test_published_coalesced(self):
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(
+                netutils.urlsplit('udp://somehost?max_datagram_size=1400'))
+        publisher.publish_samples(self.test_data)
+
+        self.assertEqual(2, len(self.data_sent))
+        sent_counters = []
+        for data, dest in self.data_sent:
+            self.assertLessEqual(len(data), 1400)
+            payload = msgpack.loads(data, encoding="utf-8")
+            self.assertEqual(1, payload['envelope'])
+            sent_counters.extend(payload['samples'])
+            self.assertEqual(('somehost',
+                              self.CONF.collector.udp_port), dest)
+
+        counters = [utils.meter_message_from_counter(d, "not-so-secret")
+                    for d in self.test_data]
+        self.assertEqual(counters, sent_counters)
+
     @staticmethod
     def _raise_ioerror(*args):
         raise IOError
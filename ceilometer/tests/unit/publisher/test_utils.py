@@ -14,6 +14,7 @@
 # under the License.
 """Tests for ceilometer/publisher/utils.py
 """
+import msgpack
 from oslo_serialization import jsonutils
 from oslotest import base
 
@@ -133,3 +134,89 @@ class TestSignature(base.BaseTestCase):
     def test_verify_no_secret(self):
         data = {'a': 'A', 'b': 'B'}
         self.assertTrue(utils.verify_signature(data, ''))
+
+    def test_verify_signatures(self):
+        messages = []
+        for version in (1, 2):
+            data = {'a': 'A', 'resource_metadata': {'b': version}}
+            data['message_signature'] = utils.compute_signature(
+                data, u'not-so-secret', version)
+            messages.append(data)
+        messages.append({'a': 'A', 'message_signature': 'bogus'})
+        self.assertEqual(messages[:2],
+                         utils.verify_signatures(messages, u'not-so-secret'))
+        self.assertEqual(messages,
+                         utils.verify_signatures(iter(messages), ''))
+
+    def test_compute_signature_v2_change_metadata(self):
+        sig1 = utils.compute_signature(
+            {'a': 'A', 'resource_metadata': {'b': 'B'}}, 'not-so-secret', 2)
+        sig2 = utils.compute_signature(
+            {'a': 'A', 'resource_metadata': {'b': 'b'}}, 'not-so-secret', 2)
+        self.assertNotEqual(sig1, sig2)
+        self.assertTrue(sig1.startswith(utils.SIGNATURE_V2_PREFIX))
+        self.assertTrue(len(sig1) <= 64)
+
+    def test_compute_signature_v2_metadata_digest(self):
+        data = {'a': 'A', 'resource_metadata': {'b': 'B', 'c': [1, 2]}}
+        digest = utils.compute_metadata_digest(data['resource_metadata'])
+        self.assertEqual(
+            utils.compute_signature(data, 'not-so-secret', 2),
+            utils.compute_signature(data, 'not-so-secret', 2, digest))
+
+    def test_verify_signature_v2_nested_json(self):
+        data = {'a': 'A',
+                'b': 'B',
+                'resource_metadata': {u'a\xe9\u0437': 'A',
+                                      'c': ('c',),
+                                      'd': {'e': 1.5},
+                                      3: None,
+                                      },
+                }
+        data['message_signature'] = utils.compute_signature(
+            data,
+            'not-so-secret', 2)
+        jsondata = jsonutils.loads(jsonutils.dumps(data))
+        self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+        jsondata['resource_metadata']['d']['e'] = 2.5
+        self.assertFalse(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_verify_signature_v2_downgrade(self):
+        data = {'a': 'A', 'b': 'B'}
+        data['message_signature'] = utils.compute_signature(
+            data, 'not-so-secret', 2)[len(utils.SIGNATURE_V2_PREFIX):]
+        self.assertFalse(utils.verify_signature(data, 'not-so-secret'))
+
+
+class TestUDPEnvelope(base.BaseTestCase):
+    MESSAGES = [{'counter_name': 'test%d' % i, 'counter_volume': i,
+                 'resource_metadata': {'name': 'x' * 50}}
+                for i in range(10)]
+
+    @staticmethod
+    def _unpack(datagrams):
+        messages = []
+        for data, count in datagrams:
+            payload = msgpack.loads(data, encoding='utf-8')
+            unpacked = utils.unpack_udp_payload(payload)
+            assert len(unpacked) == count
+            messages.extend(unpacked)
+        return messages
+
+    def test_pack_udp_datagrams(self):
+        datagrams = utils.pack_udp_datagrams(self.MESSAGES, 300)
+        self.assertEqual(5, len(datagrams))
+        for data, count in datagrams:
+            self.assertLessEqual(len(data), 300)
+        self.assertEqual(self.MESSAGES, self._unpack(datagrams))
+
+    def test_pack_udp_datagrams_single_message(self):
+        datagrams = utils.pack_udp_datagrams(self.MESSAGES, 10)
+        self.assertEqual(10, len(datagrams))
+        self.assertEqual(self.MESSAGES[0],
+                         msgpack.loads(datagrams[0][0], encoding='utf-8'))
+        self.assertEqual(self.MESSAGES, self._unpack(datagrams))
+
+    def test_unpack_udp_payload_unsupported_version(self):
+        self.assertRaises(ValueError, utils.unpack_udp_payload,
+                          {'envelope': 2, 'samples': []})
@@ -46,3 +46,40 @@ class TestDefinition(base.BaseTestCase):
             mock.call("field4.`split(., 1, 1)`"),
             mock.call("(field5.arg)|(field6)"),
         ])
+
+
+class TestCompiledPath(base.BaseTestCase):
+
+    OBJ = {'payload': {'a': 1, 'b': {'c': None}, 'l': [1, 2], 's': 'str'},
+           'a': 3}
+
+    def _check_same_as_jsonpath(self, fields, compiled=True):
+        path = declarative.Definition.JSONPATH_RW_PARSER.parse(fields)
+        getter = declarative.compile_path(path)
+        if not compiled:
+            self.assertIsNone(getter)
+            return
+        definition = declarative.Definition('test', fields, mock.Mock())
+        expected = [(m.value, '.'.join(definition._get_path(m)))
+                    for m in path.find(self.OBJ)]
+        self.assertEqual(expected, [(m.value, m.full_path)
+                                    for m in getter(self.OBJ)])
+
+    def test_simple_paths(self):
+        for fields in ('payload.a', '$.payload.a', 'payload.b.c',
+                       'payload.l', 'payload.missing', 'payload.a.x',
+                       'payload.s.x', 'payload."a"',
+                       '(payload.a)|(a)|(payload.missing)'):
+            self._check_same_as_jsonpath(fields)
+
+    def test_complex_paths(self):
+        for fields in ('payload.l[0]', 'payload.*', 'payload.`len`',
+                       '(payload.a)|(payload.l[0])', '$'):
+            self._check_same_as_jsonpath(fields, compiled=False)
+
+    def test_parse(self):
+        definition = declarative.Definition(
+            'test', ['payload.missing', 'payload.b.c', 'payload.a'],
+            mock.Mock())
+        self.assertEqual(1, definition.parse(self.OBJ))
+        self.assertEqual([None, 1], definition.parse(self.OBJ, True))
@@ -13,6 +13,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+
+import fixtures
 import yaml
 
 from ceilometer import pipeline
@@ -218,6 +221,26 @@ class TestDecoupledPipeline(pipeline_base.BasePipelineTestCase):
         self.assertEqual(['a', 'b'],
                          [getattr(s, 'name') for s in transformed_samples])
 
+    def test_stateful_transformers_sharing_backend(self):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        url = 'file://' + os.path.join(tmpdir, 'state')
+        transformer_cfg = [{'name': 'rate_of_change',
+                            'parameters': {'cache_backend': url}}]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self.pipeline_cfg['sources'][0]['sinks'].append('second_sink')
+        self.pipeline_cfg['sinks'].append({'name': 'second_sink',
+                                           'transformers': transformer_cfg,
+                                           'publishers': ['test://']})
+        pipeline_manager = pipeline.PipelineManager(
+            self.CONF, self.cfg2file(self.pipeline_cfg),
+            self.transformer_manager, worker_id=2)
+        for pipe in pipeline_manager.pipelines:
+            pipe.sink.save_state()
+
+        self.assertEqual(['state.second_sink.0.rate_of_change.2',
+                          'state.test_sink.0.rate_of_change.2'],
+                         sorted(os.listdir(tmpdir)))
+
     def _do_test_rate_of_change_in_boilerplate_pipeline_cfg(self, index,
                                                             meters, units):
         with open('etc/ceilometer/pipeline.yaml') as fap:
@@ -0,0 +1,90 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/instrumentation.py
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from oslo_config import fixture as fixture_config
+from oslotest import base
+
+from ceilometer import instrumentation
+
+
+class TestRecorder(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRecorder, self).setUp()
+        self.recorder = instrumentation.Recorder()
+
+    def test_disabled(self):
+        self.recorder.incr('sink.a', 'samples_in', 2)
+        with self.recorder.timed('sink.a', 'process'):
+            pass
+        self.assertEqual({}, self.recorder.snapshot()['components'])
+
+    def test_counters_and_timers(self):
+        self.recorder.enabled = True
+        self.recorder.incr('sink.a', 'samples_in', 2)
+        self.recorder.incr('sink.a', 'samples_in')
+        self.recorder.record('sink.a', 'process', 0.002)
+        self.recorder.record('sink.a', 'process', 10)
+        with self.recorder.timed('sink.b', 'flush'):
+            pass
+        components = self.recorder.snapshot()['components']
+        self.assertEqual(3, components['sink.a']['samples_in'])
+        process = components['sink.a']['process']
+        self.assertEqual(2, process['count'])
+        self.assertEqual(10, process['max'])
+        self.assertEqual(1, process['buckets']['le_0.005'])
+        self.assertEqual(1, process['buckets']['inf'])
+        self.assertEqual(1, components['sink.b']['flush']['count'])
+
+        self.recorder.reset()
+        self.assertEqual({}, self.recorder.snapshot()['components'])
+
+    def test_gauges(self):
+        self.recorder.gauge('publisher.a', 'queue_length', 3)
+        self.assertEqual({}, self.recorder.snapshot()['components'])
+        self.recorder.enabled = True
+        self.recorder.incr('publisher.a', 'dropped', 2)
+        self.recorder.gauge('publisher.a', 'queue_length', 3)
+        self.recorder.gauge('publisher.a', 'queue_length', 1)
+        self.assertEqual({'publisher.a': {'dropped': 2, 'queue_length': 1}},
+                         self.recorder.snapshot()['components'])
+
+        self.recorder.reset()
+        self.assertEqual({}, self.recorder.snapshot()['components'])
+
+    def test_dump(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'stats.json')
+        self.recorder.enabled = True
+        self.recorder.incr('sink.a', 'samples_in')
+        self.recorder.dump(path)
+        with open(path) as f:
+            self.assertEqual({'sink.a': {'samples_in': 1}},
+                             json.load(f)['components'])
+
+    def test_setup(self):
+        conf = self.useFixture(fixture_config.Config()).conf
+        self.addCleanup(setattr, instrumentation.STATS, 'enabled', False)
+        self.assertIsNone(instrumentation.setup(conf, 0))
+        self.assertFalse(instrumentation.STATS.enabled)
+        conf.set_override('enabled', True, group='pipeline_stats')
+        conf.set_override('stats_file', '/tmp/stats', group='pipeline_stats')
+        self.assertEqual('/tmp/stats.1', instrumentation.setup(conf, 1))
+        self.assertTrue(instrumentation.STATS.enabled)
@@ -14,6 +14,9 @@
 
 import datetime
 
+import mock
+from oslo_utils import timeutils
+
 from ceilometer import sample
 from ceilometer.tests import base
 
@@ -66,3 +69,42 @@ class TestSample(base.BaseTestCase):
         msg['payload']['event_type'] = msg['event_type']
         msg['payload']['host'] = msg['publisher_id']
         self.assertEqual(msg['payload'], s.resource_metadata)
+
+    def test_sample_as_dict(self):
+        s = sample.Sample('cpu', sample.TYPE_GAUGE, '%', 1.0, 'user',
+                          'project', 'res', source='source', id='id')
+        self.assertEqual({'name': 'cpu',
+                          'type': sample.TYPE_GAUGE,
+                          'unit': '%',
+                          'volume': 1.0,
+                          'user_id': 'user',
+                          'project_id': 'project',
+                          'resource_id': 'res',
+                          'timestamp': None,
+                          'resource_metadata': {},
+                          'source': 'source',
+                          'id': 'id'}, s.as_dict())
+        self.assertFalse(hasattr(s, '__dict__'))
+
+    def test_sample_strings_shared(self):
+        samples = [sample.Sample(''.join(['c', 'p', 'u']),
+                                 ''.join(['gau', 'ge']),
+                                 ''.join(['n', 's']), i, 'user', 'project',
+                                 'res')
+                   for i in range(2)]
+        self.assertIs(samples[0].name, samples[1].name)
+        self.assertIs(samples[0].type, samples[1].type)
+        self.assertIs(samples[0].unit, samples[1].unit)
+
+    def test_sample_iso_timestamp_cached(self):
+        s = sample.Sample('cpu', sample.TYPE_GAUGE, '%', 1.0, 'user',
+                          'project', 'res', timestamp='2014-10-29T14:12:15')
+        with mock.patch('oslo_utils.timeutils.parse_isotime',
+                        side_effect=timeutils.parse_isotime) as parse:
+            ts = s.get_iso_timestamp()
+            self.assertIs(ts, s.get_iso_timestamp())
+            self.assertEqual(1, parse.call_count)
+            s.set_timestamp('2014-10-29T14:12:16')
+            self.assertEqual(datetime.datetime(2014, 10, 29, 14, 12, 16),
+                             s.get_iso_timestamp().replace(tzinfo=None))
+            self.assertEqual(2, parse.call_count)
@@ -18,6 +18,7 @@
 import datetime
 import decimal
 
+import mock
 from oslotest import base
 
 from ceilometer import utils
@@ -178,3 +179,66 @@ class TestUtils(base.BaseTestCase):
             assignments[k] -= n
         reassigned = len([c for c in assignments if c != 0])
         self.assertTrue(reassigned < num_keys / num_nodes)
+
+
+class TestLRUCache(base.BaseTestCase):
+
+    def test_get_set(self):
+        cache = utils.LRUCache(10)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIn('a', cache)
+        self.assertEqual({'size': 1, 'hits': 1, 'misses': 1,
+                          'evictions': 0}, cache.stats())
+
+    def test_lru_eviction(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(1, cache.evictions)
+
+    def test_disabled(self):
+        cache = utils.LRUCache(0)
+        cache.set('a', 1)
+        self.assertEqual(0, len(cache))
+        self.assertIsNone(cache.get('a'))
+
+    @mock.patch('time.time')
+    def test_ttl_expiry(self, mock_time):
+        mock_time.return_value = 100
+        cache = utils.LRUCache(10, ttl=60)
+        cache.set('a', 1)
+        mock_time.return_value = 150
+        self.assertEqual(1, cache.get('a'))
+        mock_time.return_value = 161
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, len(cache))
+        self.assertEqual(1, cache.evictions)
+
+    @mock.patch('time.time')
+    def test_expire(self, mock_time):
+        mock_time.return_value = 100
+        cache = utils.LRUCache(10, ttl=60)
+        cache.set('a', 1)
+        mock_time.return_value = 150
+        cache.set('b', 2)
+        mock_time.return_value = 161
+        self.assertEqual(1, cache.expire())
+        self.assertEqual([('b', 2)], cache.items())
+        self.assertEqual(1, cache.evictions)
+
+    def test_pop_clear(self):
+        cache = utils.LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.pop('a'))
+        self.assertIsNone(cache.pop('a'))
+        cache.clear()
+        self.assertEqual(0, len(cache))
@@ -13,12 +13,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 import copy
+import os
+import shutil
+import tempfile
 
+import mock
 from oslo_utils import timeutils
 from oslotest import base
 
 from ceilometer import sample
 from ceilometer.transformer import conversions
+from ceilometer.transformer import state
 
 
 class AggregatorTransformerTestCase(base.BaseTestCase):
@@ -112,3 +117,240 @@ class AggregatorTransformerTestCase(base.BaseTestCase):
             sample.timestamp = timeutils.isotime()
             aggregator.handle_sample(sample)
             self._sample_offset += 1
+
+
+class ScalingTransformerTestCase(base.BaseTestCase):
+    SAMPLE = sample.Sample(
+        name='cpu',
+        type=sample.TYPE_CUMULATIVE,
+        unit='ns',
+        volume=2 * 10 ** 9,
+        user_id='user',
+        project_id='project',
+        resource_id='resource',
+        timestamp='2015-10-29T14:12:15',
+        resource_metadata={'cpu_number': 4, 'flavor': {'vcpus': 2}}
+    )
+
+    def _scale(self, scale):
+        transformer = conversions.ScalingTransformer(target={'scale': scale})
+        return transformer.handle_sample(copy.copy(self.SAMPLE)).volume
+
+    def test_scale_factor(self):
+        self.assertEqual(4 * 10 ** 9, self._scale(2))
+
+    def test_scale_expression(self):
+        self.assertEqual(50.0, self._scale(
+            '100.0 * volume / (10**9 * (resource_metadata.cpu_number or 1))'))
+
+    def test_scale_expression_nested_metadata(self):
+        self.assertEqual(2, self._scale('resource_metadata.flavor.vcpus'))
+        self.assertEqual(2, self._scale(
+            "resource_metadata['flavor']['vcpus']"))
+
+    def test_scale_expression_missing_metadata(self):
+        self.assertEqual(3, self._scale(
+            '(resource_metadata.missing.key or 3)'))
+        self.assertEqual(5, self._scale('(unknown or 5)'))
+
+    def test_scale_expression_constant(self):
+        transformer = conversions.ScalingTransformer(
+            target={'scale': ' 100.0 / 10'})
+        self.assertEqual([], transformer.scale_expr.names)
+        self.assertEqual(10.0, transformer.scale_expr.constant)
+        self.assertEqual(
+            10.0, transformer.handle_sample(copy.copy(self.SAMPLE)).volume)
+
+    def test_scale_expression_binds_referenced_fields(self):
+        transformer = conversions.ScalingTransformer(
+            target={'scale': 'volume * (resource_metadata.cpu_number or 1)'
+                             ' + (other or 0)'})
+        self.assertEqual(['resource_metadata', 'volume'],
+                         transformer.scale_fields)
+
+    def test_scale_expression_error(self):
+        transformer = conversions.ScalingTransformer(
+            target={'scale': 'volume / 0'})
+        self.assertEqual([], transformer.handle_samples([self.SAMPLE]))
+
+    @mock.patch('ceilometer.transformer.conversions.LOG')
+    def test_scale_expression_invalid(self, mylog):
+        transformer = conversions.ScalingTransformer(
+            source={'unit': 'ns'}, target={'scale': 'volume *'})
+        self.assertTrue(transformer.misconfigured)
+        self.assertTrue(mylog.warning.called)
+        other = copy.copy(self.SAMPLE)
+        other.unit = 'B'
+        self.assertEqual([other],
+                         transformer.handle_samples([self.SAMPLE, other]))
+
+
+class RateOfChangeTransformerTestCase(base.BaseTestCase):
+
+    def _make_samples(self, count):
+        return [sample.Sample(
+            name='cpu',
+            type=sample.TYPE_CUMULATIVE,
+            unit='ns',
+            volume=i * 10,
+            user_id='user',
+            project_id='project',
+            resource_id='resource%d' % (i % 2),
+            timestamp='2015-10-29T14:12:%02d' % i,
+            resource_metadata={}) for i in range(count)]
+
+    def test_handle_samples_same_as_handle_sample(self):
+        target = {'name': 'cpu_util', 'unit': '%', 'type': 'gauge',
+                  'scale': '100.0 / 10'}
+        transformer = conversions.RateOfChangeTransformer(target=target)
+        expected = [transformer.handle_sample(s)
+                    for s in self._make_samples(6)]
+        transformer = conversions.RateOfChangeTransformer(target=target)
+        samples = transformer.handle_samples(self._make_samples(6))
+        self.assertEqual(4, len(samples))
+        self.assertEqual([(s.name, s.volume, s.timestamp)
+                          for s in expected if s],
+                         [(s.name, s.volume, s.timestamp) for s in samples])
+
+    def test_handle_samples_drop_failed_sample(self):
+        transformer = conversions.RateOfChangeTransformer()
+        samples = self._make_samples(6)
+        samples[4].timestamp = 'not a timestamp'
+        samples = transformer.handle_samples(samples)
+        self.assertEqual(['resource0', 'resource1', 'resource1'],
+                         [s.resource_id for s in samples])
+
+    @mock.patch('ceilometer.transformer.conversions.LOG')
+    def test_scale_expression_invalid(self, mylog):
+        transformer = conversions.RateOfChangeTransformer(
+            target={'scale': '100.0 /'})
+        self.assertTrue(transformer.misconfigured)
+        self.assertTrue(mylog.warning.called)
+        self.assertEqual([],
+                         transformer.handle_samples(self._make_samples(4)))
+
+    def test_handle_sample_debug_disabled(self):
+        transformer = conversions.RateOfChangeTransformer()
+        with mock.patch.object(conversions, 'LOG') as mock_log:
+            mock_log.isEnabledFor.return_value = False
+            for s in self._make_samples(4):
+                transformer.handle_sample(s)
+        self.assertFalse(mock_log.debug.called)
+
+    @mock.patch('time.time')
+    def test_cache_ttl(self, mock_time):
+        mock_time.return_value = 1000
+        transformer = conversions.RateOfChangeTransformer(cache_ttl=600)
+        samples = self._make_samples(4)
+        transformer.handle_samples(samples[:2])
+        mock_time.return_value = 1500
+        transformer.handle_samples(samples[2:3])
+        mock_time.return_value = 1700
+        transformer.flush()
+        self.assertEqual(1, len(transformer.cache))
+        self.assertEqual([], transformer.handle_samples(samples[3:]))
+        self.assertEqual(1, transformer.cache.stats()['evictions'])
+
+    def test_cache_size(self):
+        transformer = conversions.RateOfChangeTransformer(cache_size=1)
+        samples = transformer.handle_samples(self._make_samples(4))
+        self.assertEqual([], samples)
+        self.assertEqual(1, len(transformer.cache))
+
+    def test_cache_snapshot(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        snapshot = os.path.join(tmpdir, 'state.json')
+        transformer = conversions.RateOfChangeTransformer(
+            cache_backend='file://' + snapshot)
+        samples = self._make_samples(4)
+        transformer.handle_samples(samples[:2])
+        transformer.save_state()
+
+        transformer = conversions.RateOfChangeTransformer(
+            cache_backend='file://' + snapshot)
+        self.assertEqual(2, len(transformer.cache))
+        samples = transformer.handle_samples(samples[2:])
+        self.assertEqual([10.0, 10.0], [s.volume for s in samples])
+
+    def test_cache_snapshot_shared_url(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        url = 'file://' + os.path.join(tmpdir, 'state.json')
+        samples = self._make_samples(4)
+        first = conversions.RateOfChangeTransformer(
+            cache_backend=url, state_namespace='sink_a.0.rate_of_change')
+        first.handle_samples(samples[:2])
+        first.save_state()
+        second = conversions.RateOfChangeTransformer(
+            cache_backend=url, state_namespace='sink_b.0.rate_of_change',
+            worker_id=1)
+        second.handle_samples(samples[:1])
+        second.save_state()
+
+        self.assertEqual(
+            ['state.json.sink_a.0.rate_of_change.0',
+             'state.json.sink_b.0.rate_of_change.1'],
+            sorted(os.listdir(tmpdir)))
+        first = conversions.RateOfChangeTransformer(
+            cache_backend=url, state_namespace='sink_a.0.rate_of_change')
+        self.assertEqual(2, len(first.cache))
+        second = conversions.RateOfChangeTransformer(
+            cache_backend=url, state_namespace='sink_b.0.rate_of_change',
+            worker_id=1)
+        self.assertEqual(1, len(second.cache))
+
+    def test_cache_shared_backend(self):
+        self.addCleanup(state.LocalKeyValueStore.clear)
+        old_owner = conversions.RateOfChangeTransformer(
+            cache_backend='local://')
+        samples = self._make_samples(4)
+        old_owner.handle_samples(samples[:2])
+        old_owner.save_state()
+
+        new_owner = conversions.RateOfChangeTransformer(
+            cache_backend='local://')
+        self.assertEqual(0, len(new_owner.cache))
+        samples = new_owner.handle_samples(samples[2:])
+        self.assertEqual([10.0, 10.0], [s.volume for s in samples])
+
+        # Another kind of transformer doesn't share the state
+        delta = conversions.DeltaTransformer(cache_backend='local://')
+        self.assertIsNone(delta.cache.get('cpuresource0'))
+
+    def test_cache_shared_backend_namespace(self):
+        self.addCleanup(state.LocalKeyValueStore.clear)
+        first = conversions.RateOfChangeTransformer(
+            cache_backend='local://', state_namespace='sink_a.0.rate')
+        first.handle_samples(self._make_samples(2))
+        first.save_state()
+
+        second = conversions.RateOfChangeTransformer(
+            cache_backend='local://', state_namespace='sink_b.0.rate')
+        self.assertIsNone(second.cache.get('cpuresource0'))
+        other_worker = conversions.RateOfChangeTransformer(
+            cache_backend='local://', state_namespace='sink_a.0.rate',
+            worker_id=1)
+        self.assertIsNotNone(other_worker.cache.get('cpuresource0'))
+
+    @mock.patch('ceilometer.transformer.state.LOG')
+    def test_cache_shared_backend_down(self, mylog):
+        client = mock.Mock()
+        client.get.side_effect = Exception('down')
+        backend = state.KeyValueStateBackend('rate', client=client)
+        for key in ('a', 'b', 'c'):
+            self.assertIsNone(backend.get(key))
+        self.assertEqual(1, mylog.exception.call_count)
+        self.assertEqual(2, mylog.debug.call_count)
+
+        client.get.side_effect = None
+        client.get.return_value = None
+        self.assertIsNone(backend.get('d'))
+        self.assertTrue(mylog.info.called)
+        client.get.side_effect = Exception('down again')
+        backend.get('e')
+        self.assertEqual(2, mylog.exception.call_count)
+
+    def test_cache_unknown_backend(self):
+        self.assertRaises(ValueError, conversions.RateOfChangeTransformer,
+                          cache_backend='foo://')
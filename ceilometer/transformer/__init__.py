@@ -14,10 +14,18 @@
 # under the License.
 
 import abc
-import collections
+import ast
+import time
 
+from oslo_log import log
 import six
 
+from ceilometer.i18n import _LE
+from ceilometer.transformer import state
+from ceilometer import utils
+
+LOG = log.getLogger(__name__)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class TransformerBase(object):
@@ -42,6 +50,35 @@ class TransformerBase(object):
         :param sample: A sample.
         """
 
+    def handle_samples(self, samples):
+        """Transform a batch of samples.
+
+        The default implementation hands the samples one by one to
+        handle_sample. Transformers can override it to handle the whole
+        batch at once, they then have to drop the samples they fail on
+        themselves, e.g. with _handle_each, as the whole batch is dropped
+        when it raises.
+
+        :param samples: A list of samples.
+        :return: The list of transformed samples.
+        """
+        return self._handle_each(self.handle_sample, samples)
+
+    def _handle_each(self, handle, samples):
+        """Apply handle to each sample, dropping the ones it fails on."""
+        transformed = []
+        for s in samples:
+            try:
+                s = handle(s)
+            except Exception:
+                LOG.exception(_LE("Transformer %(trans)s: Dropping sample "
+                                  "%(smp)s after error"),
+                              {'trans': self, 'smp': s})
+                continue
+            if s:
+                transformed.append(s)
+        return transformed
+
     @abc.abstractproperty
     def grouping_keys(self):
         """Keys used to group transformer."""
@@ -51,6 +88,9 @@ class TransformerBase(object):
         """Flush samples cached previously."""
         return []
 
+    def save_state(self):
+        """Save the state of a stateful transformer to its backend now."""
+
 
 class Namespace(object):
     """Encapsulates the namespace.
@@ -58,20 +98,132 @@ class Namespace(object):
     Encapsulation is done by wrapping the evaluation of the configured rule.
     This allows nested dicts to be accessed in the attribute style,
     and missing attributes to yield false when used in a boolean expression.
+    Nested dicts are wrapped when they are looked up, not beforehand.
     """
     def __init__(self, seed):
-        self.__dict__ = collections.defaultdict(lambda: Namespace({}))
-        self.__dict__.update(seed)
-        for k, v in six.iteritems(self.__dict__):
-            if isinstance(v, dict):
-                self.__dict__[k] = Namespace(v)
+        self._seed = seed
 
     def __getattr__(self, attr):
-        return self.__dict__[attr]
+        return self[attr]
 
     def __getitem__(self, key):
-        return self.__dict__[key]
+        try:
+            value = self._seed[key]
+        except KeyError:
+            return Namespace({})
+        return Namespace(value) if isinstance(value, dict) else value
 
     def __nonzero__(self):
-        return len(self.__dict__) > 0
+        return len(self._seed) > 0
     __bool__ = __nonzero__
+
+
+class Expression(object):
+    """A configured rule, compiled once and evaluated against many values.
+
+    Only the names referenced by the expression are bound when it is
+    evaluated, the ones missing from the values yielding an empty
+    Namespace. An expression referencing no name is evaluated once.
+
+    :param expr: the Python expression, a SyntaxError is raised if invalid.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, expr):
+        # NOTE: like eval(), ignore the leading spaces and tabs
+        tree = ast.parse(expr.lstrip(' \t'), mode='eval')
+        self.expr = expr
+        self.code = compile(tree, '<expression>', 'eval')
+        self.names = sorted(set(
+            node.id for node in ast.walk(tree)
+            if isinstance(node, ast.Name) and
+            node.id not in ('True', 'False', 'None')))
+        self.constant = self._UNSET
+        if not self.names:
+            try:
+                self.constant = eval(self.code, {}, {})
+            except Exception:
+                # Raised again on each evaluation
+                pass
+
+    def evaluate(self, values):
+        """Evaluate the expression.
+
+        :param values: mapping of the names referenced by the expression to
+                       their values, dicts are accessed in the attribute style.
+        """
+        if self.constant is not self._UNSET:
+            return self.constant
+        ns = {}
+        for name in self.names:
+            value = values.get(name, self._UNSET)
+            if value is self._UNSET:
+                ns[name] = Namespace({})
+            elif isinstance(value, dict):
+                ns[name] = Namespace(value)
+            else:
+                ns[name] = value
+        return eval(self.code, {}, ns)
+
+
+class StateCache(object):
+    """Bounded and expiring store of the state of a stateful transformer.
+
+    Entries are evicted when they are the least recently used one of a full
+    cache, or when they have not been updated for ttl seconds. The entries
+    are also periodically saved to a state backend which can be used to
+    not lose the previous values on restart, or to share them between
+    agents.
+
+    :param size: maximum number of entries, None means unbounded.
+    :param ttl: number of seconds an entry stays without being updated,
+                None means forever.
+    :param backend: a state.StateBackend, in-memory only by default.
+    :param interval: minimum number of seconds between expirations of the
+                     outdated entries and saves to the backend.
+    """
+
+    def __init__(self, size=None, ttl=None, backend=None, interval=60):
+        ttl = float(ttl) if ttl else 0
+        self._cache = utils.LRUCache(int(size) if size else None, ttl)
+        self.backend = backend or state.StateBackend(None, ttl)
+        self.interval = interval
+        self._changed = {}
+        self._last_flush = time.time()
+        for key, value in self.backend.load():
+            self._cache.set(key, value)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __setitem__(self, key, value):
+        self._cache.set(key, value)
+        self._changed[key] = value
+
+    def get(self, key, default=None):
+        value = self._cache.get(key)
+        if value is None:
+            value = self.backend.get(key)
+            if value is None:
+                return default
+            self._cache.set(key, value)
+        return value
+
+    def stats(self):
+        return self._cache.stats()
+
+    def flush(self, force=False):
+        """Expire the outdated entries and save the state if it is time.
+
+        :param force: do it regardless of the time since the last one.
+        """
+        now = time.time()
+        if not force and now - self._last_flush < self.interval:
+            return
+        self._last_flush = now
+        self._cache.expire()
+        LOG.debug('State cache: %(size)d entries, %(evictions)d evictions',
+                  self.stats())
+        changed, self._changed = self._changed, {}
+        self.backend.save(self._cache.items(), list(changed.items()))
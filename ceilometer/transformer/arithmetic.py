@@ -47,15 +47,24 @@ class ArithmeticTransformer(transformer.TransformerBase):
         self.expr_escaped, self.escaped_names = self.parse_expr(self.expr)
         self.required_meters = list(self.escaped_names.values())
         self.misconfigured = len(self.required_meters) == 0
+        if self.misconfigured:
+            LOG.warning(_('Arithmetic transformer must use at least one'
+                        ' meter in expression \'%s\''), self.expr)
+        else:
+            try:
+                self.compiled_expr = transformer.Expression(self.expr_escaped)
+            except SyntaxError as e:
+                LOG.warning(_('%(trans)s: unable to compile expression '
+                              '%(expr)s, no sample is produced: %(exc)s'),
+                            {'trans': type(self).__name__, 'expr': self.expr,
+                             'exc': e})
+                self.misconfigured = True
         if not self.misconfigured:
             self.reference_meter = self.required_meters[0]
             # convert to set for more efficient contains operation
             self.required_meters = set(self.required_meters)
             self.cache = collections.defaultdict(dict)
             self.latest_timestamp = None
-        else:
-            LOG.warning(_('Arithmetic transformer must use at least one'
-                        ' meter in expression \'%s\''), self.expr)
 
     def _update_cache(self, _sample):
         """Update the cache with the latest sample."""
@@ -70,11 +79,10 @@ class ArithmeticTransformer(transformer.TransformerBase):
 
     def _calculate(self, resource_id):
         """Evaluate the expression and return a new sample if successful."""
-        ns_dict = dict((m, s.as_dict()) for m, s
-                       in six.iteritems(self.cache[resource_id]))
-        ns = transformer.Namespace(ns_dict)
+        values = dict((m, s.as_dict()) for m, s
+                      in six.iteritems(self.cache[resource_id]))
         try:
-            new_volume = eval(self.expr_escaped, {}, ns)
+            new_volume = self.compiled_expr.evaluate(values)
             if math.isnan(new_volume):
                 raise ArithmeticError(_('Expression evaluated to '
                                         'a NaN value!'))
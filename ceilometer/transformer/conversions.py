@@ -14,6 +14,7 @@
 # under the License.
 
 import collections
+import logging
 import re
 
 from oslo_log import log
@@ -23,6 +24,7 @@ import six
 from ceilometer.i18n import _, _LW
 from ceilometer import sample
 from ceilometer import transformer
+from ceilometer.transformer import state
 
 LOG = log.getLogger(__name__)
 
@@ -42,39 +44,78 @@ class BaseConversionTransformer(transformer.TransformerBase):
         """
         self.source = source or {}
         self.target = target or {}
+        self._mapped = {}
         super(BaseConversionTransformer, self).__init__(**kwargs)
 
     def _map(self, s, attr):
         """Apply the name or unit mapping if configured."""
+        value = getattr(s, attr)
+        try:
+            return self._mapped[attr, value]
+        except KeyError:
+            pass
         mapped = None
         from_ = self.source.get('map_from')
         to_ = self.target.get('map_to')
         if from_ and to_:
             if from_.get(attr) and to_.get(attr):
                 try:
-                    mapped = re.sub(from_[attr], to_[attr], getattr(s, attr))
+                    mapped = re.sub(from_[attr], to_[attr], value)
                 except Exception:
                     pass
-        return mapped or self.target.get(attr, getattr(s, attr))
+        mapped = mapped or self.target.get(attr, value)
+        # NOTE: the mapping only depends on the name or unit, which come from
+        # a small set, so remember it but don't grow without limit.
+        if len(self._mapped) >= 1024:
+            self._mapped.clear()
+        self._mapped[attr, value] = mapped
+        return mapped
+
+
+# NOTE: the previous sample of resources which are gone is dropped from the
+# cache of the stateful transformers after a day by default.
+DEFAULT_CACHE_TTL = 86400
+
+
+def _get_state_cache(transformer_, size, ttl, backend_url, namespace,
+                     worker_id):
+    # NOTE: the keys only depend on the meter and resource, so the backend
+    # is namespaced by the position of the transformer in its pipeline, or
+    # by transformer type when it is used outside of a pipeline.
+    backend = state.get_backend(backend_url,
+                                namespace or type(transformer_).__name__,
+                                float(ttl) if ttl else 0, worker_id)
+    return transformer.StateCache(size, ttl, backend)
 
 
 class DeltaTransformer(BaseConversionTransformer):
     """Transformer based on the delta of a sample volume."""
 
-    def __init__(self, target=None, growth_only=False, **kwargs):
+    def __init__(self, target=None, growth_only=False, cache_size=None,
+                 cache_ttl=DEFAULT_CACHE_TTL, cache_backend=None,
+                 state_namespace=None, worker_id=0, **kwargs):
         """Initialize transformer with configured parameters.
 
         :param growth_only: capture only positive deltas
+        :param cache_size: maximum number of previous samples kept
+        :param cache_ttl: seconds after which a previous sample is dropped
+        :param cache_backend: URL of the backend the previous samples are
+                              saved to
+        :param state_namespace: namespace of the state in the backend, set
+                                by the pipeline
+        :param worker_id: index of the agent worker, set by the pipeline
         """
         super(DeltaTransformer, self).__init__(target=target, **kwargs)
         self.growth_only = growth_only
-        self.cache = {}
+        self.cache = _get_state_cache(self, cache_size, cache_ttl,
+                                      cache_backend, state_namespace,
+                                      worker_id)
 
     def handle_sample(self, s):
         """Handle a sample, converting if necessary."""
         key = s.name + s.resource_id
         prev = self.cache.get(key)
-        timestamp = timeutils.parse_isotime(s.timestamp)
+        timestamp = s.get_iso_timestamp()
         self.cache[key] = (s.volume, timestamp)
 
         if prev:
@@ -93,12 +134,20 @@ class DeltaTransformer(BaseConversionTransformer):
                 s = None
             else:
                 s = self._convert(s, volume_delta)
-                LOG.debug('Converted to: %s', s)
+                if LOG.isEnabledFor(logging.DEBUG):
+                    LOG.debug('Converted to: %s', s)
         else:
             LOG.warning(_LW('Dropping sample with no predecessor: %s'), (s,))
             s = None
         return s
 
+    def flush(self):
+        self.cache.flush()
+        return []
+
+    def save_state(self):
+        self.cache.flush(force=True)
+
     def _convert(self, s, delta):
         """Transform the appropriate sample fields."""
         return sample.Sample(
@@ -127,24 +176,46 @@ class ScalingTransformer(BaseConversionTransformer):
         """
         super(ScalingTransformer, self).__init__(source=source, target=target,
                                                  **kwargs)
-        self.scale = self.target.get('scale')
+        self.misconfigured = False
+        self._set_scale(self.target.get('scale'))
         LOG.debug('scaling conversion transformer with source:'
                   ' %(source)s target: %(target)s:', {'source': self.source,
                                                       'target': self.target})
 
+    def _set_scale(self, scale):
+        self.scale = scale
+        self.scale_expr = None
+        if isinstance(scale, six.string_types):
+            try:
+                self.scale_expr = transformer.Expression(scale)
+            except SyntaxError as e:
+                # NOTE: like an arithmetic transformer with an invalid
+                # expression, the transformer is considered misconfigured
+                # and drops the samples it would convert.
+                LOG.warning(_LW('%(trans)s: unable to compile scale '
+                                'expression %(expr)s, the samples it '
+                                'applies to are dropped: %(exc)s'),
+                            {'trans': type(self).__name__, 'expr': scale,
+                             'exc': e})
+                self.misconfigured = True
+                return
+            self.scale_fields = [name for name in self.scale_expr.names
+                                 if name in sample.Sample.FIELDS]
+
     def _scale(self, s):
         """Apply the scaling factor.
 
         Either a straight multiplicative factor or else a string to be eval'd.
         """
-        ns = transformer.Namespace(s.as_dict())
-
-        scale = self.scale
-        return ((eval(scale, {}, ns) if isinstance(scale, six.string_types)
-                 else s.volume * scale) if scale else s.volume)
+        if self.scale_expr is not None:
+            return self.scale_expr.evaluate(
+                dict((name, getattr(s, name)) for name in self.scale_fields))
+        return s.volume * self.scale if self.scale else s.volume
 
     def _convert(self, s, growth=1):
         """Transform the appropriate sample fields."""
+        if self.misconfigured:
+            return None
         return sample.Sample(
             name=self._map(s, 'name'),
             unit=self._map(s, 'unit'),
@@ -159,10 +230,13 @@ class ScalingTransformer(BaseConversionTransformer):
 
     def handle_sample(self, s):
         """Handle a sample, converting if necessary."""
-        LOG.debug('handling sample %s', s)
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug('handling sample %s', s)
         if self.source.get('unit', s.unit) == s.unit:
             s = self._convert(s)
-            LOG.debug('converted to: %s', s)
+            if debug:
+                LOG.debug('converted to: %s', s)
         return s
 
 
@@ -173,18 +247,46 @@ class RateOfChangeTransformer(ScalingTransformer):
     and producing a gauge value based on the proportion of some maximum used.
     """
 
-    def __init__(self, **kwargs):
-        """Initialize transformer with configured parameters."""
+    def __init__(self, cache_size=None, cache_ttl=DEFAULT_CACHE_TTL,
+                 cache_backend=None, state_namespace=None, worker_id=0,
+                 **kwargs):
+        """Initialize transformer with configured parameters.
+
+        :param cache_size: maximum number of previous samples kept
+        :param cache_ttl: seconds after which a previous sample is dropped
+        :param cache_backend: URL of the backend the previous samples are
+                              saved to
+        :param state_namespace: namespace of the state in the backend, set
+                                by the pipeline
+        :param worker_id: index of the agent worker, set by the pipeline
+        """
         super(RateOfChangeTransformer, self).__init__(**kwargs)
-        self.cache = {}
-        self.scale = self.scale or '1'
+        self.cache = _get_state_cache(self, cache_size, cache_ttl,
+                                      cache_backend, state_namespace,
+                                      worker_id)
+        self._set_scale(self.scale or '1')
+
+    def flush(self):
+        self.cache.flush()
+        return []
+
+    def save_state(self):
+        self.cache.flush(force=True)
 
     def handle_sample(self, s):
         """Handle a sample, converting if necessary."""
-        LOG.debug('handling sample %s', s)
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug('handling sample %s', s)
+        s = self._handle_rate(s)
+        if s and debug:
+            LOG.debug('converted to: %s', s)
+        return s
+
+    def _handle_rate(self, s):
         key = s.name + s.resource_id
         prev = self.cache.get(key)
-        timestamp = timeutils.parse_isotime(s.timestamp)
+        timestamp = s.get_iso_timestamp()
         self.cache[key] = (s.volume, timestamp)
 
         if prev:
@@ -209,7 +311,6 @@ class RateOfChangeTransformer(ScalingTransformer):
                               if time_delta else 0.0)
 
             s = self._convert(s, rate_of_change)
-            LOG.debug('converted to: %s', s)
         else:
             LOG.warning(_('dropping sample with no predecessor: %s'),
                         (s,))
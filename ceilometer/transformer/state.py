@@ -0,0 +1,222 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Backends persisting the state of stateful transformers."""
+
+import datetime
+import json
+import os
+import threading
+
+from oslo_log import log
+from oslo_utils import netutils
+from oslo_utils import timeutils
+import six
+
+from ceilometer.i18n import _LE, _LI, _LW
+
+LOG = log.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError('%r is not serializable' % value)
+
+
+def _decode(value):
+    if '__datetime__' in value:
+        return timeutils.parse_isotime(value['__datetime__'])
+    return value
+
+
+def dumps(value):
+    return json.dumps(value, default=_encode)
+
+
+def loads(data):
+    if isinstance(data, six.binary_type):
+        data = data.decode('utf-8')
+    return json.loads(data, object_hook=_decode)
+
+
+class StateBackend(object):
+    """In-memory backend, the state is lost when the agent stops.
+
+    :param namespace: prefix isolating the keys of a kind of transformer.
+    :param ttl: number of seconds a saved entry stays valid, 0 means forever.
+    """
+
+    def __init__(self, namespace, ttl=0):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def load(self):
+        """Return the (key, value) pairs to warm the cache up with."""
+        return []
+
+    def get(self, key):
+        """Return the value of a key missing from the cache, or None."""
+
+    def save(self, items, changed):
+        """Save the state.
+
+        :param items: all the (key, value) pairs of the cache.
+        :param changed: the (key, value) pairs changed since the last save.
+        """
+
+
+class FileStateBackend(StateBackend):
+    """Snapshot of the state in a local file, reloaded at startup."""
+
+    def __init__(self, namespace, ttl=0, path=None):
+        super(FileStateBackend, self).__init__(namespace, ttl)
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return loads(f.read())
+        except IOError:
+            # No snapshot yet
+            return []
+        except ValueError:
+            LOG.warning(_LW('Ignoring invalid transformer state snapshot %s'),
+                        self.path)
+            return []
+
+    def save(self, items, changed):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(dumps(items))
+            os.rename(tmp, self.path)
+        except (IOError, OSError, TypeError):
+            LOG.exception(_LE('Unable to save transformer state snapshot %s'),
+                          self.path)
+
+
+class KeyValueStateBackend(StateBackend):
+    """State shared through a redis compatible key-value store.
+
+    Entries missing from the cache are looked up in the store, so that an
+    agent taking over a partition of the workload gets the previous values
+    saved by the agent which owned it before.
+
+    :param client: a client implementing the get, set and pipeline methods
+                   of redis.StrictRedis.
+    """
+
+    def __init__(self, namespace, ttl=0, client=None):
+        super(KeyValueStateBackend, self).__init__(namespace, ttl)
+        self.client = client
+        # NOTE: the store is looked up on every cache miss, so while it is
+        # down the failure is only logged once.
+        self._available = True
+
+    def _key(self, key):
+        return '%s:%s' % (self.namespace, key)
+
+    def get(self, key):
+        try:
+            data = self.client.get(self._key(key))
+        except Exception:
+            if self._available:
+                self._available = False
+                LOG.exception(_LE('Unable to get transformer state %s, '
+                                  'treating it as missing until the store '
+                                  'is back'), key)
+            else:
+                LOG.debug('Unable to get transformer state %s', key)
+            return
+        if not self._available:
+            self._available = True
+            LOG.info(_LI('Transformer state store is back'))
+        if data is not None:
+            return loads(data)
+
+    def save(self, items, changed):
+        if not changed:
+            return
+        try:
+            pipe = self.client.pipeline()
+            for key, value in changed:
+                pipe.set(self._key(key), dumps(value),
+                         ex=int(self.ttl) or None)
+            pipe.execute()
+        except Exception:
+            LOG.exception(_LE('Unable to save transformer state'))
+
+
+class LocalKeyValueStore(object):
+    """In process stand-in for a redis client, shared by its users."""
+
+    _data = {}
+    _lock = threading.Lock()
+
+    class _Pipeline(object):
+        def __init__(self, store):
+            self.store = store
+            self.commands = []
+
+        def set(self, name, value, ex=None):
+            self.commands.append((name, value))
+
+        def execute(self):
+            for name, value in self.commands:
+                self.store.set(name, value)
+            self.commands = []
+
+    def get(self, name):
+        with self._lock:
+            return self._data.get(name)
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = value
+
+    def pipeline(self):
+        return self._Pipeline(self)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._data.clear()
+
+
+def get_backend(url, namespace, ttl=0, worker_id=0):
+    """Return the state backend configured by a URL.
+
+    Supported URLs are memory://, file:///path/to/snapshot,
+    redis://host:port/db and local:// (an in process stand-in for redis).
+
+    The snapshot of a file backend is the path suffixed by the namespace and
+    the worker_id, as it is only read back by the same worker. The keys of
+    the shared backends are prefixed by the namespace only, so that the
+    agent taking over a partition gets them whatever its worker.
+    """
+    if not url:
+        return StateBackend(namespace, ttl)
+    parsed = netutils.urlsplit(url)
+    if parsed.scheme == 'memory':
+        return StateBackend(namespace, ttl)
+    if parsed.scheme == 'file':
+        path = '%s.%s.%s' % (parsed.path, namespace.replace(os.sep, '_'),
+                             worker_id)
+        return FileStateBackend(namespace, ttl, path)
+    if parsed.scheme == 'local':
+        return KeyValueStateBackend(namespace, ttl, LocalKeyValueStore())
+    if parsed.scheme == 'redis':
+        import redis
+        return KeyValueStateBackend(namespace, ttl,
+                                    redis.StrictRedis.from_url(url))
+    raise ValueError('Unknown transformer state backend %s' % url)
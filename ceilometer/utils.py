@@ -20,6 +20,7 @@
 
 import bisect
 import calendar
+import collections
 import copy
 import datetime
 import decimal
@@ -27,6 +28,7 @@ import hashlib
 import struct
 import threading
 import time
+import zlib
 
 from concurrent import futures
 from futurist import periodics
@@ -252,6 +254,99 @@ class HashRing(object):
         return self._ring[self._sorted_keys[pos]]
 
 
+class LRUCache(object):
+    """Thread safe mapping bounded in size and in age of its entries.
+
+    The least recently used entry is evicted when the cache is full, and
+    entries older than ttl seconds are dropped when they are looked up.
+
+    :param maxsize: maximum number of entries, None means unbounded and 0
+                    disables the cache.
+    :param ttl: number of seconds an entry stays valid, <= 0 means forever.
+    """
+
+    def __init__(self, maxsize=None, ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        marker = object()
+        return self.get(key, marker, count=False) is not marker
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            try:
+                value, stamp = self._data.pop(key)
+            except KeyError:
+                if count:
+                    self.misses += 1
+                return default
+            if self.ttl > 0 and time.time() - stamp > self.ttl:
+                self.evictions += 1
+                if count:
+                    self.misses += 1
+                return default
+            self._data[key] = (value, stamp)
+            if count:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time())
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                return self._data.pop(key)[0]
+            except KeyError:
+                return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def expire(self):
+        """Drop all the entries older than ttl seconds.
+
+        Expired entries are otherwise only dropped when looked up again.
+
+        :return: the number of dropped entries.
+        """
+        if self.ttl <= 0:
+            return 0
+        deadline = time.time() - self.ttl
+        with self._lock:
+            expired = [k for k, (v, stamp) in six.iteritems(self._data)
+                       if stamp < deadline]
+            for k in expired:
+                del self._data[k]
+            self.evictions += len(expired)
+        return len(expired)
+
+    def items(self):
+        with self._lock:
+            return [(k, v[0]) for k, v in six.iteritems(self._data)]
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
 def kill_listeners(listeners):
     # NOTE(gordc): correct usage of oslo.messaging listener is to stop(),
     # which stops new messages, and wait(), which processes remaining
@@ -261,6 +356,13 @@ def kill_listeners(listeners):
         listener.wait()
 
 
+def gzip_compress(data):
+    """Compress bytes in the gzip format, e.g. for a Content-Encoding."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
 def delayed(delay, target, *args, **kwargs):
     time.sleep(delay)
     return target(*args, **kwargs)
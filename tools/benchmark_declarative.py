@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool for benchmarking the JSONPath lookups of definitions.
+
+It extracts the JSONPath expressions of the default meter and event
+definitions, then evaluates them against a notification with the
+jsonpath-rw find method and with the compiled getters, and prints the time
+taken.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_declarative.py --notifications 1000
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import timeit
+
+import six
+import yaml
+
+from ceilometer import declarative
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFINITIONS = (
+    os.path.join(ROOT, 'ceilometer', 'meter', 'data', 'meters.yaml'),
+    os.path.join(ROOT, 'etc', 'ceilometer', 'event_definitions.yaml'),
+)
+
+
+def _collect(node, paths):
+    if isinstance(node, dict):
+        for key, value in six.iteritems(node):
+            if key in ('fields', 'volume', 'resource_id', 'project_id',
+                       'user_id', 'timestamp') or key.startswith('$'):
+                _collect_fields(value, paths)
+            else:
+                _collect(value, paths)
+    elif isinstance(node, list):
+        for value in node:
+            _collect(value, paths)
+
+
+def _collect_fields(value, paths):
+    if isinstance(value, list):
+        paths.update(v for v in value if isinstance(v, six.string_types))
+    elif isinstance(value, six.string_types) and (
+            value.startswith('$') or value.startswith('payload')):
+        paths.add(value)
+
+
+def load_paths():
+    paths = set()
+    for filename in DEFINITIONS:
+        with open(filename) as f:
+            _collect(yaml.safe_load(f), paths)
+    return sorted(paths)
+
+
+def make_notification():
+    payload = dict(('key%d' % i, 'value%d' % i) for i in range(50))
+    payload.update(size=1024, id='resource', owner='project',
+                   tenant_id='project', user_id='user',
+                   instance_id='instance', image_meta={'base_image_ref': 'i'})
+    return {'event_type': 'compute.instance.exists',
+            'publisher_id': 'compute.host',
+            'timestamp': '2016-01-01T00:00:00',
+            'payload': payload}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the JSONPath lookups of definitions',
+    )
+    parser.add_argument(
+        '--notifications',
+        default=1000,
+        type=int,
+        help='Number of notifications to look the paths up in.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=5,
+        type=int,
+        help='Number of runs, the best one is reported.',
+    )
+    args = parser.parse_args()
+
+    notification = make_notification()
+    parsed = [declarative.Definition.JSONPATH_RW_PARSER.parse(p)
+              for p in load_paths()]
+    finders = [p.find for p in parsed]
+    getters = [declarative.compile_path(p) or p.find for p in parsed]
+    compiled = len([p for p in parsed if declarative.compile_path(p)])
+    print('%d of %d paths compiled' % (compiled, len(parsed)))
+
+    def run(lookups):
+        for i in range(args.notifications):
+            for lookup in lookups:
+                lookup(notification)
+
+    results = []
+    for name, lookups in (('jsonpath-rw', finders), ('compiled', getters)):
+        best = min(timeit.repeat(lambda: run(lookups),
+                                 repeat=args.repeat, number=1))
+        results.append(best)
+        print('%s: %.3fs' % (name, best))
+    print('speedup: %.1fx' % (results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
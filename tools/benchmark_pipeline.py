@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool for benchmarking the per sample cost of a pipeline.
+
+It pushes samples in batches through a pipeline converting units then
+computing a rate of change, and through the same transformers one sample
+at a time, with debug logging disabled, and prints the time taken per
+sample.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_pipeline.py --samples 100000
+"""
+from __future__ import print_function
+
+import argparse
+import datetime
+import logging
+import tempfile
+import timeit
+
+from oslo_config import cfg
+from stevedore import extension
+import yaml
+
+from ceilometer import pipeline
+from ceilometer import sample
+
+PIPELINE = {
+    'sources': [{'name': 'cpu_source',
+                 'interval': 600,
+                 'meters': ['cpu'],
+                 'sinks': ['cpu_sink']}],
+    'sinks': [{'name': 'cpu_sink',
+               'transformers': [
+                   {'name': 'unit_conversion',
+                    'parameters': {'source': {'unit': 'ns'},
+                                   'target': {'name': 'cpu_ms',
+                                              'unit': 'ms',
+                                              'scale': 'volume / 1000000'}}},
+                   {'name': 'rate_of_change',
+                    'parameters': {'target': {'name': 'cpu_util',
+                                              'unit': '%',
+                                              'type': 'gauge',
+                                              'scale': '100.0 / 1000'}}}],
+               'publishers': ['test://']}],
+}
+
+
+def make_samples(count, resources):
+    start = datetime.datetime(2016, 1, 1)
+    return [sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                          unit='ns', volume=i * 10 ** 9,
+                          user_id='user', project_id='project',
+                          resource_id='resource-%d' % (i % resources),
+                          timestamp=(start + datetime.timedelta(
+                              seconds=i)).isoformat(),
+                          resource_metadata={})
+            for i in range(count)]
+
+
+def setup_pipeline():
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml',
+                                     delete=False) as f:
+        yaml.safe_dump(PIPELINE, f)
+    return pipeline.PipelineManager(
+        cfg.CONF, f.name,
+        extension.ExtensionManager('ceilometer.transformer'))
+
+
+def run_batches(samples, batch_size):
+    manager = setup_pipeline()
+    for i in range(0, len(samples), batch_size):
+        with manager.publisher() as p:
+            p(samples[i:i + batch_size])
+
+
+def run_each(samples):
+    transformers = setup_pipeline().pipelines[0].sink.transformers
+    for s in samples:
+        for transformer in transformers:
+            s = transformer.handle_sample(s)
+            if s is None:
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the per sample cost of a pipeline',
+    )
+    parser.add_argument(
+        '--samples',
+        default=100000,
+        type=int,
+        help='Number of samples pushed through the pipeline.',
+    )
+    parser.add_argument(
+        '--resources',
+        default=1000,
+        type=int,
+        help='Number of resources the samples are spread over.',
+    )
+    parser.add_argument(
+        '--batch-size',
+        default=100,
+        type=int,
+        help='Number of samples published at once.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        type=int,
+        help='Number of runs, the best one is reported.',
+    )
+    args = parser.parse_args()
+    cfg.CONF([], project='ceilometer')
+    logging.basicConfig(level=logging.ERROR)
+
+    samples = make_samples(args.samples, args.resources)
+    for name, run in (('batches', lambda: run_batches(samples,
+                                                      args.batch_size)),
+                      ('one by one', lambda: run_each(samples))):
+        best = min(timeit.repeat(run, repeat=args.repeat, number=1))
+        print('%s: %.3fs, %.2fus per sample' % (
+            name, best, best * 10 ** 6 / args.samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool for benchmarking the signature of metering messages.
+
+It signs then verifies a batch of samples sharing their resource metadata
+with each signature version and prints the time taken.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_signature.py --samples 1000 --metadata-keys 50
+"""
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from oslo_config import cfg
+
+from ceilometer.publisher import utils
+from ceilometer import sample
+
+SECRET = 'not-so-secret'
+
+
+def make_samples(count, metadata_keys):
+    metadata = dict(('key%d' % i, {'value': 'value%d' % i, 'list': [i, i]})
+                    for i in range(metadata_keys))
+    return [sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                          unit='ns', volume=i, user_id='user',
+                          project_id='project', resource_id='resource',
+                          timestamp='2016-01-01T00:00:00',
+                          resource_metadata=metadata)
+            for i in range(count)]
+
+
+def sign_and_verify(samples, version, share_digests):
+    metadata_digests = {} if share_digests else None
+    for s in samples:
+        msg = utils.meter_message_from_counter(
+            s, SECRET, version, metadata_digests=metadata_digests)
+        assert utils.verify_signature(msg, SECRET)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the signature of metering messages',
+    )
+    parser.add_argument(
+        '--samples',
+        default=1000,
+        type=int,
+        help='Number of samples in the batch.',
+    )
+    parser.add_argument(
+        '--metadata-keys',
+        default=50,
+        type=int,
+        help='Number of keys in the resource metadata.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=5,
+        type=int,
+        help='Number of runs, the best one is reported.',
+    )
+    args = parser.parse_args()
+    cfg.CONF([], project='ceilometer')
+
+    samples = make_samples(args.samples, args.metadata_keys)
+    results = []
+    for version, share_digests in ((1, False), (2, False), (2, True)):
+        best = min(timeit.repeat(
+            lambda: sign_and_verify(samples, version, share_digests),
+            repeat=args.repeat, number=1))
+        results.append(best)
+        print('version %d%s: %.3fs' % (
+            version, ' (shared metadata digest)' if share_digests else '',
+            best))
+    print('speedup: %.1fx, %.1fx with shared metadata digest' % (
+        results[0] / results[1], results[0] / results[2]))
+
+
+if __name__ == '__main__':
+    main()